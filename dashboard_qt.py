@@ -1,37 +1,105 @@
 import sys
 import cv2
+import math
 import os
-import shutil
-import csv
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from threading import Thread
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog,
-    QLineEdit, QGridLayout, QGroupBox, QSizePolicy, QMessageBox
+    QLineEdit, QGridLayout, QGroupBox, QSizePolicy, QMessageBox, QInputDialog, QScrollArea
 )
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import QTimer, Qt
-from src.vision_vehicular import model, vehicle_classes
+from PyQt5.QtCore import QTimer, Qt, QEvent, pyqtSignal
+from src.vision_vehicular import obtener_modelo, ids_vehiculo
+from src.detecciones import Detecciones
 from src.prediccion_AI import TrafficPredictor
-from threading import Thread, Lock
-import time
+from src.aprendizaje import crear_aprendizaje
+from src.inferencia_lotes import ServicioInferencia
+from src.cascada import crear_cascada
+from src.planificador import clave_acceso, crear_planificador
+from src.pipeline_video import PipelineVideo
+from src.procesos_camara import ALTO_ORIGINAL, ANCHO_ORIGINAL, ProcesoCamara, componer_vista
+from src.movimiento import crear_filtro
+from src.roi import RegionInteres, cargar_rois, guardar_roi
+from src.seguimiento import (
+    ContadorLinea, Seguidor, cargar_lineas, guardar_linea
+)
+from src.configuracion import cargar_configuracion
+from src import metricas
+from src.almacenamiento import AlmacenConteos
 
 
 
 DIRECCIONES = ["Norte", "Sur", "Este", "Oeste"]
+MAX_ESPERA_LOTE = 0.03  # Segundos máximos para completar un lote de inferencia
+ANCHO_VISTA, ALTO_VISTA = 600, 340  # Tamaño máximo de la imagen mostrada por vista
+# Posición de cada acceso en la rejilla 2x2 de su intersección
+POSICIONES = {"Norte": (0, 0), "Este": (0, 1), "Oeste": (1, 0), "Sur": (1, 1)}
+TODAS_INTERSECCIONES = "(Todas)"  # Exporta todas las intersecciones, con la columna interseccion
+PERIODO_VIGILANCIA = 0.2  # Segundos entre comprobaciones de un proceso de cámara que no se muestra
+ESTILO_VISTA = "background-color: #181A1B; border: 2px solid #444; border-radius: 10px; min-height: {alto}px;"
+VENTANAS_EXPORTACION = {
+    "Última hora": timedelta(hours=1),
+    "Últimas 24 horas": timedelta(days=1),
+    "Últimos 7 días": timedelta(days=7),
+    "Últimos 30 días": timedelta(days=30),
+    "Todo": None,
+}
+CONFIG = cargar_configuracion()
 
 class VideoView(QWidget):
-    def __init__(self, direccion):
+    """
+    Vista de un acceso. No tiene temporizador propio: el tablero la refresca
+    con su reloj compartido (`next_frame`) y decide si está en pantalla
+    (`visible`). En miniatura la imagen se dibuja reducida y a baja frecuencia
+    hasta que se le da el foco con un clic.
+
+    `clave` identifica el acceso ante el servicio de inferencia, el
+    planificador y las métricas ("interseccion/Direccion" con varias
+    intersecciones); por defecto es la dirección.
+    """
+
+    def __init__(self, direccion, servicio_inferencia=None, obtener_interseccion=None, planificador=None,
+                 clave=None, num_camaras=4, al_enfocar=None):
         super().__init__()
         self.direccion = direccion
-        self.cap = None
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.next_frame)
+        self.clave = clave or direccion
+        self.servicio_inferencia = servicio_inferencia
+        self.planificador = planificador
+        self.obtener_interseccion = obtener_interseccion or (lambda: "sin_nombre")
+        self.num_camaras = num_camaras
+        self.al_enfocar = al_enfocar
         self.frame_num = 0
-
-        # --- Hilos ---
-        self.running = False
-        self.frame_for_display = None
-        self.lock = Lock()
+        # --- Refresco: tamaño de la imagen y frecuencia según si es miniatura ---
+        self.miniatura = False
+        self.tamano_render = (ANCHO_VISTA, ALTO_VISTA)
+        self.periodo_miniatura = CONFIG['tablero']['periodo_miniatura_ms'] / 1000
+        self.t_render = 0.0
+        self.t_mostrado = 0.0
+        self.t_vigilado = 0.0
+
+        # --- Pipeline captura -> inferencia -> render ---
+        self.pipeline = None
+        self.count = 0
+        self.inferidos_proceso = 0
+        self.secuencia_mostrada = 0
+        self.visible = False
+        # --- Pre-filtro de movimiento: reutiliza el último resultado si la escena no cambia ---
+        self.filtro_movimiento = crear_filtro(direccion, CONFIG['movimiento'])
+        self.ultimo_resultado = None
+        # --- ROI del acceso: se infiere solo sobre su recorte ---
+        self.roi = None
+        self.editando_roi = False
+        self.puntos_roi = []
+        self.tamano_frame = None
+        # --- Seguimiento y línea de detención: flujo real de vehículos que cruzan ---
+        self.linea = None
+        self.seguidor = None
+        self.pistas = None
+        self.editando_linea = False
+        self.puntos_linea = []
+        self.cruces_reportados = 0
 
         # Layout principal de la vista
         layout = QVBoxLayout()
@@ -62,9 +130,7 @@ class VideoView(QWidget):
         # Video label
         self.label = QLabel(f"{self.direccion}\n(Sin fuente)")
         self.label.setAlignment(Qt.AlignCenter)
-        self.label.setStyleSheet(
-            "background-color: #181A1B; border: 2px solid #444; border-radius: 10px; min-height: 160px;"   
-        )
+        self.label.setStyleSheet(ESTILO_VISTA.format(alto=160))
 
         container_layout.addLayout(top_row)
         container_layout.addWidget(self.label)
@@ -89,6 +155,23 @@ class VideoView(QWidget):
         self.start_btn.clicked.connect(self.start_video)
         input_btn_layout.addWidget(self.start_btn)
 
+        # Botón editar ROI: clic izquierdo añade vértices, clic derecho guarda
+        self.roi_btn = QPushButton("⬠")
+        self.roi_btn.setFixedSize(28, 28)
+        self.roi_btn.setCheckable(True)
+        self.roi_btn.setToolTip("Definir ROI de carriles (clic izq.: vértice, clic der.: guardar)")
+        self.roi_btn.toggled.connect(self.toggle_roi_edit)
+        input_btn_layout.addWidget(self.roi_btn)
+
+        # Botón línea de detención: dos clics la definen, clic derecho la borra
+        self.linea_btn = QPushButton("━")
+        self.linea_btn.setFixedSize(28, 28)
+        self.linea_btn.setCheckable(True)
+        self.linea_btn.setToolTip("Definir línea de conteo (dos clics izq.; clic der.: borrar)")
+        self.linea_btn.toggled.connect(self.toggle_linea_edit)
+        input_btn_layout.addWidget(self.linea_btn)
+        self.label.installEventFilter(self)
+
         layout.addLayout(input_btn_layout)
         self.setLayout(layout)
 
@@ -104,68 +187,338 @@ class VideoView(QWidget):
             self.label.setText(f"{self.direccion}\n(Sin fuente)")
             return
         if source.lower().endswith(('.jpg', '.png')):
-            self.cap = None
             img = cv2.imread(source)
             if img is not None:
                 self.show_frame(img)
         else:
-            self.cap = cv2.VideoCapture(source if not source.isdigit() else int(source))
-            self.running = True
-            self.proc_thread = Thread(target=self.process_frames, daemon=True)
-            self.proc_thread.start()
-            self.timer.start(40)  # Solo para visualización
-
-    def process_frames(self):
-        while self.running and self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-            processed_frame = self.detect_vehicles(frame)
-            with self.lock:
-                self.frame_for_display = processed_frame.copy()
-            time.sleep(0.01)  # Pequeña pausa para no saturar CPU
-
-    def next_frame(self):
-        with self.lock:
-            frame = self.frame_for_display.copy() if self.frame_for_display is not None else None
-        if frame is not None:
-            self.show_frame(frame)
+            self.stop_video()
+            self.ultimo_resultado = None
+            self.roi = cargar_rois(self.obtener_interseccion(), CONFIG['roi']['archivo']).get(self.direccion)
+            self.set_linea(cargar_lineas(self.obtener_interseccion(),
+                                         CONFIG['seguimiento']['archivo_lineas']).get(self.direccion))
+            if self.filtro_movimiento is not None:
+                self.filtro_movimiento.reiniciar()
+            self.secuencia_mostrada = 0
+            fuente = source if not source.isdigit() else int(source)
+            config_procesos = CONFIG['procesos']
+            if config_procesos['activo']:
+                # Captura e inferencia en un proceso propio; aquí solo se muestra.
+                # Sin hilos_torch configurados se reparten los núcleos entre las cámaras
+                self.pipeline = ProcesoCamara(
+                    fuente, self.direccion, CONFIG, self.roi, self.linea, ANCHO_VISTA, ALTO_VISTA,
+                    config_procesos['ranuras'], config_procesos['max_detecciones'],
+                    config_procesos['max_reinicios'], config_procesos['latido_max'],
+                    config_procesos['hilos_torch'] or max(1, (os.cpu_count() or 1) // self.num_camaras))
+                self.pipeline.iniciar()
+                return
+            self.pipeline = PipelineVideo(
+                fuente, self.detect_vehicles, self.render_frame,
+                debe_renderizar=self.debe_renderizar, nombre=self.clave
+            )
+            try:
+                self.pipeline.iniciar()
+            except IOError:
+                self.pipeline = None
+                self.label.setText(f"{self.direccion}\n(Fuente no disponible)")
+                return
+            if self.servicio_inferencia is not None:
+                self.servicio_inferencia.registrar(self.clave)
+
+    def showEvent(self, event):
+        self.visible = True
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.visible = False
+        super().hideEvent(event)
+
+    def fijar_miniatura(self, miniatura):
+        """En miniatura la imagen se dibuja a `escala_miniatura` y como mucho una vez por `periodo_miniatura_ms`"""
+        self.miniatura = miniatura
+        escala = CONFIG['tablero']['escala_miniatura'] if miniatura else 1.0
+        self.tamano_render = (int(ANCHO_VISTA * escala), int(ALTO_VISTA * escala))
+        self.label.setStyleSheet(ESTILO_VISTA.format(alto=min(160, self.tamano_render[1])))
+        self.t_render = self.t_mostrado = 0.0
+
+    def debe_renderizar(self):
+        """Hilo de render: fuera de pantalla no se dibuja, en miniatura solo al ritmo de su refresco"""
+        if not self.visible:
+            return False
+        if not self.miniatura:
+            return True
+        ahora = time.monotonic()
+        if ahora - self.t_render < self.periodo_miniatura:
+            return False
+        self.t_render = ahora
+        return True
+
+    def next_frame(self, ahora=None):
+        """
+        Tic del reloj compartido: muestra la última imagen del render (ya
+        reducida y en RGB) si la vista está en pantalla, le toca y es nueva.
+        """
+        if self.pipeline is None:
+            return
+        ahora = time.monotonic() if ahora is None else ahora
+        if isinstance(self.pipeline, ProcesoCamara):
+            # Sin imagen que mostrar en este tic basta vigilar el trabajador de vez en cuando
+            if (not self.visible or self.miniatura) and ahora - self.t_vigilado < PERIODO_VIGILANCIA:
+                return
+            self.t_vigilado = ahora
+            if not self.vigilar_proceso():
+                return
+        if not self.visible or (self.miniatura and ahora - self.t_mostrado < self.periodo_miniatura):
+            return
+        t0 = time.perf_counter()
+        with self.pipeline.salida.leer() as (imagen, secuencia):
+            # Tiempo que la GUI espera al render para tomar el buffer frontal
+            metricas.observar('espera_buffer', time.perf_counter() - t0, self.clave)
+            if imagen is None or secuencia == self.secuencia_mostrada:
+                return
+            with metricas.etapa('mostrar', self.clave):
+                h, w, ch = imagen.shape
+                qt_image = QImage(imagen.data, w, h, ch * w, QImage.Format_RGB888)
+                # fromImage copia los píxeles: después el buffer puede reutilizarse
+                pixmap = QPixmap.fromImage(qt_image)
+        self.secuencia_mostrada = secuencia
+        self.t_mostrado = ahora
+        with metricas.etapa('mostrar', self.clave):
+            self.label.setPixmap(pixmap)
+
+    def vigilar_proceso(self):
+        """Reinicia el trabajador si se cayó y recoge su conteo; False si ya no hay nada que mostrar"""
+        proceso = self.pipeline
+        estado = proceso.vigilar()
+        if estado in ('terminado', 'sin_fuente', 'fallido'):
+            self.stop_video()
+            mensajes = {'terminado': "(Fin del video)", 'sin_fuente': "(Fuente no disponible)",
+                        'fallido': "(El proceso de captura falló)"}
+            self.label.setText(f"{self.direccion}\n{mensajes[estado]}")
+            return False
+        if estado == 'reiniciado':
+            print(f"⚠️ {self.direccion}: proceso de captura reiniciado ({proceso.reinicios})")
+        tasa = 0.0
+        if self.planificador is not None:
+            tasa = self.planificador.tasas().get(self.clave, 0.0)
+        proceso.fijar_control(tasa, self.visible, self.periodo_miniatura if self.miniatura else 0.0,
+                              self.tamano_render[0] / ANCHO_VISTA)
+        # Conteo y cruces llegan en cada inferencia aunque la vista esté oculta; solo la imagen
+        # (y con ella el tamaño del frame) depende de que se dibuje
+        inferidos = proceso.estadisticas()['inferidos']
+        if inferidos != self.inferidos_proceso:
+            self.count = proceso.conteo
+            if self.planificador is not None:
+                self.planificador.registrar_medicion(self.clave, self.count)
+            self.inferidos_proceso = inferidos
+        cabecera = proceso.salida.ultima_cabecera()
+        if cabecera is not None and proceso.salida.secuencia != self.secuencia_mostrada:
+            self.tamano_frame = (int(cabecera[ALTO_ORIGINAL]), int(cabecera[ANCHO_ORIGINAL]))
+        return True
 
     def stop_video(self):
-        self.running = False
-        if hasattr(self, 'proc_thread'):
-            self.proc_thread.join(timeout=1)
-        self.timer.stop()
-        if self.cap:
-            self.cap.release()
+        if self.servicio_inferencia is not None:
+            self.servicio_inferencia.retirar(self.clave)
+        if self.planificador is not None:
+            self.planificador.retirar(self.clave)
+        if self.pipeline is not None:
+            self.pipeline.detener()
+            self.pipeline = None
 
     def detect_vehicles(self, frame):
-        results = model(frame, conf=0.4, verbose=False)[0]
-        obj_id = 1
-        self.count = 0  # Inicializa el conteo en cada frame
-        for box in results.boxes:
-            class_id = int(box.cls[0])
-            class_name = results.names[class_id]
-            conf = float(box.conf[0])
-            if class_name in vehicle_classes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                label = f"{obj_id}: {class_name} {conf:.2f}"
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (46, 204, 113), 2)
-                cv2.putText(frame, label, (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (241, 196, 15), 2)
-                obj_id += 1
-                self.count += 1  # Suma 1 por cada vehículo detectado
-        return frame
+        """
+        Etapa de inferencia: obtiene las detecciones y actualiza el conteo.
+        Devuelve las Detecciones de vehículos en coordenadas del frame completo.
+        """
+        roi = self.roi
+        entrada, desplazamiento, imgsz = frame, (0, 0), None
+        if roi is not None:
+            entrada, desplazamiento = roi.recortar(frame)
+            imgsz = roi.imgsz(CONFIG['modelo']['imgsz'], frame.shape, CONFIG['roi']['imgsz_min'])
+
+        if self.ultimo_resultado is not None and (
+                (self.planificador is not None and not self.planificador.debe_inferir(self.clave))
+                or (self.filtro_movimiento is not None and not self.filtro_movimiento.hay_cambio(entrada))):
+            # Sin turno del planificador o escena estática: se reutilizan detecciones y conteo
+            metricas.contar('omitidos', self.clave)
+            if self.servicio_inferencia is not None:
+                self.servicio_inferencia.ceder(self.clave)
+            return self.ultimo_resultado
+        with metricas.etapa('inferencia', self.clave):
+            if self.servicio_inferencia is not None:
+                # El servicio ya filtra las clases de vehículo dentro de YOLO; con
+                # cascada el modelo pequeño trae detecciones dudosas bajo el umbral
+                results = self.servicio_inferencia.inferir(self.clave, entrada, imgsz)
+            else:
+                modelo = obtener_modelo()
+                opciones = {'imgsz': imgsz} if imgsz is not None else {}
+                if self.planificador is not None:
+                    with self.planificador.turno():
+                        results = modelo(entrada, conf=0.4, classes=ids_vehiculo(modelo), verbose=False,
+                                         **opciones)[0]
+                else:
+                    results = modelo(entrada, conf=0.4, classes=ids_vehiculo(modelo), verbose=False, **opciones)[0]
+
+        with metricas.etapa('postproceso', self.clave):
+            if self.servicio_inferencia is not None:
+                detecciones = Detecciones.desde_resultado(results, conf_min=self.servicio_inferencia.conf)
+            else:
+                detecciones = Detecciones.desde_resultado(results)
+            if roi is not None:
+                # Al frame completo y solo lo que apoya dentro del polígono
+                detecciones = roi.filtrar(detecciones, desplazamiento)
+            seguidor, linea = self.seguidor, self.linea
+            if seguidor is not None and linea is not None:
+                self.pistas = seguidor.actualizar(detecciones, time.monotonic())
+                linea.actualizar(*self.pistas)
+        self.count = len(detecciones)
+        self.ultimo_resultado = detecciones
+        if self.planificador is not None:
+            self.planificador.registrar_medicion(self.clave, self.count)
+        return detecciones
+
+    def set_linea(self, linea):
+        """Activa (o quita, con None) la línea de detención y su seguidor"""
+        if isinstance(self.pipeline, ProcesoCamara):
+            self.pipeline.enviar('linea', linea)
+        config = CONFIG['seguimiento']
+        self.seguidor = None if linea is None else Seguidor(
+            config['umbral_alto'], config['umbral_bajo'], config['iou_min'],
+            config['max_edad'], config['min_impactos'])
+        self.pistas = None
+        self.cruces_reportados = 0
+        self.linea = linea
+
+    def tomar_flujo(self):
+        """Vehículos que cruzaron la línea desde la llamada anterior (None sin línea)"""
+        linea = self.linea
+        if linea is None:
+            return None
+        total = self.pipeline.cruces if isinstance(self.pipeline, ProcesoCamara) else linea.total
+        flujo = total - self.cruces_reportados
+        self.cruces_reportados = total
+        return flujo
+
+    def render_frame(self, frame, detecciones, salida):
+        """
+        Etapa de render (fuera del hilo de la GUI): reduce el frame al tamaño
+        de la vista, dibuja ROI y detecciones ya escaladas, convierte a RGB
+        directamente en el buffer trasero y lo publica.
+        """
+        self.tamano_frame = frame.shape[:2]
+        poligono = self.puntos_roi if self.editando_roi else (self.roi.a_lista() if self.roi else None)
+        punto = self.puntos_linea[0] if self.editando_linea and self.puntos_linea else None
+        ancho, alto = self.tamano_render
+        componer_vista(frame, detecciones, salida, ancho, alto, poligono, not self.editando_roi,
+                       punto, self.linea, self.pistas if self.seguidor is not None else None)
+
+    def toggle_roi_edit(self, activo):
+        self.editando_roi = activo
+        self.puntos_roi = []
+        if activo:
+            self.linea_btn.setChecked(False)
+        self.enviar_edicion()
+
+    def toggle_linea_edit(self, activo):
+        self.editando_linea = activo
+        self.puntos_linea = []
+        if activo:
+            self.roi_btn.setChecked(False)
+        self.enviar_edicion()
+
+    def enviar_edicion(self):
+        # En modo multiproceso el dibujo de la edición en curso lo hace el trabajador
+        if not isinstance(self.pipeline, ProcesoCamara):
+            return
+        if self.editando_roi:
+            self.pipeline.enviar('edicion', ('roi', list(self.puntos_roi)))
+        elif self.editando_linea:
+            self.pipeline.enviar('edicion', ('linea', list(self.puntos_linea)))
+        else:
+            self.pipeline.enviar('edicion', None)
+
+    def eventFilter(self, obj, event):
+        if obj is self.label and event.type() == QEvent.MouseButtonPress:
+            if self.editando_roi:
+                if event.button() == Qt.RightButton:
+                    self.save_roi()
+                else:
+                    punto = self.label_to_frame(event.pos())
+                    if punto is not None:
+                        self.puntos_roi.append(punto)
+                        self.enviar_edicion()
+                return True
+            if self.editando_linea:
+                if event.button() == Qt.RightButton:
+                    self.save_linea(None)
+                else:
+                    punto = self.label_to_frame(event.pos())
+                    if punto is not None:
+                        self.puntos_linea.append(punto)
+                        self.enviar_edicion()
+                    if len(self.puntos_linea) == 2:
+                        self.save_linea(ContadorLinea(*self.puntos_linea))
+                return True
+            if event.button() == Qt.LeftButton and self.al_enfocar is not None:
+                # Fuera de la edición, un clic da (o quita) el foco a la vista
+                self.al_enfocar(self)
+                return True
+        return super().eventFilter(obj, event)
+
+    def label_to_frame(self, pos):
+        """Convierte un clic sobre la etiqueta en coordenadas del frame original"""
+        pixmap = self.label.pixmap()
+        if pixmap is None or self.tamano_frame is None:
+            return None
+        fh, fw = self.tamano_frame
+        dx = (self.label.width() - pixmap.width()) / 2
+        dy = (self.label.height() - pixmap.height()) / 2
+        x = (pos.x() - dx) * fw / pixmap.width()
+        y = (pos.y() - dy) * fh / pixmap.height()
+        if not (0 <= x < fw and 0 <= y < fh):
+            return None
+        return [x, y]
+
+    def save_roi(self):
+        # Con menos de 3 vértices se borra el ROI y se vuelve al frame completo
+        self.roi = RegionInteres(self.puntos_roi) if len(self.puntos_roi) >= 3 else None
+        if isinstance(self.pipeline, ProcesoCamara):
+            self.pipeline.enviar('roi', self.roi)
+        guardar_roi(self.obtener_interseccion(), self.direccion, self.roi, CONFIG['roi']['archivo'])
+        if self.filtro_movimiento is not None:
+            self.filtro_movimiento.reiniciar()
+        self.roi_btn.setChecked(False)
+
+    def save_linea(self, linea):
+        guardar_linea(self.obtener_interseccion(), self.direccion, linea, CONFIG['seguimiento']['archivo_lineas'])
+        self.set_linea(linea)
+        self.linea_btn.setChecked(False)
 
     def show_frame(self, frame):
         rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         h, w, ch = rgb_image.shape
         bytes_per_line = ch * w
         qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qt_image).scaled(600, 340, Qt.KeepAspectRatio)
+        pixmap = QPixmap.fromImage(qt_image).scaled(*self.tamano_render, Qt.KeepAspectRatio)
         self.label.setPixmap(pixmap)
 
+class Interseccion:
+    """Accesos de una intersección del tablero, su predictor y el último texto de sus paneles"""
+
+    def __init__(self, obtener_nombre, clave, vistas, predictor):
+        self.obtener_nombre = obtener_nombre
+        self.clave = clave
+        self.vistas = vistas
+        self.predictor = predictor
+        self.texto_conteo = "Aquí irá el conteo de vehículos por dirección."
+        self.texto_prediccion = "Aquí irá el resultado del análisis VISOTRAF."
+
+    def conteos(self):
+        return {d: self.vistas[d].count if d in self.vistas else 0 for d in DIRECCIONES}
+
 class VideoDashboard(QWidget):
+    # Avisa a la GUI desde el hilo de exportación (título, mensaje, es_error)
+    exportacion_terminada = pyqtSignal(str, str, bool)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("VISOTRAF - Dashboard de Intersección")
@@ -188,23 +541,74 @@ class VideoDashboard(QWidget):
         title_layout.addWidget(self.intersection_name)
         title_layout.addStretch(1)
 
-        grid = QGridLayout()
+        # Instrumentación por etapa (antes de crear las vistas); None si está desactivada
+        self.metricas = metricas.activar(CONFIG['metricas'])
+
+        # Un único servicio agrupa en lotes los frames de todas las vistas
+        # El planificador reparte la inferencia entre accesos según la demanda
+        self.planificador = crear_planificador(CONFIG['planificador'])
+        self.servicio_inferencia = ServicioInferencia(
+            max_espera=MAX_ESPERA_LOTE, cascada=crear_cascada(CONFIG['modelo'], CONFIG['cascada']),
+            planificador=self.planificador)
+
+        # Instantánea del pronóstico aprendido: se carga al arrancar y se guarda periódicamente
+        self.aprendizaje = crear_aprendizaje(CONFIG['aprendizaje'])
+        self.predicciones_sin_guardar = 0
+
+        # Tablero: una rejilla 2x2 por intersección (Norte, Este / Oeste, Sur). Sin intersecciones
+        # configuradas hay una sola, con los cuatro accesos y el nombre del campo de texto
+        config_tablero = CONFIG['tablero']
+        definidas = config_tablero['intersecciones']
+        if not definidas:
+            definidas = [{'nombre': None, 'fuentes': {d: "" for d in DIRECCIONES}}]
+        else:
+            self.intersection_name.hide()
+        num_camaras = sum(len(d['fuentes']) for d in definidas)
+        # Con más cámaras que max_completas, las vistas sin foco son miniaturas
+        self.miniaturas = num_camaras > config_tablero['max_completas']
+        columnas = config_tablero['columnas'] or math.ceil(math.sqrt(len(definidas)))
         self.views = {}
-
-        # 2x2 grid: Norte (0,0), Este (0,1), Oeste (1,0), Sur (1,1)
-        self.views["Norte"] = VideoView("Norte")
-        grid.addWidget(self.views["Norte"], 0, 0)
-        self.views["Este"] = VideoView("Este")
-        grid.addWidget(self.views["Este"], 0, 1)
-        self.views["Oeste"] = VideoView("Oeste")
-        grid.addWidget(self.views["Oeste"], 1, 0)
-        self.views["Sur"] = VideoView("Sur")
-        grid.addWidget(self.views["Sur"], 1, 1)
-
-        # Panel izquierdo: título y grid
+        self.intersecciones = []
+        self.vista_enfocada = None
+        tablero = QGridLayout()
+        for n, definicion in enumerate(definidas):
+            nombre = definicion['nombre']
+            obtener_nombre = self.nombre_interseccion if nombre is None else (lambda nombre=nombre: nombre)
+            grid = QGridLayout()
+            vistas = {}
+            for direccion, (fila, columna) in POSICIONES.items():
+                if direccion not in definicion['fuentes']:
+                    continue
+                vista = VideoView(direccion, self.servicio_inferencia, obtener_nombre, self.planificador,
+                                  clave_acceso(nombre, direccion), num_camaras, self.enfocar)
+                fuente = definicion['fuentes'][direccion]
+                vista.input_line.setText("" if fuente is None else str(fuente))
+                vista.fijar_miniatura(self.miniaturas)
+                grid.addWidget(vista, fila, columna)
+                vistas[direccion] = vista
+                self.views[vista.clave] = vista
+            contenedor = QWidget() if nombre is None else QGroupBox(nombre)
+            contenedor.setLayout(grid)
+            tablero.addWidget(contenedor, n // columnas, n % columnas)
+            # El pronóstico aprendido es de la primera intersección
+            self.intersecciones.append(Interseccion(obtener_nombre, nombre or "", vistas,
+                                                    self.crear_predictor(self.aprendizaje if n == 0 else None)))
+        self.interseccion_activa = self.intersecciones[0]
+
+        # Las rejillas van en un área con desplazamiento; las vistas fuera de ella no se dibujan
+        contenedor_tablero = QWidget()
+        contenedor_tablero.setLayout(tablero)
+        self.scroll = QScrollArea()
+        self.scroll.setWidgetResizable(True)
+        self.scroll.setFrameShape(QScrollArea.NoFrame)
+        self.scroll.setWidget(contenedor_tablero)
+        self.scroll.verticalScrollBar().valueChanged.connect(self.marcar_visibilidad)
+        self.scroll.horizontalScrollBar().valueChanged.connect(self.marcar_visibilidad)
+
+        # Panel izquierdo: título y tablero
         main_layout = QVBoxLayout()
         main_layout.addLayout(title_layout)
-        main_layout.addLayout(grid)
+        main_layout.addWidget(self.scroll)
 
         # Panel derecho: botones y dos frames informativos alargados y delgados
         action_layout = QVBoxLayout()
@@ -247,6 +651,23 @@ class VideoDashboard(QWidget):
         self.result_box.setLayout(result_layout)
         action_layout.addWidget(self.result_box)
 
+        # Frame: Rendimiento (solo con métricas): p50/p95 por etapa, FPS y colas por acceso
+        if self.metricas is not None:
+            self.perf_box = QGroupBox("Rendimiento")
+            self.perf_box.setMinimumWidth(180)
+            self.perf_box.setMaximumWidth(200)
+            self.perf_box.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Expanding)
+            perf_layout = QVBoxLayout()
+            self.perf_label = QLabel("Sin mediciones todavía.")
+            self.perf_label.setWordWrap(True)
+            self.perf_label.setStyleSheet("font-size: 10px;")
+            perf_layout.addWidget(self.perf_label)
+            self.perf_box.setLayout(perf_layout)
+            action_layout.addWidget(self.perf_box)
+            self.timer_metricas = QTimer()
+            self.timer_metricas.timeout.connect(self.actualizar_rendimiento)
+            self.timer_metricas.start(1000)
+
         action_layout.addStretch(1)
 
         # Layout horizontal principal
@@ -255,7 +676,22 @@ class VideoDashboard(QWidget):
         h_layout.addLayout(action_layout, 1)
         self.setLayout(h_layout)
 
-        self.predictor = TrafficPredictor()
+        # Serie temporal de conteos: escritura en segundo plano, nunca en el hilo de la GUI
+        config_almacen = CONFIG['almacenamiento']
+        self.almacen = AlmacenConteos(config_almacen['ruta'])
+        csv_legado = config_almacen['csv_legado']
+        if os.path.exists(csv_legado) and not self.almacen.importado(csv_legado):
+            Thread(target=self.almacen.importar_csv,
+                   args=(csv_legado, config_almacen['interseccion_legado']), daemon=True).start()
+        self.exportacion_terminada.connect(self.mostrar_resultado_exportacion)
+
+        # Reloj de render compartido: un solo QTimer refresca todas las vistas
+        self.visibilidad_pendiente = True
+        self.t_visibilidad = 0.0
+        self.reloj_render = QTimer()
+        self.reloj_render.timeout.connect(self.refrescar_vistas)
+        self.reloj_render.start(config_tablero['periodo_render_ms'])
+
         # Timer para actualización de conteo
         self.tiempo_restante = 10
         self.timer_conteo = QTimer()
@@ -269,6 +705,56 @@ class VideoDashboard(QWidget):
         self.timer_guardado.start(10000)  # 10,000 ms = 10 segundos
 
         
+    def nombre_interseccion(self):
+        return self.intersection_name.text().strip() or "sin_nombre"
+
+    def crear_predictor(self, aprendizaje=None):
+        config_prediccion = CONFIG['prediccion']
+        return TrafficPredictor(
+            modo=config_prediccion['modo'], aprendizaje=aprendizaje,
+            carriles=tuple(config_prediccion['carriles']),
+            saturacion_carril=config_prediccion['saturacion_carril'], paso_optimo=config_prediccion['paso_optimo'])
+
+    def marcar_visibilidad(self, *args):
+        self.visibilidad_pendiente = True
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange:
+            self.visibilidad_pendiente = True
+        super().changeEvent(event)
+
+    def resizeEvent(self, event):
+        self.visibilidad_pendiente = True
+        super().resizeEvent(event)
+
+    def refrescar_vistas(self):
+        """Tic del reloj compartido: solo las vistas en pantalla a las que les toca construyen imagen"""
+        ahora = time.monotonic()
+        # Qué vistas se ven se recalcula al desplazar, redimensionar o minimizar (y cada segundo)
+        if self.visibilidad_pendiente or ahora - self.t_visibilidad >= 1.0:
+            self.visibilidad_pendiente = False
+            self.t_visibilidad = ahora
+            minimizada = self.isMinimized() or not self.isVisible()
+            for vista in self.views.values():
+                vista.visible = not minimizada and not vista.visibleRegion().isEmpty()
+        for vista in self.views.values():
+            vista.next_frame(ahora)
+
+    def enfocar(self, vista):
+        """Clic en una vista: su intersección pasa a los paneles y, con miniaturas, la vista a tamaño completo"""
+        interseccion = next(i for i in self.intersecciones if vista in i.vistas.values())
+        if interseccion is not self.interseccion_activa:
+            self.interseccion_activa = interseccion
+            self.mostrar_interseccion()
+        if not self.miniaturas:
+            return
+        anterior, self.vista_enfocada = self.vista_enfocada, None if vista is self.vista_enfocada else vista
+        if anterior is not None:
+            anterior.fijar_miniatura(True)
+        if self.vista_enfocada is not None:
+            self.vista_enfocada.fijar_miniatura(False)
+        self.visibilidad_pendiente = True
+
     def iniciar_todos(self):
         for view in self.views.values():
             view.start_video()
@@ -277,74 +763,104 @@ class VideoDashboard(QWidget):
         for view in self.views.values():
             view.stop_video()
             view.label.setText(f"{view.direccion}\n(Detenido)")
+        self.servicio_inferencia.detener()
 
     def guardar_conteo_periodico(self):
-        conteos = {
-            "Norte": getattr(self.views["Norte"], "count", 0),
-            "Sur": getattr(self.views["Sur"], "count", 0),
-            "Este": getattr(self.views["Este"], "count", 0),
-            "Oeste": getattr(self.views["Oeste"], "count", 0),
-        }
-        self.guardar_conteo_csv(conteos)
-
-    def guardar_conteo_csv(self, conteos):
-        archivo = "conteo_vehiculos.csv"
-        existe = os.path.isfile(archivo)
-        with open(archivo, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not existe:
-                writer.writerow(["timestamp", "Norte", "Sur", "Este", "Oeste"])
-            writer.writerow([
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                conteos["Norte"],
-                conteos["Sur"],
-                conteos["Este"],
-                conteos["Oeste"]
-            ])
+        for interseccion in self.intersecciones:
+            self.almacen.registrar(interseccion.obtener_nombre(), interseccion.conteos())
 
     def actualizar_conteo_vehiculos(self, inicial=False):
         if not inicial:
             self.tiempo_restante -= 1
         if self.tiempo_restante <= 0 or inicial:
-            conteos = {
-                "Norte": getattr(self.views["Norte"], "count", 0),
-                "Sur": getattr(self.views["Sur"], "count", 0),
-                "Este": getattr(self.views["Este"], "count", 0),
-                "Oeste": getattr(self.views["Oeste"], "count", 0),
-            }
-            self.guardar_conteo_csv(conteos)
-            texto = (
-                f"Conteo de vehículos (actualizado):\n"
-                f"Norte: {conteos['Norte']}\n"
-                f"Sur: {conteos['Sur']}\n"
-                f"Este: {conteos['Este']}\n"
-                f"Oeste: {conteos['Oeste']}\n"
-            )
-            self.count_label.setText(texto)
-            # --- Predicción de tiempos de semáforo ---
-            predictions, cycle_sequence = self.predictor.predict_green_times(conteos)
-            total_cycle_time = sum(phase['duration'] for phase in cycle_sequence)
-            texto_prediccion = (
-                f"Predicción de tiempos:\n\n"
-                f"Norte-Sur:\n"
-                f"  Principal: {predictions['main']['ns']:.1f}s\n"
-                f"  Giro: {predictions['turn']['ns']:.1f}s\n\n"
-                f"Este-Oeste:\n"
-                f"  Principal: {predictions['main']['eo']:.1f}s\n"
-                f"  Giro: {predictions['turn']['eo']:.1f}s\n\n"
-                f"Tiempo total ciclo: {total_cycle_time:.1f}s"
-            )
-            self.result_label.setText(texto_prediccion)
-            # -----------------------------------------
+            for interseccion in self.intersecciones:
+                self.predecir_interseccion(interseccion)
+            if self.aprendizaje is not None:
+                self.predicciones_sin_guardar += 1
+                if self.predicciones_sin_guardar >= CONFIG['aprendizaje']['guardar_cada']:
+                    self.guardar_aprendizaje()
+            self.mostrar_interseccion()
             self.tiempo_restante = 10
         self.count_box.setTitle(f"Conteo de vehículos - {self.tiempo_restante}s")
-        
+
+    def predecir_interseccion(self, interseccion):
+        """Conteos y predicción de una intersección; guarda el texto de sus paneles"""
+        vistas = interseccion.vistas
+        conteos = interseccion.conteos()
+        texto = "Conteo de vehículos (actualizado):\n"
+        if interseccion.clave:
+            texto = f"{interseccion.clave}\n" + texto
+        texto += "".join(f"{d}: {conteos[d]}\n" for d in DIRECCIONES)
+        omitidos = [
+            f"{d}: {v.filtro_movimiento.fraccion_omitida():.0%}"
+            for d, v in vistas.items() if v.filtro_movimiento is not None
+        ]
+        if omitidos:
+            texto += "\nFrames sin inferencia:\n" + "\n".join(omitidos) + "\n"
+        if self.planificador is not None:
+            tasas = self.planificador.tasas()
+            tasas = {d: tasas[v.clave] for d, v in vistas.items() if v.clave in tasas}
+            if tasas:
+                texto += "\nInferencias/s:\n" + "\n".join(f"{d}: {t:.1f}" for d, t in tasas.items()) + "\n"
+        cascada = self.servicio_inferencia.cascada
+        if cascada is not None:
+            stats = cascada.estadisticas()
+            texto += (f"\nCascada: {stats['tasa_escalado']:.0%} escalados\n"
+                      f"Desacuerdo: {stats['desacuerdo_medio']:.2f}\n")
+        # Flujo real por línea de detención; sin línea se usa el conteo visible
+        flujos = {d: v.tomar_flujo() for d, v in vistas.items()}
+        if any(f is not None for f in flujos.values()):
+            texto += "\nCruces (últimos 10 s):\n" + "\n".join(
+                f"{d}: {f}" for d, f in flujos.items() if f is not None) + "\n"
+            flujos = {d: conteos[d] if flujos.get(d) is None else flujos[d] for d in DIRECCIONES}
+        else:
+            flujos = None
+        # --- Predicción de tiempos de semáforo ---
+        predictions, cycle_sequence = interseccion.predictor.predict_green_times(conteos, flujos)
+        total_cycle_time = sum(phase['duration'] for phase in cycle_sequence)
+        if self.planificador is not None:
+            self.planificador.actualizar_ciclo(cycle_sequence, interseccion=interseccion.clave)
+        aprendizaje = interseccion.predictor.aprendizaje
+        if aprendizaje is not None:
+            stats = aprendizaje.estadisticas()
+            if stats['error_modelo'] is not None:
+                texto += (f"\nPronóstico ({'activo' if stats['listo'] else 'aprendiendo'}, "
+                          f"{stats['muestras']} muestras):\n"
+                          f"Error: {stats['error_modelo']:.0f} veh/h (media: {stats['error_base']:.0f})\n")
+        interseccion.texto_conteo = texto
+        interseccion.texto_prediccion = (
+            f"Predicción de tiempos:\n\n"
+            f"Norte-Sur:\n"
+            f"  Principal: {predictions['main']['ns']:.1f}s\n"
+            f"  Giro: {predictions['turn']['ns']:.1f}s\n\n"
+            f"Este-Oeste:\n"
+            f"  Principal: {predictions['main']['eo']:.1f}s\n"
+            f"  Giro: {predictions['turn']['eo']:.1f}s\n\n"
+            f"Tiempo total ciclo: {total_cycle_time:.1f}s"
+        )
+
+    def mostrar_interseccion(self):
+        """Paneles de conteo y resultado de la intersección activa (la de la última vista pulsada)"""
+        self.count_label.setText(self.interseccion_activa.texto_conteo)
+        self.result_label.setText(self.interseccion_activa.texto_prediccion)
 
     def exportar_historico(self):
-        archivo_origen = "conteo_vehiculos.csv"
-        if not os.path.exists(archivo_origen):
-            QMessageBox.warning(self, "Exportar histórico", "No existe archivo de datos históricos.")
+        ventana, ok = QInputDialog.getItem(
+            self, "Exportar histórico", "Periodo a exportar:", list(VENTANAS_EXPORTACION), 1, False
+        )
+        if not ok:
             return
+        interseccion = self.interseccion_activa.obtener_nombre()
+        if len(self.intersecciones) > 1:
+            # Con varias intersecciones se elige cuál (la activa por defecto) o todas juntas
+            nombres = [i.obtener_nombre() for i in self.intersecciones]
+            opciones = nombres + [TODAS_INTERSECCIONES]
+            eleccion, ok = QInputDialog.getItem(
+                self, "Exportar histórico", "Intersección:", opciones, nombres.index(interseccion), False
+            )
+            if not ok:
+                return
+            interseccion = None if eleccion == TODAS_INTERSECCIONES else eleccion
         # Genera nombre con fecha y hora
         fecha_hora = datetime.now().strftime("%Y%m%d_%H%M%S")
         nombre_archivo = f"conteo_vehiculos_export_{fecha_hora}.csv"
@@ -354,9 +870,53 @@ class VideoDashboard(QWidget):
             nombre_archivo,
             "CSV Files (*.csv)"
         )
-        if destino:
-            shutil.copyfile(archivo_origen, destino)
-            QMessageBox.information(self, "Exportar histórico", f"Archivo exportado correctamente como:\n{os.path.basename(destino)}")
+        if not destino:
+            return
+        duracion = VENTANAS_EXPORTACION[ventana]
+        desde = datetime.now() - duracion if duracion is not None else None
+        self.export_btn.setEnabled(False)
+        Thread(target=self._exportar_en_fondo, args=(destino, interseccion, desde),
+               daemon=True).start()
+
+    def _exportar_en_fondo(self, destino, interseccion, desde):
+        try:
+            filas = self.almacen.exportar_csv(destino, interseccion, desde)
+        except Exception as e:
+            self.exportacion_terminada.emit("Exportar histórico", f"Error al exportar:\n{e}", True)
+            return
+        if filas == 0:
+            self.exportacion_terminada.emit("Exportar histórico", "No hay datos históricos en ese periodo.", True)
+        else:
+            self.exportacion_terminada.emit(
+                "Exportar histórico",
+                f"Archivo exportado correctamente como:\n{os.path.basename(destino)} ({filas} filas)", False
+            )
+
+    def mostrar_resultado_exportacion(self, titulo, mensaje, es_error):
+        self.export_btn.setEnabled(True)
+        if es_error:
+            QMessageBox.warning(self, titulo, mensaje)
+        else:
+            QMessageBox.information(self, titulo, mensaje)
+
+    def actualizar_rendimiento(self):
+        self.perf_label.setText(self.metricas.texto_panel() or "Sin mediciones todavía.")
+
+    def guardar_aprendizaje(self):
+        self.predicciones_sin_guardar = 0
+        try:
+            self.aprendizaje.guardar(CONFIG['aprendizaje']['ruta_modelo'])
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el modelo de flujo: {e}")
+
+    def closeEvent(self, event):
+        self.reloj_render.stop()
+        self.detener_todos()
+        if self.aprendizaje is not None:
+            self.guardar_aprendizaje()
+        self.almacen.cerrar()
+        metricas.cerrar()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -1,11 +1,38 @@
-from src.vision_vehicular import procesar_video
 import sys
-from PyQt5.QtWidgets import QApplication
-from dashboard_qt import VideoDashboard  # Asegúrate de tener dashboard_qt.py en tu proyecto
+
+from src import arranque
 
 if __name__ == "__main__":
+    # Modo sin interfaz: python main.py lote <entrada> <salida> [opciones]
+    if len(sys.argv) > 1 and sys.argv[1] == "lote":
+        from src.procesamiento_lote import main as main_lote
+        sys.exit(main_lote(sys.argv[2:]))
+    # Servicio sin pantalla para gabinetes de campo: python main.py servicio [opciones]
+    if len(sys.argv) > 1 and sys.argv[1] == "servicio":
+        from src.servicio_local import main as main_servicio
+        sys.exit(main_servicio(sys.argv[2:]))
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from dashboard_qt import VideoDashboard  # Asegúrate de tener dashboard_qt.py en tu proyecto
+    from src.vision_vehicular import precalentar_modelo
+    arranque.marcar("imports")
+
     app = QApplication(sys.argv)
+    arranque.marcar("QApplication")
     window = VideoDashboard()
+    arranque.marcar("VideoDashboard")
     window.showMaximized()  # Esto es suficiente
-    sys.exit(app.exec_())
 
+    def modelo_listo():
+        arranque.marcar("modelo precalentado")
+        print(arranque.informe_arranque())
+
+    def primer_render():
+        arranque.marcar("primera ventana visible")
+        print(arranque.informe_arranque())
+        # El modelo se carga y precalienta mientras la ventana ya es usable
+        precalentar_modelo(al_terminar=modelo_listo)
+
+    QTimer.singleShot(0, primer_render)
+    sys.exit(app.exec_())
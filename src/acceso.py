@@ -0,0 +1,131 @@
+import time
+
+from src import metricas
+from src.detecciones import Detecciones
+from src.movimiento import crear_filtro
+from src.seguimiento import Seguidor
+from src.vision_vehicular import ids_vehiculo, obtener_modelo
+
+
+class AccesoConteo:
+    """
+    Conteo de un acceso sin interfaz: ROI, pre-filtro de movimiento,
+    planificador, inferencia y línea de detención, en el mismo orden que la
+    vista del dashboard. Lo usan el servicio sin pantalla y los procesos
+    trabajadores; `inferir(frame)` es la etapa de inferencia de PipelineVideo.
+
+    Parameters:
+    -----------
+    direccion : str
+        Nombre del acceso (clave del planificador y del servicio de inferencia).
+    config : dict
+        Configuración completa (secciones 'modelo', 'roi', 'movimiento', 'seguimiento').
+    servicio_inferencia : ServicioInferencia, opcional
+        Si se da, los frames se agrupan en lote con los de otros accesos.
+    planificador : PlanificadorInferencia, opcional
+        Decide cuándo le toca inferir a este acceso.
+    tasa_max : callable, opcional
+        Devuelve las inferencias/s máximas (0 sin límite) cuando el
+        planificador vive en otro proceso.
+    """
+
+    def __init__(self, direccion, config, roi=None, linea=None, servicio_inferencia=None, planificador=None,
+                 tasa_max=None):
+        self.direccion = direccion
+        self.config = config
+        self.servicio_inferencia = servicio_inferencia
+        self.planificador = planificador
+        self.tasa_max = tasa_max
+        self.filtro = crear_filtro(direccion, config['movimiento'])
+        self.roi = roi
+        self.linea = None
+        self.seguidor = None
+        self.pistas = None
+        self.count = 0
+        self.inferencias = 0
+        self.ultimo_resultado = None
+        self.t_inferencia = None
+        self.set_linea(linea)
+
+    def set_roi(self, roi):
+        self.roi = roi
+        if self.filtro is not None:
+            self.filtro.reiniciar()
+
+    def set_linea(self, linea):
+        """Activa (o quita, con None) la línea de detención y su seguidor"""
+        config = self.config['seguimiento']
+        self.seguidor = None if linea is None else Seguidor(
+            config['umbral_alto'], config['umbral_bajo'], config['iou_min'],
+            config['max_edad'], config['min_impactos'])
+        self.pistas = None
+        self.linea = linea
+
+    @property
+    def cruces(self):
+        """Cruces acumulados de la línea (None sin línea)"""
+        linea = self.linea
+        return None if linea is None else linea.total
+
+    def reiniciar(self):
+        self.ultimo_resultado = None
+        if self.filtro is not None:
+            self.filtro.reiniciar()
+
+    def _reutilizar(self, entrada, ahora):
+        if self.ultimo_resultado is None:
+            return False
+        if self.planificador is not None and not self.planificador.debe_inferir(self.direccion):
+            return True
+        if self.tasa_max is not None:
+            tasa = self.tasa_max()
+            if tasa > 0 and ahora - self.t_inferencia < 1.0 / tasa:
+                return True
+        return self.filtro is not None and not self.filtro.hay_cambio(entrada)
+
+    def inferir(self, frame):
+        """Detecciones de vehículos del frame (en coordenadas del frame completo)"""
+        roi = self.roi
+        entrada, desplazamiento, imgsz = frame, (0, 0), None
+        if roi is not None:
+            entrada, desplazamiento = roi.recortar(frame)
+            imgsz = roi.imgsz(self.config['modelo']['imgsz'], frame.shape, self.config['roi']['imgsz_min'])
+
+        ahora = time.monotonic()
+        if self._reutilizar(entrada, ahora):
+            # Sin turno o escena estática: se reutilizan detecciones y conteo
+            metricas.contar('omitidos', self.direccion)
+            if self.servicio_inferencia is not None:
+                self.servicio_inferencia.ceder(self.direccion)
+            return self.ultimo_resultado
+        with metricas.etapa('inferencia', self.direccion):
+            if self.servicio_inferencia is not None:
+                resultado = self.servicio_inferencia.inferir(self.direccion, entrada, imgsz)
+            else:
+                modelo = obtener_modelo()
+                opciones = {'imgsz': imgsz} if imgsz is not None else {}
+                if self.planificador is not None:
+                    with self.planificador.turno():
+                        resultado = modelo(entrada, conf=0.4, classes=ids_vehiculo(modelo), verbose=False,
+                                           **opciones)[0]
+                else:
+                    resultado = modelo(entrada, conf=0.4, classes=ids_vehiculo(modelo), verbose=False, **opciones)[0]
+
+        with metricas.etapa('postproceso', self.direccion):
+            if self.servicio_inferencia is not None:
+                detecciones = Detecciones.desde_resultado(resultado, conf_min=self.servicio_inferencia.conf)
+            else:
+                detecciones = Detecciones.desde_resultado(resultado)
+            if roi is not None:
+                detecciones = roi.filtrar(detecciones, desplazamiento)
+            seguidor, linea = self.seguidor, self.linea
+            if seguidor is not None and linea is not None:
+                self.pistas = seguidor.actualizar(detecciones, ahora)
+                linea.actualizar(*self.pistas)
+        self.count = len(detecciones)
+        self.t_inferencia = ahora
+        self.inferencias += 1
+        self.ultimo_resultado = detecciones
+        if self.planificador is not None:
+            self.planificador.registrar_medicion(self.direccion, self.count)
+        return detecciones
@@ -0,0 +1,211 @@
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DIRECCIONES = ('Norte', 'Sur', 'Este', 'Oeste')
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS conteos (
+    interseccion TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    norte INTEGER NOT NULL,
+    sur INTEGER NOT NULL,
+    este INTEGER NOT NULL,
+    oeste INTEGER NOT NULL,
+    PRIMARY KEY (interseccion, ts)
+) WITHOUT ROWID
+"""
+# La clave primaria agrupa físicamente las filas por intersección y tiempo:
+# cada intersección es una partición contigua y las consultas por rango
+# de tiempo recorren solo su tramo del índice.
+_INSERTAR = "INSERT OR REPLACE INTO conteos VALUES (?, ?, ?, ?, ?, ?)"
+REINTENTOS_ESCRITURA = 3
+# Marcas de la propia base, p. ej. qué CSV legados ya se importaron completos
+_ESQUEMA_META = "CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)"
+
+
+def _a_epoch(valor):
+    if valor is None or isinstance(valor, (int, float)):
+        return valor
+    if isinstance(valor, str):
+        valor = datetime.strptime(valor, FORMATO_TIMESTAMP)
+    return int(valor.timestamp())
+
+
+def _clave_importacion(origen):
+    return "importado:" + os.path.abspath(origen)
+
+
+class AlmacenConteos:
+    """
+    Serie temporal de conteos por intersección en SQLite (modo WAL).
+
+    Las escrituras se encolan y un hilo de fondo las agrupa en transacciones,
+    así la GUI nunca toca el disco. Las lecturas usan su propia conexión y
+    no bloquean al escritor gracias al WAL.
+
+    Parameters:
+    -----------
+    ruta : str
+        Archivo de la base de datos.
+    max_lote : int
+        Máximo de filas por transacción.
+    intervalo_flush : float
+        Segundos máximos que una fila espera en cola antes de escribirse.
+    """
+
+    def __init__(self, ruta="conteos.sqlite", max_lote=500, intervalo_flush=1.0):
+        self.ruta = ruta
+        self.max_lote = max_lote
+        self.intervalo_flush = intervalo_flush
+        self.cola = queue.Queue()
+        self.descartadas = 0
+        conexion = self._conectar()
+        conexion.execute(_ESQUEMA)
+        conexion.execute(_ESQUEMA_META)
+        conexion.close()
+        self.hilo = threading.Thread(target=self._escribir, daemon=True)
+        self.hilo.start()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        return conexion
+
+    def registrar(self, interseccion, conteos, timestamp=None):
+        """Encola un conteo {'Norte': n, ...}; no bloquea"""
+        ts = _a_epoch(timestamp) if timestamp is not None else int(time.time())
+        self.cola.put((interseccion, ts) + tuple(int(conteos.get(d, 0)) for d in DIRECCIONES))
+
+    def cerrar(self, timeout=10.0):
+        """Escribe lo pendiente y detiene el hilo escritor (espera como mucho `timeout` segundos)"""
+        self.cola.put(None)
+        self.hilo.join(timeout)
+        if self.hilo.is_alive():
+            print(f"⚠️ {self.ruta}: el escritor no terminó en {timeout} s; se pierden {self.cola.qsize()} filas")
+
+    def _escribir(self):
+        conexion = self._conectar()
+        terminar = False
+        while not terminar:
+            fila = self.cola.get()
+            if fila is None:
+                break
+            lote = [fila]
+            limite = time.monotonic() + self.intervalo_flush
+            while len(lote) < self.max_lote:
+                try:
+                    fila = self.cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if fila is None:
+                    terminar = True
+                    break
+                lote.append(fila)
+            self._escribir_lote(conexion, lote)
+        conexion.close()
+
+    def _escribir_lote(self, conexion, lote):
+        # Base bloqueada o disco lleno: se reintenta unas veces y si no se descarta el lote,
+        # el hilo escritor nunca muere (si muriera la cola crecería sin fin y cerrar() no volvería)
+        for intento in range(REINTENTOS_ESCRITURA):
+            try:
+                with conexion:
+                    conexion.executemany(_INSERTAR, lote)
+                return
+            except sqlite3.Error as e:
+                error = e
+                time.sleep(0.5 * (intento + 1))
+        self.descartadas += len(lote)
+        print(f"⚠️ {self.ruta}: no se pudieron escribir {len(lote)} conteos ({error})")
+
+    def consultar(self, interseccion=None, desde=None, hasta=None, tam_bloque=5000):
+        """
+        Genera filas (interseccion, timestamp, norte, sur, este, oeste) ordenadas
+        por tiempo en el rango [desde, hasta]. Acepta datetime, epoch o texto.
+        """
+        condiciones, parametros = [], []
+        if interseccion is not None:
+            condiciones.append("interseccion = ?")
+            parametros.append(interseccion)
+        if desde is not None:
+            condiciones.append("ts >= ?")
+            parametros.append(_a_epoch(desde))
+        if hasta is not None:
+            condiciones.append("ts <= ?")
+            parametros.append(_a_epoch(hasta))
+        sql = "SELECT interseccion, ts, norte, sur, este, oeste FROM conteos"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sql += " ORDER BY interseccion, ts"
+
+        conexion = self._conectar()
+        try:
+            cursor = conexion.execute(sql, parametros)
+            while True:
+                filas = cursor.fetchmany(tam_bloque)
+                if not filas:
+                    break
+                for interseccion_fila, ts, *conteos in filas:
+                    yield (interseccion_fila, datetime.fromtimestamp(ts).strftime(FORMATO_TIMESTAMP), *conteos)
+        finally:
+            conexion.close()
+
+    def exportar_csv(self, destino, interseccion=None, desde=None, hasta=None):
+        """
+        Exporta un rango a CSV con el mismo formato que conteo_vehiculos.csv,
+        en streaming. Devuelve el número de filas escritas.
+        """
+        filas = 0
+        with open(destino, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            cabecera = ["timestamp", *DIRECCIONES]
+            writer.writerow(cabecera if interseccion is not None else ["interseccion"] + cabecera)
+            for interseccion_fila, *resto in self.consultar(interseccion, desde, hasta):
+                writer.writerow(resto if interseccion is not None else [interseccion_fila, *resto])
+                filas += 1
+        return filas
+
+    def importado(self, origen):
+        """True si el CSV ya se importó completo (un import interrumpido se repite entero)"""
+        conexion = self._conectar()
+        try:
+            fila = conexion.execute("SELECT 1 FROM meta WHERE clave = ?", (_clave_importacion(origen),)).fetchone()
+        finally:
+            conexion.close()
+        return fila is not None
+
+    def importar_csv(self, origen, interseccion, tam_bloque=5000):
+        """
+        Importa un histórico en formato conteo_vehiculos.csv por bloques y, al
+        terminar, lo anota en la tabla meta. Repetirlo no duplica filas.
+        """
+        conexion = self._conectar()
+        filas = 0
+        try:
+            with open(origen, newline='', encoding='utf-8') as f:
+                bloque = []
+                for fila in csv.DictReader(f):
+                    bloque.append((interseccion, _a_epoch(fila['timestamp'])) +
+                                  tuple(int(fila[d]) for d in DIRECCIONES))
+                    if len(bloque) >= tam_bloque:
+                        with conexion:
+                            conexion.executemany(_INSERTAR, bloque)
+                        filas += len(bloque)
+                        bloque = []
+                if bloque:
+                    with conexion:
+                        conexion.executemany(_INSERTAR, bloque)
+                    filas += len(bloque)
+            with conexion:
+                conexion.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 (_clave_importacion(origen), f"{interseccion};{filas}"))
+        finally:
+            conexion.close()
+        return filas
@@ -0,0 +1,317 @@
+import argparse
+import json
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+
+from src.almacenamiento import DIRECCIONES, FORMATO_TIMESTAMP
+from src.prediccion_AI import TOLERANCIA_INTERVALO
+
+# hora (sin/cos, 2 armónicos), fin de semana, último flujo, media rápida y lenta por dirección,
+# proporción de cada dirección y del eje N-S, y término independiente
+N_CARACTERISTICAS = 4 + 1 + 4 * 4 + 1 + 1
+
+
+class EscaladorIncremental:
+    """
+    Media y varianza por columna actualizadas por lotes (Welford/Chan), como
+    StandardScaler.partial_fit pero en NumPy y serializable en un .npz.
+    """
+
+    def __init__(self, dimension):
+        self.n = 0
+        self.media = np.zeros(dimension)
+        self.m2 = np.zeros(dimension)
+
+    def partial_fit(self, X):
+        X = np.atleast_2d(X)
+        k = len(X)
+        if not k:
+            return self
+        media_lote = X.mean(axis=0)
+        m2_lote = ((X - media_lote) ** 2).sum(axis=0)
+        total = self.n + k
+        delta = media_lote - self.media
+        self.media = self.media + delta * k / total
+        self.m2 = self.m2 + m2_lote + delta ** 2 * self.n * k / total
+        self.n = total
+        return self
+
+    @property
+    def escala(self):
+        if self.n < 2:
+            return np.ones_like(self.media)
+        desviacion = np.sqrt(self.m2 / self.n)
+        return np.where(desviacion > 1e-9, desviacion, 1.0)
+
+    def transform(self, X):
+        return (X - self.media) / self.escala
+
+    def inverse_transform(self, X):
+        return X * self.escala + self.media
+
+
+class PredictorIncremental:
+    """
+    Pronóstico aprendido del flujo del siguiente intervalo (veh/h por dirección).
+
+    Un modelo lineal por dirección sobre características escaladas en línea;
+    cada conteo nuevo entrena con la pareja (características del intervalo
+    anterior, flujo observado ahora) mediante un paso de gradiente
+    normalizado (NLMS), así que cada actualización cuesta O(1) y no guarda
+    histórico. Las medias móviles son exponenciales por el mismo motivo.
+
+    El pronóstico sustituye a la media del último minuto como `flujos` de
+    PredictorIntersecciones: el reparto de verde (proporcional u óptimo)
+    sigue siendo el mismo. Mientras no haya `min_muestras` se usa la media.
+
+    Parameters:
+    -----------
+    intervalo : float
+        Segundos por conteo; el flujo es conteo * 3600 / intervalo.
+    tasa : float
+        Tasa de aprendizaje del paso normalizado.
+    alfa_rapida, alfa_lenta : float
+        Pesos de las medias móviles exponenciales del flujo.
+    max_hueco : float
+        Si entre dos conteos pasan más segundos, no se entrena con esa pareja
+        (el flujo ya no es el del "siguiente" intervalo) y se reinician las medias.
+    min_muestras : int
+        Parejas entrenadas necesarias antes de usar el pronóstico.
+    """
+
+    def __init__(self, intervalo=10.0, tasa=0.05, alfa_rapida=0.5, alfa_lenta=0.1, max_hueco=60.0,
+                 min_muestras=60):
+        self.intervalo = intervalo
+        self.tasa = tasa
+        self.alfa_rapida = alfa_rapida
+        self.alfa_lenta = alfa_lenta
+        self.max_hueco = max_hueco
+        self.min_muestras = min_muestras
+        n_dir = len(DIRECCIONES)
+        self.pesos = np.zeros((N_CARACTERISTICAS, n_dir))
+        self.escalador_x = EscaladorIncremental(N_CARACTERISTICAS)
+        self.escalador_y = EscaladorIncremental(n_dir)
+        self.muestras = 0
+        # Estado del flujo (medias móviles) y características del último conteo
+        self.rapida = None
+        self.lenta = None
+        self.t_ultimo = None
+        self.x_ultimo = None
+        # Error absoluto medio (exponencial) del modelo y de la media lenta como referencia
+        self.error_modelo = None
+        self.error_base = None
+
+    # --- Características ---
+
+    def _caracteristicas(self, flujo, segundos_dia, dia_semana):
+        angulo = 2 * math.pi * segundos_dia / 86400
+        lenta = self.lenta
+        total = lenta.sum()
+        proporcion = lenta / total if total > 0 else np.full(len(lenta), 1 / len(lenta))
+        x = np.empty(N_CARACTERISTICAS)
+        x[:4] = math.sin(angulo), math.cos(angulo), math.sin(2 * angulo), math.cos(2 * angulo)
+        x[4] = 1.0 if dia_semana >= 5 else 0.0
+        x[5:9] = flujo
+        x[9:13] = self.rapida
+        x[13:17] = lenta
+        x[17:21] = proporcion
+        x[21] = proporcion[0] + proporcion[1]
+        x[22] = 1.0
+        return x
+
+    def _avanzar(self, conteos, t, segundos_dia, dia_semana):
+        # Actualiza las medias y devuelve (x de este conteo, objetivo para la x anterior o None)
+        flujo = np.asarray(conteos, dtype=np.float64) * 3600 / self.intervalo
+        continuo = self.t_ultimo is not None and 0 <= t - self.t_ultimo <= self.max_hueco
+        objetivo = flujo if continuo and self.x_ultimo is not None else None
+        if not continuo:
+            self.rapida = flujo.copy()
+            self.lenta = flujo.copy()
+        else:
+            self.rapida += self.alfa_rapida * (flujo - self.rapida)
+            self.lenta += self.alfa_lenta * (flujo - self.lenta)
+        self.t_ultimo = t
+        return self._caracteristicas(flujo, segundos_dia, dia_semana), objetivo
+
+    # --- Entrenamiento ---
+
+    def partial_fit(self, X, Y, tam_lote=64):
+        """Actualiza escaladores y pesos con parejas (X (k, F), Y (k, 4) en veh/h)"""
+        X, Y = np.atleast_2d(X), np.atleast_2d(Y)
+        for inicio in range(0, len(X), tam_lote):
+            x, y = X[inicio:inicio + tam_lote], Y[inicio:inicio + tam_lote]
+            self.escalador_x.partial_fit(x)
+            self.escalador_y.partial_fit(y)
+            xs = self.escalador_x.transform(x)
+            xs[:, -1] = 1.0  # el término independiente no se escala
+            error = self.escalador_y.transform(y) - xs @ self.pesos
+            norma = 1.0 + (xs ** 2).sum(axis=1).mean()
+            self.pesos += self.tasa * xs.T @ error / (len(x) * norma)
+            self.muestras += len(x)
+        return self
+
+    def _registrar_error(self, x, objetivo):
+        # Error antes de entrenar (fuera de muestra), en veh/h medio por dirección
+        base = float(np.abs(x[13:17] - objetivo).mean())
+        modelo = float(np.abs(self._pronostico(x) - objetivo).mean())
+        if self.error_modelo is None:
+            self.error_modelo, self.error_base = modelo, base
+        else:
+            self.error_modelo += 0.02 * (modelo - self.error_modelo)
+            self.error_base += 0.02 * (base - self.error_base)
+
+    def actualizar(self, conteos, momento):
+        """
+        Conteo nuevo (4,) en el orden de DIRECCIONES tomado en `momento`
+        (datetime). Entrena con el conteo anterior y prepara el pronóstico.
+        """
+        segundos_dia = momento.hour * 3600 + momento.minute * 60 + momento.second
+        x, objetivo = self._avanzar(conteos, momento.timestamp(), segundos_dia, momento.weekday())
+        if objetivo is not None:
+            self._registrar_error(self.x_ultimo, objetivo)
+            self.partial_fit(self.x_ultimo, objetivo)
+        self.x_ultimo = x
+
+    # --- Pronóstico ---
+
+    @property
+    def listo(self):
+        return self.muestras >= self.min_muestras and self.x_ultimo is not None
+
+    def _pronostico(self, x):
+        xs = self.escalador_x.transform(x)
+        xs[-1] = 1.0
+        return np.maximum(self.escalador_y.inverse_transform(xs @ self.pesos), 0.0)
+
+    def predecir(self):
+        """Flujo (4,) previsto para el siguiente intervalo, o None si aún no está listo"""
+        if not self.listo:
+            return None
+        return np.trunc(self._pronostico(self.x_ultimo))
+
+    def estadisticas(self):
+        return {'muestras': self.muestras, 'listo': self.listo,
+                'error_modelo': self.error_modelo, 'error_base': self.error_base}
+
+    # --- Instantáneas ---
+
+    def guardar(self, ruta):
+        """Instantánea .npz (pesos, escaladores y estado) escrita de forma atómica"""
+        parametros = {'intervalo': self.intervalo, 'tasa': self.tasa, 'alfa_rapida': self.alfa_rapida,
+                      'alfa_lenta': self.alfa_lenta, 'max_hueco': self.max_hueco,
+                      'min_muestras': self.min_muestras}
+        estado = {'muestras': self.muestras, 't_ultimo': self.t_ultimo,
+                  'error_modelo': self.error_modelo, 'error_base': self.error_base}
+        vacio = np.zeros(0)
+        temporal = ruta + ".tmp"
+        with open(temporal, 'wb') as f:
+            np.savez(f, pesos=self.pesos,
+                     x_n=self.escalador_x.n, x_media=self.escalador_x.media, x_m2=self.escalador_x.m2,
+                     y_n=self.escalador_y.n, y_media=self.escalador_y.media, y_m2=self.escalador_y.m2,
+                     rapida=vacio if self.rapida is None else self.rapida,
+                     lenta=vacio if self.lenta is None else self.lenta,
+                     x_ultimo=vacio if self.x_ultimo is None else self.x_ultimo,
+                     parametros=json.dumps(parametros), estado=json.dumps(estado))
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as datos:
+            modelo = cls(**json.loads(str(datos['parametros'])))
+            estado = json.loads(str(datos['estado']))
+            if datos['pesos'].shape != modelo.pesos.shape:
+                raise ValueError(f"{ruta}: la instantánea tiene otras características "
+                                 f"{datos['pesos'].shape}, se esperaban {modelo.pesos.shape}")
+            modelo.pesos = datos['pesos']
+            for nombre, escalador in (('x', modelo.escalador_x), ('y', modelo.escalador_y)):
+                escalador.n = int(datos[nombre + '_n'])
+                escalador.media = datos[nombre + '_media']
+                escalador.m2 = datos[nombre + '_m2']
+            for nombre in ('rapida', 'lenta', 'x_ultimo'):
+                setattr(modelo, nombre, datos[nombre] if len(datos[nombre]) else None)
+        modelo.muestras = estado['muestras']
+        modelo.t_ultimo = estado['t_ultimo']
+        modelo.error_modelo = estado['error_modelo']
+        modelo.error_base = estado['error_base']
+        return modelo
+
+
+def entrenar_historico(rutas, modelo=None, interseccion=None, tam_bloque=100_000):
+    """
+    Entrena (o sigue entrenando) `modelo` con históricos CSV en el formato de
+    conteo_vehiculos.csv o de la exportación del dashboard, leídos por bloques
+    de `tam_bloque` filas: la memoria no depende del tamaño del archivo. Los
+    archivos deben estar en orden cronológico. Aplica la misma compuerta de
+    `intervalo` segundos que update_counts.
+    """
+    import pandas as pd
+    modelo = modelo or PredictorIncremental()
+    for ruta in [rutas] if isinstance(rutas, str) else rutas:
+        for bloque in pd.read_csv(ruta, chunksize=tam_bloque):
+            if 'interseccion' in bloque:
+                if interseccion is None:
+                    nombres = bloque['interseccion'].unique()
+                    if len(nombres) > 1:
+                        raise ValueError(f"{ruta} tiene varias intersecciones ({', '.join(map(str, nombres))}): "
+                                         "indica con cuál entrenar")
+                else:
+                    bloque = bloque[bloque['interseccion'] == interseccion]
+            # Hora local con datetime.timestamp(), como actualizar() en vivo: una instantánea
+            # entrenada aquí sigue aprendiendo en el dashboard sin desfase horario
+            momentos = [datetime.strptime(t, FORMATO_TIMESTAMP) for t in bloque['timestamp']]
+            conteos = bloque[list(DIRECCIONES)].to_numpy(np.float64)
+            X, Y = [], []
+            for i, momento in enumerate(momentos):
+                t = momento.timestamp()
+                if modelo.t_ultimo is not None and 0 <= t - modelo.t_ultimo < modelo.intervalo - TOLERANCIA_INTERVALO:
+                    continue
+                segundos_dia = momento.hour * 3600 + momento.minute * 60 + momento.second
+                x, objetivo = modelo._avanzar(conteos[i], t, segundos_dia, momento.weekday())
+                if objetivo is not None:
+                    X.append(modelo.x_ultimo)
+                    Y.append(objetivo)
+                modelo.x_ultimo = x
+            if X:
+                modelo.partial_fit(np.array(X), np.array(Y))
+    return modelo
+
+
+def crear_aprendizaje(config_aprendizaje=None):
+    """PredictorIncremental según visotraf_config.json (con su instantánea si existe), o None"""
+    if config_aprendizaje is None:
+        from src.configuracion import cargar_configuracion
+        config_aprendizaje = cargar_configuracion()['aprendizaje']
+    if not config_aprendizaje['activo']:
+        return None
+    ruta = config_aprendizaje['ruta_modelo']
+    if os.path.exists(ruta):
+        try:
+            return PredictorIncremental.cargar(ruta)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ No se pudo cargar {ruta} ({e}); se empieza un modelo nuevo")
+    return PredictorIncremental(tasa=config_aprendizaje['tasa'], min_muestras=config_aprendizaje['min_muestras'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena el pronóstico de flujo con históricos CSV")
+    parser.add_argument("historicos", nargs="+")
+    parser.add_argument("--interseccion", default=None)
+    parser.add_argument("--modelo", default=None, help="Instantánea .npz (por defecto la de la configuración)")
+    parser.add_argument("--desde-cero", action="store_true", help="Ignora la instantánea existente")
+    parser.add_argument("--tam-bloque", type=int, default=100_000)
+    args = parser.parse_args()
+
+    from src.configuracion import cargar_configuracion
+    config = cargar_configuracion()['aprendizaje']
+    ruta = args.modelo or config['ruta_modelo']
+    modelo = None
+    if os.path.exists(ruta) and not args.desde_cero:
+        modelo = PredictorIncremental.cargar(ruta)
+    else:
+        modelo = PredictorIncremental(tasa=config['tasa'], min_muestras=config['min_muestras'])
+    entrenar_historico(args.historicos, modelo, args.interseccion, args.tam_bloque)
+    modelo.guardar(ruta)
+    print(f"✅ {modelo.muestras} muestras entrenadas; instantánea en {ruta}")
@@ -0,0 +1,26 @@
+import threading
+import time
+
+# Referencia de tiempo: el momento en que se importó este módulo (lo antes posible en main.py)
+T0 = time.perf_counter()
+
+_marcas = []
+_lock = threading.Lock()
+
+
+def marcar(etapa):
+    """Registra cuánto tiempo ha pasado desde el arranque hasta `etapa`"""
+    with _lock:
+        _marcas.append((etapa, time.perf_counter() - T0))
+
+
+def informe_arranque():
+    """Devuelve el informe de tiempos de arranque como texto"""
+    with _lock:
+        marcas = list(_marcas)
+    lineas = ["⏱️ Tiempos de arranque:"]
+    anterior = 0.0
+    for etapa, t in marcas:
+        lineas.append(f"  {etapa:<28} {t * 1000:8.1f} ms  (+{(t - anterior) * 1000:.1f} ms)")
+        anterior = t
+    return "\n".join(lineas)
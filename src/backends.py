@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from itertools import islice
+
+import cv2
+
+from src.configuracion import cargar_configuracion
+from src.lectura_video import iterar_frames
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+
+def ruta_artefacto(pesos, backend, int8=False, imgsz=640, dir_cache="modelos_exportados"):
+    """Ruta en caché del modelo exportado (archivo .onnx o directorio OpenVINO IR)"""
+    base = os.path.splitext(os.path.basename(pesos))[0]
+    nombre = f"{base}_{imgsz}{'_int8' if int8 else ''}"
+    if backend == 'onnx':
+        return os.path.join(dir_cache, nombre + ".onnx")
+    if backend == 'openvino':
+        return os.path.join(dir_cache, nombre + "_openvino_model")
+    raise ValueError(f"Backend sin artefacto exportable: {backend}")
+
+
+def extraer_frames_calibracion(videos, n_frames, destino):
+    """
+    Toma `n_frames` frames repartidos entre `videos` y los guarda como JPG
+    en `destino/images`. Devuelve la lista de rutas.
+    """
+    if not videos:
+        raise ValueError("La cuantización INT8 necesita al menos un video de calibración")
+    carpeta = os.path.join(destino, "images")
+    os.makedirs(carpeta, exist_ok=True)
+    por_video = max(1, n_frames // len(videos))
+    rutas = []
+    for i, video in enumerate(videos):
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        salto = max(1, total // por_video) if total > 0 else 30
+        for j, (_, frame) in enumerate(iterar_frames(video, salto, modo='seek' if total > 0 else 'grab')):
+            if j >= por_video:
+                break
+            ruta = os.path.join(carpeta, f"v{i}_{j:05d}.jpg")
+            cv2.imwrite(ruta, frame)
+            rutas.append(ruta)
+    return rutas
+
+
+def _preprocesar(frame, imgsz):
+    # Letterbox equivalente al de ultralytics: resize manteniendo aspecto y relleno gris
+    import numpy as np
+    h, w = frame.shape[:2]
+    escala = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * escala)), int(round(w * escala))
+    lienzo = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    arriba, izquierda = (imgsz - nh) // 2, (imgsz - nw) // 2
+    lienzo[arriba:arriba + nh, izquierda:izquierda + nw] = cv2.resize(frame, (nw, nh))
+    tensor = cv2.cvtColor(lienzo, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+
+
+def _cuantizar_onnx(ruta_fp32, ruta_int8, imagenes, imgsz):
+    try:
+        from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                              quantize_static)
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("La cuantización ONNX requiere onnxruntime: pip install onnxruntime") from e
+
+    nombre_entrada = ort.InferenceSession(ruta_fp32, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class _LectorCalibracion(CalibrationDataReader):
+        def __init__(self):
+            self.rutas = iter(imagenes)
+
+        def get_next(self):
+            ruta = next(self.rutas, None)
+            if ruta is None:
+                return None
+            return {nombre_entrada: _preprocesar(cv2.imread(ruta), imgsz)}
+
+    quantize_static(ruta_fp32, ruta_int8, _LectorCalibracion(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def exportar_modelo(pesos, backend, int8=False, imgsz=640, dir_cache="modelos_exportados",
+                    videos_calibracion=(), frames_calibracion=300):
+    """
+    Exporta `pesos` a ONNX u OpenVINO IR (opcionalmente INT8) una sola vez y
+    devuelve la ruta del artefacto en caché. Si ya existe, no se vuelve a exportar.
+
+    La calibración INT8 usa frames de `videos_calibracion` (nuestros propios videos).
+    """
+    if backend == 'pytorch':
+        return pesos
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (usa uno de {BACKENDS})")
+
+    destino = ruta_artefacto(pesos, backend, int8, imgsz, dir_cache)
+    if os.path.exists(destino):
+        return destino
+    os.makedirs(dir_cache, exist_ok=True)
+
+    from ultralytics import YOLO
+    modelo = YOLO(pesos)
+    dir_calibracion = os.path.join(dir_cache, "calibracion")
+
+    if backend == 'onnx':
+        exportado = modelo.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            imagenes = extraer_frames_calibracion(list(videos_calibracion), frames_calibracion, dir_calibracion)
+            _cuantizar_onnx(exportado, destino, imagenes, imgsz)
+            os.remove(exportado)
+        else:
+            shutil.move(exportado, destino)
+    else:
+        opciones = {'format': 'openvino', 'imgsz': imgsz, 'dynamic': True}
+        if int8:
+            extraer_frames_calibracion(list(videos_calibracion), frames_calibracion, dir_calibracion)
+            # ultralytics calibra con un dataset YAML; JSON es YAML válido
+            ruta_yaml = os.path.join(dir_calibracion, "calibracion.yaml")
+            with open(ruta_yaml, 'w', encoding='utf-8') as f:
+                json.dump({'path': os.path.abspath(dir_calibracion), 'train': 'images',
+                           'val': 'images', 'names': modelo.names}, f)
+            opciones.update(int8=True, data=ruta_yaml)
+        exportado = modelo.export(**opciones)
+        shutil.move(exportado, destino)
+    print(f"✅ Modelo exportado a: {destino}")
+    return destino
+
+
+def preparar_backend(config_modelo=None):
+    """Devuelve la ruta de pesos a cargar con YOLO() según la configuración"""
+    if config_modelo is None:
+        config_modelo = cargar_configuracion()['modelo']
+    return exportar_modelo(
+        config_modelo['pesos'], config_modelo['backend'], config_modelo['int8'],
+        config_modelo['imgsz'], config_modelo['dir_cache'],
+        config_modelo['videos_calibracion'], config_modelo['frames_calibracion']
+    )
+
+
+def comparar_backends(video, variantes=None, salto_frames=30, max_frames=200, conf=0.4):
+    """
+    Compara velocidad y acuerdo de conteo de varios backends frente a PyTorch.
+
+    Parameters:
+    -----------
+    variantes : list de (backend, int8)
+        Por defecto ONNX y OpenVINO, en FP32 e INT8.
+
+    Returns:
+    --------
+    Lista de dicts con ms por frame, aceleración y acuerdo de conteos
+    respecto a PyTorch (error absoluto medio y % de frames con igual conteo).
+    """
+    from ultralytics import YOLO
+    from src.detecciones import Detecciones
+    from src.vision_vehicular import ids_vehiculo
+
+    config_modelo = dict(cargar_configuracion()['modelo'])
+    if variantes is None:
+        variantes = [(b, q) for b in ('onnx', 'openvino') for q in (False, True)]
+    if not config_modelo['videos_calibracion']:
+        config_modelo['videos_calibracion'] = [video]
+
+    frames = [frame for _, frame in islice(iterar_frames(video, salto_frames), max_frames)]
+    if not frames:
+        raise ValueError(f"No se pudieron leer frames de {video}")
+
+    def _medir(ruta):
+        modelo = YOLO(ruta, task='detect')
+        ids_clase = ids_vehiculo(modelo)
+        modelo(frames[0], conf=conf, verbose=False)  # Precalentamiento
+        conteos = []
+        t0 = time.perf_counter()
+        for frame in frames:
+            r = modelo(frame, conf=conf, classes=ids_clase, verbose=False)[0]
+            conteos.append(len(Detecciones.desde_resultado(r, ids_clase)))
+        return (time.perf_counter() - t0) * 1000 / len(frames), conteos
+
+    ms_base, conteos_base = _medir(config_modelo['pesos'])
+    filas = [{'backend': 'pytorch', 'int8': False, 'ms_por_frame': round(ms_base, 2),
+              'aceleracion': 1.0, 'error_conteo': 0.0, 'acuerdo': 100.0}]
+    for backend, int8 in variantes:
+        ruta = exportar_modelo(config_modelo['pesos'], backend, int8, config_modelo['imgsz'],
+                               config_modelo['dir_cache'], config_modelo['videos_calibracion'],
+                               config_modelo['frames_calibracion'])
+        ms, conteos = _medir(ruta)
+        diferencias = [abs(a - b) for a, b in zip(conteos, conteos_base)]
+        filas.append({
+            'backend': backend, 'int8': int8, 'ms_por_frame': round(ms, 2),
+            'aceleracion': round(ms_base / ms, 2),
+            'error_conteo': round(sum(diferencias) / len(diferencias), 3),
+            'acuerdo': round(100 * sum(d == 0 for d in diferencias) / len(diferencias), 1),
+        })
+
+    print(f"{'backend':<10}{'int8':<6}{'ms/frame':>10}{'x':>7}{'err':>8}{'acuerdo%':>10}")
+    for f in filas:
+        print(f"{f['backend']:<10}{str(f['int8']):<6}{f['ms_por_frame']:>10}{f['aceleracion']:>7}"
+              f"{f['error_conteo']:>8}{f['acuerdo']:>10}")
+    return filas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta y compara backends de inferencia en CPU")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("exportar", help="Exporta el modelo según visotraf_config.json")
+    p_cmp = sub.add_parser("comparar", help="Compara velocidad y conteos frente a PyTorch")
+    p_cmp.add_argument("video")
+    p_cmp.add_argument("--salto-frames", type=int, default=30)
+    p_cmp.add_argument("--max-frames", type=int, default=200)
+    args = parser.parse_args()
+    if args.comando == "exportar":
+        preparar_backend()
+    else:
+        comparar_backends(args.video, salto_frames=args.salto_frames, max_frames=args.max_frames)
@@ -0,0 +1,395 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from src.almacenamiento import DIRECCIONES
+
+# Vehículos simultáneos en escena por nivel de densidad
+DENSIDADES = {'baja': 4, 'media': 12, 'alta': 32}
+RESOLUCIONES = ('640x360', '1280x720', '1920x1080')
+DETECTORES = ('fijo', 'real')
+# Subconjunto de las clases COCO de YOLO con los mismos ids
+NOMBRES = {0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
+# Tamaño (largo, ancho) en píxeles a 640 de ancho, clase y proporción de cada tipo de vehículo
+TIPOS = ((36, 18, 2, 0.7), (16, 8, 3, 0.1), (72, 22, 5, 0.1), (56, 24, 7, 0.1))
+COLORES = ((0, 0, 220), (220, 40, 0), (0, 190, 0), (0, 210, 230), (200, 0, 200), (0, 140, 255))
+FPS_VIDEO = 25
+
+
+def _resolucion(texto):
+    ancho, alto = texto.lower().split('x')
+    return int(ancho), int(alto)
+
+
+def _escena(ancho, alto):
+    # Fondo gris con una calle horizontal y otra vertical y sus marcas (todo sin saturación)
+    fondo = np.full((alto, ancho, 3), 110, np.uint8)
+    media_h, media_v = alto // 8, ancho // 10
+    cy, cx = alto // 2, ancho // 2
+    fondo[cy - media_h:cy + media_h] = 60
+    fondo[:, cx - media_v:cx + media_v] = 60
+    grosor = max(1, ancho // 320)
+    for x in range(0, ancho, ancho // 16):
+        cv2.line(fondo, (x, cy), (x + ancho // 40, cy), (230, 230, 230), grosor)
+    for y in range(0, alto, alto // 9):
+        cv2.line(fondo, (cx, y), (cx, y + alto // 25), (230, 230, 230), grosor)
+    return fondo, (cy, media_h, cx, media_v)
+
+
+def generar_video(ruta, ancho, alto, vehiculos, segundos=8, semilla=0):
+    """
+    Genera un video sintético de una intersección: dos calles perpendiculares
+    con `vehiculos` rectángulos de colores saturados circulando por sus
+    carriles a velocidad constante. Con la misma semilla el video es idéntico.
+    """
+    rng = np.random.default_rng(semilla)
+    fondo, (cy, media_h, cx, media_v) = _escena(ancho, alto)
+    escala = ancho / 640
+    probabilidades = np.array([t[3] for t in TIPOS])
+    tipos = rng.choice(len(TIPOS), size=vehiculos, p=probabilidades / probabilidades.sum())
+    horizontal = rng.random(vehiculos) < 0.5
+    sentido = np.where(rng.random(vehiculos) < 0.5, 1, -1)
+    # Carril: a cada lado de la línea central según el sentido
+    desvio = np.where(horizontal, media_h, media_v) * np.where(rng.random(vehiculos) < 0.5, 0.3, 0.7)
+    carril = np.where(horizontal, cy + sentido * desvio, cx - sentido * desvio)
+    recorrido = np.where(horizontal, ancho, alto) + 160 * escala
+    velocidad = rng.uniform(2.0, 6.0, vehiculos) * escala
+    inicio = rng.uniform(0, 1, vehiculos) * recorrido
+    colores = rng.integers(len(COLORES), size=vehiculos)
+
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*'mp4v'), FPS_VIDEO, (ancho, alto))
+    if not escritor.isOpened():
+        raise IOError(f"No se pudo crear el video: {ruta}")
+    try:
+        for n in range(int(segundos * FPS_VIDEO)):
+            frame = fondo.copy()
+            avance = (inicio + velocidad * n) % recorrido - 80 * escala
+            for i in range(vehiculos):
+                largo, ancho_v = TIPOS[tipos[i]][0] * escala / 2, TIPOS[tipos[i]][1] * escala / 2
+                pos = avance[i] if sentido[i] > 0 else recorrido[i] - 160 * escala - avance[i]
+                if horizontal[i]:
+                    p1, p2 = (pos - largo, carril[i] - ancho_v), (pos + largo, carril[i] + ancho_v)
+                else:
+                    p1, p2 = (carril[i] - ancho_v, pos - largo), (carril[i] + ancho_v, pos + largo)
+                cv2.rectangle(frame, (int(p1[0]), int(p1[1])), (int(p2[0]), int(p2[1])),
+                              COLORES[colores[i]], -1)
+            escritor.write(frame)
+    finally:
+        escritor.release()
+    return ruta
+
+
+def linea_sintetica(ancho, alto):
+    """Línea de detención sobre el acceso oeste de la calle horizontal (p1, p2)"""
+    cy, media_h = alto // 2, alto // 8
+    x = int(ancho * 0.3)
+    return [x, cy - media_h], [x, cy + media_h]
+
+
+class _Cajas:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class _Resultado:
+    __slots__ = ('boxes', 'names')
+
+    def __init__(self, data, names):
+        self.boxes = _Cajas(data)
+        self.names = names
+
+
+class DetectorFijo:
+    """
+    Detector determinista sin red neuronal para medir el resto del pipeline
+    sin GPU ni pesos: cada mancha de color saturado es un vehículo, clasificado
+    por su área y proporción. Tiene la interfaz de un modelo de ultralytics
+    (`names` y `modelo(frame, conf=, classes=, verbose=)`), así que se puede
+    pasar como `modelo` a procesar_video.
+
+    Parameters:
+    -----------
+    umbral_saturacion : int
+        Saturación HSV mínima de un píxel de vehículo.
+    area_min : float
+        Área mínima de una mancha como fracción del frame.
+    espera_ms : float
+        Latencia fija añadida a cada llamada (simula el costo de un acelerador).
+    """
+
+    names = NOMBRES
+
+    def __init__(self, umbral_saturacion=80, area_min=0.0002, espera_ms=0.0):
+        self.umbral_saturacion = umbral_saturacion
+        self.area_min = area_min
+        self.espera_ms = espera_ms
+
+    def __call__(self, frame, conf=0.25, classes=None, verbose=False, **opciones):
+        alto, ancho = frame.shape[:2]
+        saturacion = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)[:, :, 1]
+        mascara = (saturacion > self.umbral_saturacion).view(np.uint8)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mascara, connectivity=8)
+        stats = stats[1:]
+        stats = stats[stats[:, 4] >= self.area_min * alto * ancho]
+        x, y, w, h = (stats[:, i].astype(np.float32) for i in range(4))
+        # Umbrales entre los tamaños de TIPOS, con el área llevada a un frame de 640 de ancho
+        area = stats[:, 4] * (640 / ancho) ** 2
+        proporcion = np.maximum(w, h) / np.maximum(np.minimum(w, h), 1)
+        clases = np.where(area < 280, 3, np.where(area < 1000, 2, np.where(proporcion > 2.8, 5, 7)))
+        # Manchas cortadas por el borde: vehículo a medio entrar, menos confianza
+        borde = (x <= 0) | (y <= 0) | (x + w >= ancho) | (y + h >= alto)
+        confianzas = np.where(borde, 0.5, 0.9).astype(np.float32)
+        datos = np.stack([x, y, x + w, y + h, confianzas, clases.astype(np.float32)], axis=1)
+        mascara = confianzas >= conf
+        if classes is not None:
+            mascara &= np.isin(clases, classes)
+        if self.espera_ms:
+            time.sleep(self.espera_ms / 1000)
+        return [_Resultado(datos[mascara].reshape(-1, 6), self.names)]
+
+
+def _resumen(segundos):
+    tiempos = np.asarray(segundos) * 1000
+    if not len(tiempos):
+        return {'n': 0, 'media_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'fps': 0.0}
+    media = float(tiempos.mean())
+    return {'n': len(tiempos), 'media_ms': media, 'p50_ms': float(np.percentile(tiempos, 50)),
+            'p95_ms': float(np.percentile(tiempos, 95)), 'fps': 1000 / media if media else 0.0}
+
+
+def medir_etapas(video, detector, muestras=30, calentamiento=3):
+    """
+    Tiempos por frame de cada etapa aislada: decodificación (todo el video),
+    inferencia y postproceso (Detecciones, seguimiento y línea) sobre los
+    primeros `muestras` frames ya decodificados en memoria.
+    """
+    from src.detecciones import Detecciones
+    from src.lectura_video import iterar_frames
+    from src.seguimiento import ContadorLinea, Seguidor
+    from src.vision_vehicular import ids_vehiculo
+
+    tiempos, frames = [], []
+    iterador = iter(iterar_frames(video))
+    while True:
+        t0 = time.perf_counter()
+        siguiente = next(iterador, None)
+        if siguiente is None:
+            break
+        tiempos.append(time.perf_counter() - t0)
+        if len(frames) < muestras + calentamiento:
+            frames.append(siguiente[1])
+    if not frames:
+        raise IOError(f"No se pudo leer el video: {video}")
+    etapas = {'decodificacion': _resumen(tiempos)}
+
+    ids = ids_vehiculo(detector)
+    for frame in frames[:calentamiento]:
+        detector(frame, conf=0.4, classes=ids, verbose=False)
+    tiempos, resultados = [], []
+    for frame in frames[calentamiento:]:
+        t0 = time.perf_counter()
+        resultados.append(detector(frame, conf=0.4, classes=ids, verbose=False)[0])
+        tiempos.append(time.perf_counter() - t0)
+    etapas['inferencia'] = _resumen(tiempos)
+
+    alto, ancho = frames[0].shape[:2]
+    seguidor, linea = Seguidor(), ContadorLinea(*linea_sintetica(ancho, alto))
+    tiempos, vehiculos = [], []
+    for n, resultado in enumerate(resultados):
+        t0 = time.perf_counter()
+        detecciones = Detecciones.desde_resultado(resultado).filtrar_clases(ids, 0.4)
+        linea.actualizar(*seguidor.actualizar(detecciones, n / FPS_VIDEO))
+        tiempos.append(time.perf_counter() - t0)
+        vehiculos.append(len(detecciones))
+    etapas['postproceso'] = _resumen(tiempos)
+    return etapas, {'vehiculos_medios': float(np.mean(vehiculos)) if vehiculos else 0.0}
+
+
+def medir_extremo_a_extremo(video, detector):
+    """procesar_video completo (sin saltar frames, con línea de conteo) sobre el detector dado"""
+    from src.seguimiento import ContadorLinea
+    from src.vision_vehicular import procesar_video
+
+    cap = cv2.VideoCapture(video)
+    ancho, alto = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    linea = ContadorLinea(*linea_sintetica(ancho, alto))
+    with tempfile.TemporaryDirectory() as directorio:
+        t0 = time.perf_counter()
+        resumen = procesar_video(video, os.path.join(directorio, "conteo.csv"), salto_frames=1,
+                                 reanudar=False, devolver_df=False, linea=linea, modelo=detector)
+        segundos = time.perf_counter() - t0
+    frames = resumen['frames_procesados']
+    return {'n': frames, 'segundos': segundos, 'fps': frames / segundos if segundos else 0.0,
+            'cruces': linea.total}
+
+
+def medir_prediccion(muestras=200):
+    """Tiempo de predict_green_times por intervalo, en modo proporcional y óptimo"""
+    from src.prediccion_AI import MODOS, TrafficPredictor
+
+    rng = np.random.default_rng(0)
+    conteos = rng.integers(0, 30, size=(muestras, len(DIRECCIONES)))
+    inicio = datetime(2024, 1, 1, 7)
+    etapas = {}
+    for modo in MODOS:
+        predictor = TrafficPredictor(modo=modo)
+        tiempos = []
+        for n, fila in enumerate(conteos):
+            t0 = time.perf_counter()
+            predictor.predict_green_times(dict(zip(DIRECCIONES, fila.tolist())),
+                                          timestamp=inicio + timedelta(seconds=10 * n))
+            tiempos.append(time.perf_counter() - t0)
+        etapas['prediccion' if modo == 'proporcional' else f'prediccion_{modo}'] = _resumen(tiempos)
+    return etapas
+
+
+def crear_detector(nombre):
+    """'fijo' (DetectorFijo) o 'real' (el YOLO configurado); None si el real no está disponible"""
+    if nombre == 'fijo':
+        return DetectorFijo()
+    from src.vision_vehicular import obtener_modelo
+    try:
+        return obtener_modelo()
+    except ImportError as e:
+        print(f"⚠️ Detector real no disponible ({e}); se omite")
+        return None
+
+
+def ejecutar(resoluciones=RESOLUCIONES, densidades=tuple(DENSIDADES), detectores=DETECTORES, segundos=8,
+             muestras=30, directorio_videos="videos_benchmark", semilla=0):
+    """
+    Recorre la matriz detector x resolución x densidad y devuelve el informe
+    (dict serializable a JSON). Los videos sintéticos se generan una vez en
+    `directorio_videos` y se reutilizan mientras no cambien sus parámetros.
+    """
+    os.makedirs(directorio_videos, exist_ok=True)
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'maquina': {'plataforma': platform.platform(), 'procesador': platform.processor(),
+                    'nucleos': os.cpu_count(), 'python': platform.python_version(),
+                    'opencv': cv2.__version__, 'numpy': np.__version__},
+        'parametros': {'segundos': segundos, 'muestras': muestras, 'semilla': semilla},
+        'prediccion': medir_prediccion(),
+        'resultados': [],
+    }
+    for nombre in detectores:
+        detector = crear_detector(nombre)
+        if detector is None:
+            continue
+        for resolucion in resoluciones:
+            ancho, alto = _resolucion(resolucion)
+            for densidad in densidades:
+                video = os.path.join(directorio_videos, f"sintetico_{resolucion}_{densidad}_{segundos}s_{semilla}.mp4")
+                if not os.path.exists(video):
+                    generar_video(video, ancho, alto, DENSIDADES[densidad], segundos, semilla)
+                etapas, extra = medir_etapas(video, detector, muestras)
+                etapas['extremo_a_extremo'] = medir_extremo_a_extremo(video, detector)
+                informe['resultados'].append({'detector': nombre, 'resolucion': resolucion,
+                                              'densidad': densidad, 'etapas': etapas, **extra})
+                print(f"⏱️ {nombre} {resolucion} {densidad}: " + ", ".join(
+                    f"{etapa} {datos['fps']:.1f} fps" for etapa, datos in etapas.items()))
+    return informe
+
+
+def _series(informe):
+    # (detector, resolución, densidad, etapa) -> métricas
+    series = {('-', '-', '-', etapa): datos for etapa, datos in informe.get('prediccion', {}).items()}
+    for r in informe['resultados']:
+        for etapa, datos in r['etapas'].items():
+            series[(r['detector'], r['resolucion'], r['densidad'], etapa)] = datos
+    return series
+
+
+def comparar(actual, base, tolerancia=0.15):
+    """
+    Compara el rendimiento (fps) de cada serie común a ambos informes.
+    Devuelve las regresiones: series cuyo rendimiento bajó más de
+    `tolerancia`, y con el detector fijo, las que cambiaron su conteo de
+    cruces (el resultado debe ser idéntico).
+    """
+    regresiones = []
+    series_base = _series(base)
+    for clave, datos in _series(actual).items():
+        anterior = series_base.get(clave)
+        if anterior is None:
+            continue
+        cambio = datos['fps'] / anterior['fps'] - 1 if anterior['fps'] else 0.0
+        if cambio < -tolerancia:
+            regresiones.append({'serie': "/".join(clave), 'base_fps': anterior['fps'], 'fps': datos['fps'],
+                                'cambio': cambio})
+        if clave[0] == 'fijo' and 'cruces' in datos and datos['cruces'] != anterior.get('cruces'):
+            regresiones.append({'serie': "/".join(clave), 'base_cruces': anterior.get('cruces'),
+                                'cruces': datos['cruces'], 'cambio': None})
+    return regresiones
+
+
+def _informar(regresiones, tolerancia):
+    if not regresiones:
+        print(f"✅ Sin regresiones (tolerancia {tolerancia:.0%})")
+        return 0
+    for r in regresiones:
+        if r['cambio'] is None:
+            print(f"❌ {r['serie']}: cruces {r['base_cruces']} -> {r['cruces']}")
+        else:
+            print(f"❌ {r['serie']}: {r['base_fps']:.1f} -> {r['fps']:.1f} fps ({r['cambio']:+.1%})")
+    return 1
+
+
+def _guardar(informe, ruta):
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _cargar(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de VISOTRAF con videos sintéticos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_eje = sub.add_parser("ejecutar", help="Mide las etapas y procesar_video completo")
+    p_eje.add_argument("--detector", nargs="+", choices=DETECTORES, default=['fijo'])
+    p_eje.add_argument("--resoluciones", nargs="+", default=list(RESOLUCIONES), metavar="ANCHOxALTO")
+    p_eje.add_argument("--densidades", nargs="+", choices=tuple(DENSIDADES), default=list(DENSIDADES))
+    p_eje.add_argument("--segundos", type=float, default=8)
+    p_eje.add_argument("--muestras", type=int, default=30, help="Frames en memoria por etapa aislada")
+    p_eje.add_argument("--videos", default="videos_benchmark", help="Directorio de videos sintéticos")
+    p_eje.add_argument("--salida", default="benchmark.json")
+    p_eje.add_argument("--base", default=None, help="Informe base con el que comparar")
+    p_eje.add_argument("--tolerancia", type=float, default=0.15)
+    p_eje.add_argument("--guardar-base", action="store_true", help="Guarda también el informe como base")
+    p_com = sub.add_parser("comparar", help="Compara dos informes ya guardados")
+    p_com.add_argument("actual")
+    p_com.add_argument("base")
+    p_com.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    if args.comando == "comparar":
+        return _informar(comparar(_cargar(args.actual), _cargar(args.base), args.tolerancia), args.tolerancia)
+    informe = ejecutar(args.resoluciones, args.densidades, args.detector, args.segundos, args.muestras,
+                       args.videos)
+    _guardar(informe, args.salida)
+    print(f"📄 Informe: {args.salida}")
+    if args.guardar_base:
+        _guardar(informe, args.base or "benchmark_base.json")
+        return 0
+    if args.base:
+        return _informar(comparar(informe, _cargar(args.base), args.tolerancia), args.tolerancia)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
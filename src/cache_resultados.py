@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from src.detecciones import Detecciones
+
+_ESQUEMA = (
+    """CREATE TABLE IF NOT EXISTS entradas (
+        clave TEXT PRIMARY KEY,
+        video_hash TEXT NOT NULL,
+        modelo_hash TEXT NOT NULL,
+        muestreo TEXT NOT NULL,
+        conf_base REAL NOT NULL,
+        nombres TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        ultimo_acceso REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_busqueda ON entradas (video_hash, modelo_hash, muestreo)",
+    "CREATE INDEX IF NOT EXISTS idx_lru ON entradas (ultimo_acceso)",
+    # Memo de hashes de contenido: evita releer el archivo si no cambió
+    """CREATE TABLE IF NOT EXISTS hashes (
+        ruta TEXT PRIMARY KEY, tamano INTEGER, mtime_ns INTEGER, sha256 TEXT
+    )""",
+)
+
+
+class EntradaCache:
+    """
+    Detecciones en caché de un video: todas las clases con conf >= conf_base.
+
+    `frames` (F,) son los frames muestreados y `det` (N, 7) las detecciones
+    [frame, x1, y1, x2, y2, conf, clase], ambos mapeados desde disco.
+    """
+
+    def __init__(self, frames, det, nombres, conf_base):
+        self.frames = frames
+        self.det = det
+        self.nombres = nombres
+        self.conf_base = conf_base
+
+    def contar(self, conf, ids_clase):
+        """Conteo por frame con otro umbral/filtro de clases, sin inferir (vectorizado)"""
+        mascara = (self.det[:, 5] >= conf) & np.isin(self.det[:, 6].astype(np.int64), ids_clase)
+        indices = np.searchsorted(self.frames, self.det[mascara, 0].astype(np.int32))
+        return np.bincount(indices, minlength=len(self.frames))
+
+    def detecciones(self, frame):
+        """Detecciones (todas las clases) de un frame concreto"""
+        # Las filas se grabaron en orden de frame: búsqueda binaria en lugar de recorrerlas
+        inicio, fin = np.searchsorted(self.det[:, 0], [frame, frame + 1])
+        fila = self.det[inicio:fin]
+        return Detecciones(np.array(fila[:, 1:5]), fila[:, 6].astype(np.int64), np.array(fila[:, 5]), self.nombres)
+
+
+class GrabadorCache:
+    """Acumula en disco las detecciones de una ejecución; `confirmar()` las publica en la caché"""
+
+    def __init__(self, cache, clave, metadatos):
+        self.cache = cache
+        self.clave = clave
+        self.metadatos = metadatos
+        base = os.path.join(cache.directorio, clave)
+        self.ruta_frames, self.ruta_det = base + ".frames.tmp", base + ".det.tmp"
+        self.f_frames = open(self.ruta_frames, 'wb')
+        self.f_det = open(self.ruta_det, 'wb')
+
+    def agregar(self, frame, detecciones):
+        self.f_frames.write(np.int32(frame).tobytes())
+        if len(detecciones):
+            filas = np.empty((len(detecciones), 7), dtype=np.float32)
+            filas[:, 0] = frame
+            filas[:, 1:5] = detecciones.xyxy
+            filas[:, 5] = detecciones.confianzas
+            filas[:, 6] = detecciones.clases
+            self.f_det.write(filas.tobytes())
+
+    def confirmar(self):
+        self.f_frames.close()
+        self.f_det.close()
+        base = os.path.join(self.cache.directorio, self.clave)
+        os.replace(self.ruta_frames, base + ".frames")
+        os.replace(self.ruta_det, base + ".det")
+        self.cache._indexar(self.clave, self.metadatos,
+                            os.path.getsize(base + ".frames") + os.path.getsize(base + ".det"))
+
+    def descartar(self):
+        self.f_frames.close()
+        self.f_det.close()
+        for ruta in (self.ruta_frames, self.ruta_det):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+class CacheResultados:
+    """
+    Caché persistente de detecciones por frame, direccionada por contenido.
+
+    La clave combina el hash del contenido del video, el hash de los pesos,
+    los parámetros de muestreo y la confianza base de la inferencia. Se
+    guardan todas las clases con conf >= conf_base, así que cambiar solo el
+    filtro de clases o subir el umbral se recalcula desde la caché sin YOLO.
+    Al superar `max_bytes` se eliminan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, directorio="cache_resultados", max_bytes=2 * 1024 ** 3, conf_base=0.25):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.conf_base = conf_base
+        self.aciertos = 0
+        self.fallos = 0
+        os.makedirs(directorio, exist_ok=True)
+        conexion = self._conectar()
+        for sentencia in _ESQUEMA:
+            conexion.execute(sentencia)
+        conexion.commit()
+        conexion.close()
+
+    def _conectar(self):
+        return sqlite3.connect(os.path.join(self.directorio, "indice.sqlite"), timeout=30)
+
+    def hash_archivo(self, ruta, tam_bloque=1 << 20):
+        """sha256 del contenido, memorizado por (ruta, tamaño, mtime)"""
+        if not os.path.exists(ruta):
+            return hashlib.sha256(ruta.encode('utf-8')).hexdigest()
+        ruta = os.path.abspath(ruta)
+        estado = os.stat(ruta)
+        conexion = self._conectar()
+        try:
+            fila = conexion.execute("SELECT tamano, mtime_ns, sha256 FROM hashes WHERE ruta = ?",
+                                    (ruta,)).fetchone()
+            if fila and fila[0] == estado.st_size and fila[1] == estado.st_mtime_ns:
+                return fila[2]
+            h = hashlib.sha256()
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(tam_bloque), b''):
+                    h.update(bloque)
+            with conexion:
+                conexion.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                                 (ruta, estado.st_size, estado.st_mtime_ns, h.hexdigest()))
+            return h.hexdigest()
+        finally:
+            conexion.close()
+
+    def _identificar(self, video, pesos, muestreo):
+        return self.hash_archivo(video), self.hash_archivo(pesos), json.dumps(muestreo, sort_keys=True)
+
+    def buscar(self, video, pesos, muestreo, conf):
+        """Devuelve una EntradaCache compatible (conf_base <= conf) o None"""
+        video_hash, modelo_hash, muestreo_json = self._identificar(video, pesos, muestreo)
+        conexion = self._conectar()
+        try:
+            fila = conexion.execute(
+                "SELECT clave, nombres, conf_base FROM entradas WHERE video_hash = ? AND modelo_hash = ? "
+                "AND muestreo = ? AND conf_base <= ? ORDER BY conf_base DESC LIMIT 1",
+                (video_hash, modelo_hash, muestreo_json, conf)).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return None
+            clave, nombres, conf_base = fila
+            base = os.path.join(self.directorio, clave)
+            if not (os.path.exists(base + ".frames") and os.path.exists(base + ".det")):
+                with conexion:
+                    conexion.execute("DELETE FROM entradas WHERE clave = ?", (clave,))
+                self.fallos += 1
+                return None
+            with conexion:
+                conexion.execute("UPDATE entradas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave))
+        finally:
+            conexion.close()
+        self.aciertos += 1
+        frames = np.fromfile(base + ".frames", dtype=np.int32)
+        det = (np.memmap(base + ".det", dtype=np.float32, mode='r').reshape(-1, 7)
+               if os.path.getsize(base + ".det") else np.zeros((0, 7), np.float32))
+        nombres = {int(k): v for k, v in json.loads(nombres).items()}
+        return EntradaCache(frames, det, nombres, conf_base)
+
+    def nuevo_registro(self, video, pesos, muestreo, nombres):
+        """Crea un GrabadorCache para guardar las detecciones de una ejecución nueva"""
+        video_hash, modelo_hash, muestreo_json = self._identificar(video, pesos, muestreo)
+        clave = hashlib.sha256(
+            f"{video_hash}|{modelo_hash}|{muestreo_json}|{self.conf_base}".encode('utf-8')).hexdigest()[:32]
+        metadatos = (video_hash, modelo_hash, muestreo_json, self.conf_base, json.dumps(nombres))
+        return GrabadorCache(self, clave, metadatos)
+
+    def _indexar(self, clave, metadatos, tamano):
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.execute("INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (clave, *metadatos, tamano, time.time()))
+            self._desalojar(conexion)
+        finally:
+            conexion.close()
+
+    def _desalojar(self, conexion):
+        total = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM entradas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for clave, tamano in conexion.execute(
+                "SELECT clave, bytes FROM entradas ORDER BY ultimo_acceso").fetchall():
+            if total <= self.max_bytes:
+                break
+            for extension in (".frames", ".det"):
+                ruta = os.path.join(self.directorio, clave + extension)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            with conexion:
+                conexion.execute("DELETE FROM entradas WHERE clave = ?", (clave,))
+            total -= tamano
+
+    def informe(self):
+        """Aciertos/fallos de esta sesión y ocupación de la caché"""
+        conexion = self._conectar()
+        try:
+            entradas, total = conexion.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entradas").fetchone()
+        finally:
+            conexion.close()
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'entradas': entradas,
+            'megabytes': round(total / 1024 ** 2, 1),
+            'limite_megabytes': round(self.max_bytes / 1024 ** 2, 1),
+        }
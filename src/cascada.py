@@ -0,0 +1,164 @@
+import threading
+from collections import Counter
+
+import numpy as np
+
+from src.detecciones import Detecciones
+from src.seguimiento import emparejar, iou_matriz
+from src.vision_vehicular import obtener_modelo, ids_vehiculo
+
+MOTIVOS = ('confianza', 'cambio', 'auditoria')
+
+
+class DetectorCascada:
+    """
+    Cascada de dos modelos: el pequeño (nano) procesa todos los frames y el
+    grande (por defecto el modelo configurado) solo los que lo necesitan.
+
+    Un frame se escala al modelo grande si:
+    - 'confianza': el pequeño ve al menos `max_dudosas` vehículos con
+      confianza en la banda dudosa [conf_baja, conf_alta);
+    - 'cambio': su conteo difiere en `cambio_max` o más del último conteo
+      de la misma fuente;
+    - 'auditoria': cada `auditoria_cada` frames de una fuente, siempre.
+
+    En los frames escalados se mide el desacuerdo entre ambos modelos
+    (1 - F1 de las cajas emparejadas por IoU y diferencia de conteo), que
+    indica cuánto se pierde en los frames que no se escalan.
+
+    Parameters:
+    -----------
+    pesos_pequeno : str
+        Pesos del modelo barato.
+    pesos_grande : str, opcional
+        Pesos del modelo de referencia; por defecto el de obtener_modelo().
+    config_modelo : dict, opcional
+        Sección 'modelo' de la configuración: si se da, el modelo pequeño se
+        exporta al mismo backend (ONNX/OpenVINO) que el grande al cargarlo.
+    """
+
+    def __init__(self, pesos_pequeno="yolov8n.pt", pesos_grande=None, conf_baja=0.25, conf_alta=0.5,
+                 max_dudosas=1, cambio_max=3, auditoria_cada=30, iou_acuerdo=0.5, config_modelo=None):
+        self.pesos_pequeno = pesos_pequeno
+        self.pesos_grande = pesos_grande
+        self.config_modelo = config_modelo
+        self.conf_baja = conf_baja
+        self.conf_alta = conf_alta
+        self.max_dudosas = max_dudosas
+        self.cambio_max = cambio_max
+        self.auditoria_cada = auditoria_cada
+        self.iou_acuerdo = iou_acuerdo
+        self.pequeno = None
+        self.grande = None
+        self.ids_clase = None
+        self.lock = threading.Lock()
+        # Estado por fuente y estadísticas
+        self.ultimo_conteo = {}
+        self.frames_fuente = Counter()
+        self.frames = 0
+        self.motivos = Counter()
+        self.escalados = 0
+        self.suma_desacuerdo = 0.0
+        self.suma_dif_conteo = 0
+
+    def parametros(self):
+        """Identifican la configuración de la cascada (p. ej. para la caché de resultados)"""
+        backend = None if self.config_modelo is None else [self.config_modelo['backend'], self.config_modelo['int8']]
+        return {'pesos_pequeno': self.pesos_pequeno, 'pesos_grande': self.pesos_grande, 'backend': backend,
+                'conf_baja': self.conf_baja, 'conf_alta': self.conf_alta, 'max_dudosas': self.max_dudosas,
+                'cambio_max': self.cambio_max, 'auditoria_cada': self.auditoria_cada}
+
+    def _cargar(self):
+        # Se carga en la primera inferencia (la exportación puede tardar)
+        if self.grande is None:
+            pesos = self.pesos_pequeno
+            if self.config_modelo is not None:
+                from src.backends import preparar_backend
+                pesos = preparar_backend(dict(self.config_modelo, pesos=pesos))
+            self.pequeno = obtener_modelo(pesos)
+            self.grande = obtener_modelo(self.pesos_grande)
+            self.ids_clase = ids_vehiculo(self.grande)
+
+    def _motivo(self, fuente, detecciones):
+        conf = detecciones.confianzas
+        n = int(np.count_nonzero(conf >= self.conf_alta))
+        dudosas = int(np.count_nonzero((conf >= self.conf_baja) & (conf < self.conf_alta)))
+        if self.auditoria_cada and self.frames_fuente[fuente] % self.auditoria_cada == 0:
+            return 'auditoria'
+        if dudosas >= self.max_dudosas:
+            return 'confianza'
+        anterior = self.ultimo_conteo.get(fuente)
+        if anterior is not None and abs(n - anterior) >= self.cambio_max:
+            return 'cambio'
+        return None
+
+    def _desacuerdo(self, pequeno, grande):
+        total = len(pequeno) + len(grande)
+        if not total:
+            return 0.0
+        filas, _ = emparejar(iou_matriz(pequeno.xyxy, grande.xyxy), self.iou_acuerdo)
+        return 1.0 - 2 * len(filas) / total
+
+    def inferir_lote(self, frames, fuentes, conf=0.4, classes=None, imgsz=None):
+        """
+        Infiere una lista de frames (uno por `fuente`: dirección, video...) y
+        devuelve un `Results` de ultralytics por frame, del modelo grande en
+        los frames escalados y del pequeño en el resto. Los resultados del
+        pequeño incluyen detecciones desde `conf_baja`; filtra por `conf` al
+        convertirlos a Detecciones.
+        """
+        self._cargar()
+        opciones = {'classes': classes, 'verbose': False}
+        if imgsz is not None:
+            opciones['imgsz'] = imgsz
+        resultados = list(self.pequeno(frames, conf=min(conf, self.conf_baja), **opciones))
+        with self.lock:
+            vehiculos = [Detecciones.desde_resultado(r, self.ids_clase) for r in resultados]
+            motivos = [self._motivo(fuente, det) for fuente, det in zip(fuentes, vehiculos)]
+        escalar = [i for i, motivo in enumerate(motivos) if motivo is not None]
+        grandes = self.grande([frames[i] for i in escalar], conf=conf, **opciones) if escalar else []
+
+        with self.lock:
+            for i, resultado in zip(escalar, grandes):
+                referencia = Detecciones.desde_resultado(resultado, self.ids_clase)
+                pequeno = vehiculos[i].filtrar(vehiculos[i].confianzas >= conf)
+                self.suma_desacuerdo += self._desacuerdo(pequeno, referencia)
+                self.suma_dif_conteo += abs(len(pequeno) - len(referencia))
+                self.motivos[motivos[i]] += 1
+                resultados[i] = resultado
+                vehiculos[i] = referencia
+            for fuente, det in zip(fuentes, vehiculos):
+                # Al mismo umbral que _motivo, si no el 'cambio' mediría la diferencia entre umbrales
+                self.ultimo_conteo[fuente] = int(np.count_nonzero(det.confianzas >= self.conf_alta))
+                self.frames_fuente[fuente] += 1
+            self.frames += len(frames)
+            self.escalados += len(escalar)
+        return resultados
+
+    def estadisticas(self):
+        """Tasa de escalado (total y por motivo) y desacuerdo medio en los frames escalados"""
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'escalados': self.escalados,
+                'tasa_escalado': self.escalados / self.frames if self.frames else 0.0,
+                'motivos': {motivo: self.motivos[motivo] for motivo in MOTIVOS},
+                'desacuerdo_medio': self.suma_desacuerdo / self.escalados if self.escalados else 0.0,
+                'dif_conteo_media': self.suma_dif_conteo / self.escalados if self.escalados else 0.0,
+            }
+
+
+def crear_cascada(config_modelo=None, config_cascada=None):
+    """DetectorCascada según visotraf_config.json, o None si la cascada está desactivada"""
+    if config_modelo is None or config_cascada is None:
+        from src.configuracion import cargar_configuracion
+        config = cargar_configuracion()
+        config_modelo = config_modelo or config['modelo']
+        config_cascada = config_cascada or config['cascada']
+    if not config_cascada['activo']:
+        return None
+    return DetectorCascada(
+        config_cascada['pesos_pequeno'], None,
+        config_cascada['conf_baja'], config_cascada['conf_alta'], config_cascada['max_dudosas'],
+        config_cascada['cambio_max'], config_cascada['auditoria_cada'], config_modelo=config_modelo,
+    )
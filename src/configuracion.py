@@ -0,0 +1,177 @@
+import copy
+import json
+import os
+
+# Ruta del archivo de configuración (se puede cambiar con la variable de entorno)
+RUTA_CONFIG = os.environ.get("VISOTRAF_CONFIG", "visotraf_config.json")
+
+CONFIG_POR_DEFECTO = {
+    'modelo': {
+        'pesos': "yolov8m.pt",
+        # 'pytorch', 'onnx' u 'openvino'
+        'backend': 'pytorch',
+        'int8': False,
+        'imgsz': 640,
+        'dir_cache': "modelos_exportados",
+        # Videos propios de los que se toman frames para calibrar INT8
+        'videos_calibracion': [],
+        'frames_calibracion': 300,
+    },
+    'cascada': {
+        # Modelo nano en todos los frames; el modelo principal solo en los dudosos
+        'activo': False,
+        'pesos_pequeno': "yolov8n.pt",
+        # Banda de confianza dudosa del modelo pequeño
+        'conf_baja': 0.25,
+        'conf_alta': 0.5,
+        'max_dudosas': 1,
+        # Cambio de conteo respecto al frame anterior que obliga a escalar
+        'cambio_max': 3,
+        # Cada cuántos frames por fuente se audita con el modelo principal
+        'auditoria_cada': 30,
+    },
+    'planificador': {
+        # Reparte la inferencia entre accesos según fase, volatilidad y antigüedad (opcional:
+        # sin activarlo cada acceso infiere a su ritmo, como hasta ahora)
+        'activo': False,
+        # Fracción del tiempo que puede ocupar la inferencia
+        'presupuesto_cpu': 0.6,
+        # Segundos máximos sin medir un acceso
+        'max_antiguedad': 5.0,
+        'tasa_min': 0.2,
+        # Hilos de torch (null: núcleos - 2)
+        'hilos_torch': None,
+    },
+    'movimiento': {
+        # Omite YOLO cuando la escena no cambia y reutiliza el último conteo (opcional:
+        # sin activarlo cada frame muestreado se infiere, como hasta ahora)
+        'activo': False,
+        # Fracción de píxeles cambiados; puede ser un número o un dict por dirección
+        'sensibilidad': {'defecto': 0.01, 'Norte': 0.01, 'Sur': 0.01, 'Este': 0.01, 'Oeste': 0.01},
+        'umbral_pixel': 25,
+        'ancho': 160,
+        # Segundos máximos sin inferir antes de forzar un refresco completo
+        'refresco_max': 30.0,
+    },
+    'roi': {
+        # Polígonos por intersección y dirección (se editan desde el dashboard)
+        'archivo': "rois.json",
+        'imgsz_min': 320,
+    },
+    'seguimiento': {
+        # Líneas de detención por intersección y dirección (se editan desde el dashboard)
+        'archivo_lineas': "lineas.json",
+        'umbral_alto': 0.5,
+        'umbral_bajo': 0.25,
+        'iou_min': 0.2,
+        # Segundos que una pista se extrapola sin detección antes de eliminarse
+        'max_edad': 1.5,
+        'min_impactos': 2,
+    },
+    'prediccion': {
+        # 'proporcional' (regla original) u 'optimo' (mínima demora en el simulador de colas)
+        'modo': 'proporcional',
+        # veh/h de verde por carril y carriles por dirección (Norte, Sur, Este, Oeste)
+        'saturacion_carril': 1800,
+        'carriles': [2, 2, 2, 2],
+        # Resolución en segundos de los repartos de verde evaluados
+        'paso_optimo': 2,
+    },
+    'procesos': {
+        # Captura e inferencia de cada cámara en un proceso propio (memoria compartida con la GUI)
+        'activo': False,
+        'ranuras': 4,
+        'max_detecciones': 256,
+        # Reinicios automáticos de un trabajador caído y segundos sin latido para darlo por colgado
+        'max_reinicios': 5,
+        'latido_max': 10.0,
+        # Hilos de torch por proceso; por defecto núcleos / 4
+        'hilos_torch': None,
+    },
+    'servicio': {
+        # Servicio sin interfaz (python main.py servicio): fuentes por acceso y API local
+        'interseccion': "sin_nombre",
+        'fuentes': {'Norte': "", 'Sur': "", 'Este': "", 'Oeste': ""},
+        'intervalo': 10.0,
+        'periodo_conteos': 1.0,
+        'socket': "/tmp/visotraf.sock",
+        'host': "127.0.0.1",
+        # Puertos TCP (líneas JSON) y WebSocket; None los desactiva
+        'puerto': None,
+        'puerto_websocket': None,
+        # Un cliente que tarda más en aceptar un mensaje se desconecta
+        'timeout_envio': 5.0,
+    },
+    'aprendizaje': {
+        # Pronóstico de flujo aprendido en línea (src.aprendizaje); sin él, media del último minuto
+        'activo': False,
+        'ruta_modelo': "modelo_flujo.npz",
+        'tasa': 0.05,
+        # Conteos entrenados antes de usar el pronóstico
+        'min_muestras': 60,
+        # Cada cuántas predicciones se guarda la instantánea (y siempre al cerrar)
+        'guardar_cada': 30,
+    },
+    'almacenamiento': {
+        # Base SQLite (WAL) con la serie temporal de conteos por intersección
+        'ruta': "conteos.sqlite",
+        # CSV histórico anterior: se importa una sola vez (la base anota cuándo terminó)
+        'csv_legado': "conteo_vehiculos.csv",
+        # Intersección a la que pertenecen sus filas; "sin_nombre" es la del tablero sin nombre
+        'interseccion_legado': "sin_nombre",
+    },
+    'tablero': {
+        # Intersecciones del dashboard: [{"nombre": ..., "fuentes": {"Norte": ..., "Este": ...}}], cada
+        # una en su rejilla 2x2. Vacío: una sola con los cuatro accesos y el nombre del campo de texto
+        'intersecciones': [],
+        # Intersecciones por fila; 0 = raíz cuadrada de su número
+        'columnas': 0,
+        # Reloj de refresco único para todas las vistas
+        'periodo_render_ms': 40,
+        # Con más cámaras que max_completas, las vistas sin foco son miniaturas (clic para enfocar)
+        'max_completas': 4,
+        'periodo_miniatura_ms': 500,
+        'escala_miniatura': 0.4,
+    },
+    'metricas': {
+        # Tiempos por etapa (p50/p95/p99), FPS y descartes por acceso (src.metricas);
+        # desactivadas, cada punto de medida es una llamada vacía
+        'activo': False,
+        # Endpoint de texto de Prometheus en http://host:puerto/metrics; None lo desactiva
+        'puerto': 9108,
+        'host': "127.0.0.1",
+        # Traza JSONL con una instantánea cada periodo_traza segundos; None la desactiva
+        'traza': None,
+        'periodo_traza': 10.0,
+    },
+}
+
+
+def _fusionar(base, cambios):
+    for clave, valor in cambios.items():
+        if isinstance(valor, dict) and isinstance(base.get(clave), dict):
+            _fusionar(base[clave], valor)
+        else:
+            base[clave] = valor
+    return base
+
+
+def cargar_configuracion(ruta=None):
+    """
+    Devuelve la configuración por defecto fusionada con la del archivo JSON
+    (si existe). Las claves ausentes en el archivo conservan su valor por defecto.
+    """
+    ruta = ruta or RUTA_CONFIG
+    config = copy.deepcopy(CONFIG_POR_DEFECTO)
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            _fusionar(config, json.load(f))
+    return config
+
+
+def guardar_configuracion(config, ruta=None):
+    ruta = ruta or RUTA_CONFIG
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
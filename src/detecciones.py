@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def ids_de_clases(nombres, clases):
+    """Ids numéricos de las clases `clases` según el dict `nombres` del modelo"""
+    return np.array([i for i, nombre in nombres.items() if nombre in clases], dtype=np.int64)
+
+
+class Detecciones:
+    """
+    Lote de detecciones de un frame como arreglos paralelos (struct-of-arrays).
+
+    Attributes:
+    -----------
+    xyxy : np.ndarray (N, 4) float32
+        Cajas en coordenadas del frame.
+    clases : np.ndarray (N,) int64
+        Id de clase de cada caja.
+    confianzas : np.ndarray (N,) float32
+    nombres : dict
+        Id de clase -> nombre (el `names` del modelo).
+    """
+
+    __slots__ = ('xyxy', 'clases', 'confianzas', 'nombres')
+
+    def __init__(self, xyxy, clases, confianzas, nombres):
+        self.xyxy = xyxy
+        self.clases = clases
+        self.confianzas = confianzas
+        self.nombres = nombres
+
+    @classmethod
+    def vacias(cls, nombres=None):
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.int64), np.zeros(0, np.float32),
+                   nombres or {})
+
+    @classmethod
+    def desde_arreglo(cls, datos, nombres):
+        """Construye desde un arreglo (N, 6) [x1, y1, x2, y2, conf, clase]"""
+        datos = np.asarray(datos, dtype=np.float32).reshape(-1, 6)
+        return cls(datos[:, :4].copy(), datos[:, 5].astype(np.int64), datos[:, 4].copy(), nombres)
+
+    @classmethod
+    def desde_resultado(cls, resultado, ids_clase=None, conf_min=0.0):
+        """
+        Convierte un `Results` de ultralytics con una sola copia del tensor de
+        cajas y filtra clases y confianza con una máscara NumPy, sin recorrer
+        las cajas en Python.
+        """
+        datos = resultado.boxes.data
+        datos = datos.cpu().numpy() if hasattr(datos, 'cpu') else np.asarray(datos)
+        detecciones = cls.desde_arreglo(datos, resultado.names)
+        if ids_clase is None:
+            return detecciones.filtrar(detecciones.confianzas >= conf_min) if conf_min > 0 else detecciones
+        return detecciones.filtrar_clases(ids_clase, conf_min)
+
+    def __len__(self):
+        return len(self.clases)
+
+    def filtrar(self, mascara):
+        return Detecciones(self.xyxy[mascara], self.clases[mascara], self.confianzas[mascara], self.nombres)
+
+    def filtrar_clases(self, ids_clase, conf_min=0.0):
+        """Vuelve a filtrar por clases y confianza (p. ej. para recontar sin inferir)"""
+        return self.filtrar(np.isin(self.clases, ids_clase) & (self.confianzas >= conf_min))
+
+    def desplazar(self, dx, dy):
+        """Copia con las cajas trasladadas (de coordenadas del recorte a las del frame)"""
+        xyxy = self.xyxy + np.array([dx, dy, dx, dy], dtype=np.float32)
+        return Detecciones(xyxy, self.clases, self.confianzas, self.nombres)
+
+    def puntos_apoyo(self):
+        """Centro inferior de cada caja (N, 2): el punto donde el vehículo toca el suelo"""
+        return np.stack([(self.xyxy[:, 0] + self.xyxy[:, 2]) / 2, self.xyxy[:, 3]], axis=1)
+
+    def conteo_por_clase(self):
+        """Dict nombre de clase -> número de detecciones"""
+        if not len(self):
+            return {}
+        ids, cuentas = np.unique(self.clases, return_counts=True)
+        return {self.nombres.get(int(i), str(i)): int(c) for i, c in zip(ids, cuentas)}
+
+    def a_arreglo(self):
+        """Arreglo (N, 6) [x1, y1, x2, y2, conf, clase]"""
+        return np.concatenate([self.xyxy, self.confianzas[:, None], self.clases[:, None].astype(np.float32)],
+                              axis=1)
+
+
+def dibujar_detecciones(frame, detecciones, escala=1.0, color_caja=(0, 255, 0), color_texto=(0, 255, 0),
+                        numerar=False, tam_texto=0.9):
+    """
+    Dibuja las cajas sobre `frame` (in situ). `escala` permite dibujar sobre
+    un frame ya reducido para mostrar, sin volver al tamaño original.
+    """
+    import cv2
+
+    grosor = max(1, int(round(2 * escala)))
+    cajas = (detecciones.xyxy * escala).astype(int)
+    for obj_id, ((x1, y1, x2, y2), class_id, conf) in enumerate(
+            zip(cajas, detecciones.clases, detecciones.confianzas), start=1):
+        label = f"{detecciones.nombres[int(class_id)]} {conf:.2f}"
+        if numerar:
+            label = f"{obj_id}: {label}"
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color_caja, grosor)
+        cv2.putText(frame, label, (x1, y1 - max(4, int(10 * escala))),
+                    cv2.FONT_HERSHEY_SIMPLEX, tam_texto * max(escala, 0.4), color_texto, grosor)
+    return frame
@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import deque
+
+from src.vision_vehicular import obtener_modelo, ids_vehiculo
+
+
+class FrameSinInferir(RuntimeError):
+    """El frame no se infirió porque el servicio se detuvo o llegó uno más reciente de su dirección"""
+
+
+class _Solicitud:
+    """Frame pendiente de una dirección y el resultado que le corresponde"""
+
+    def __init__(self, frame, imgsz=None):
+        self.frame = frame
+        self.imgsz = imgsz
+        self.t_envio = time.perf_counter()
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class ServicioInferencia:
+    """
+    Servicio central que agrupa en un solo lote los frames de todas las
+    direcciones activas y los pasa por YOLO en una única llamada.
+
+    Cada vista llama a `inferir(direccion, frame)` desde su propio hilo; la
+    llamada se bloquea hasta que el lote que contiene su frame termina. El
+    hilo del servicio espera como máximo `max_espera` segundos a que el resto
+    de direcciones activas envíe su frame antes de lanzar el lote.
+
+    Parameters:
+    -----------
+    modelo : YOLO, opcional
+        Modelo a usar. Por defecto el modelo compartido de vision_vehicular,
+        que se carga en el primer lote.
+    max_espera : float
+        Tiempo máximo (s) que se espera para completar un lote.
+    conf : float
+        Umbral de confianza pasado al modelo.
+    clases : list de int, opcional
+        Ids de clase que YOLO debe conservar. Por defecto los de vehicle_classes.
+    cascada : DetectorCascada, opcional
+        Si se indica, cada sublote pasa por el modelo pequeño y solo los frames
+        dudosos se reinfieren en bloque con el grande (ver src.cascada). Los
+        resultados pueden traer detecciones bajo `conf`: filtra al convertirlos.
+    planificador : PlanificadorInferencia, opcional
+        Recibe el coste medido por frame y fija los hilos de torch antes del
+        primer lote (ver src.planificador).
+    """
+
+    def __init__(self, modelo=None, max_espera=0.03, conf=0.4, clases=None, cascada=None, planificador=None):
+        self.modelo = modelo
+        self.cascada = cascada
+        self.planificador = planificador
+        self.max_espera = max_espera
+        self.conf = conf
+        self.clases = clases
+        self.activas = set()
+        self.pendientes = {}
+        self.cedidas = set()
+        self.cond = threading.Condition()
+        self.corriendo = False
+        self.hilo = None
+        # Cada iniciar() abre una generación: un bucle de una anterior que aún no salió
+        # (detener() solo lo espera un momento) ya no toma lotes
+        self.generacion = 0
+        # Estadísticas
+        self.latencias = {}
+        self.frames_procesados = 0
+        self.lotes_procesados = 0
+        self.t_inicio = None
+
+    def iniciar(self):
+        with self.cond:
+            if self.corriendo:
+                return
+            self.corriendo = True
+            self.generacion += 1
+            self.t_inicio = time.perf_counter()
+        self.hilo = threading.Thread(target=self._bucle, args=(self.generacion,), daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        with self.cond:
+            self.corriendo = False
+            pendientes = list(self.pendientes.values())
+            self.pendientes.clear()
+            self.cond.notify_all()
+        for solicitud in pendientes:
+            solicitud.error = FrameSinInferir("Servicio de inferencia detenido")
+            solicitud.evento.set()
+        if self.hilo is not None:
+            self.hilo.join(timeout=1)
+            self.hilo = None
+
+    def registrar(self, direccion):
+        """Marca una dirección como activa para que el lote la espere"""
+        with self.cond:
+            self.activas.add(direccion)
+            self.latencias.setdefault(direccion, deque(maxlen=500))
+        self.iniciar()
+
+    def retirar(self, direccion):
+        with self.cond:
+            self.activas.discard(direccion)
+            self.cond.notify_all()
+
+    def ceder(self, direccion):
+        """Indica que la dirección no enviará frame para el lote en curso (p. ej. escena estática)"""
+        with self.cond:
+            self.cedidas.add(direccion)
+            self.cond.notify_all()
+
+    def inferir(self, direccion, frame, imgsz=None):
+        """
+        Envía el frame de una dirección y espera su resultado de YOLO.
+        Si la dirección ya tenía un frame pendiente se reemplaza por el nuevo.
+        Los frames con distinto `imgsz` (recortes de ROI) se infieren en sublotes separados.
+        """
+        solicitud = _Solicitud(frame, imgsz)
+        with self.cond:
+            if not self.corriendo:
+                raise FrameSinInferir("Servicio de inferencia detenido")
+            anterior = self.pendientes.get(direccion)
+            self.pendientes[direccion] = solicitud
+            self.cond.notify_all()
+        if anterior is not None:
+            anterior.error = FrameSinInferir("Frame reemplazado por uno más reciente")
+            anterior.evento.set()
+        solicitud.evento.wait()
+        if solicitud.error is not None:
+            raise solicitud.error
+        return solicitud.resultado
+
+    def _vigente(self, generacion):
+        return self.corriendo and self.generacion == generacion
+
+    def _bucle(self, generacion):
+        while True:
+            with self.cond:
+                while self._vigente(generacion) and not self.pendientes:
+                    self.cond.wait()
+                if not self._vigente(generacion):
+                    return
+                # Esperar al resto de direcciones activas hasta max_espera
+                limite = time.perf_counter() + self.max_espera
+                while self._vigente(generacion) and not self.activas.issubset(self.cedidas.union(self.pendientes)):
+                    restante = limite - time.perf_counter()
+                    if restante <= 0:
+                        break
+                    self.cond.wait(restante)
+                if not self._vigente(generacion):
+                    return
+                lote = list(self.pendientes.items())
+                self.pendientes.clear()
+                self.cedidas.clear()
+
+            sublotes = {}
+            for direccion, solicitud in lote:
+                sublotes.setdefault(solicitud.imgsz, []).append((direccion, solicitud))
+            for imgsz, sublote in sublotes.items():
+                self._inferir_sublote(sublote, imgsz)
+
+    def _inferir_sublote(self, sublote, imgsz):
+        frames = [solicitud.frame for _, solicitud in sublote]
+        t0 = time.perf_counter()
+        try:
+            if self.planificador is not None:
+                self.planificador.configurar_hilos()
+            if self.modelo is None:
+                self.modelo = obtener_modelo()
+            if self.clases is None:
+                self.clases = ids_vehiculo(self.modelo)
+            if self.cascada is not None:
+                resultados = self.cascada.inferir_lote(frames, [direccion for direccion, _ in sublote],
+                                                       self.conf, self.clases, imgsz)
+            else:
+                opciones = {'conf': self.conf, 'classes': self.clases, 'verbose': False}
+                if imgsz is not None:
+                    opciones['imgsz'] = imgsz
+                resultados = self.modelo(frames, **opciones)
+        except Exception as e:
+            for _, solicitud in sublote:
+                solicitud.error = e
+                solicitud.evento.set()
+            return
+
+        ahora = time.perf_counter()
+        if self.planificador is not None:
+            self.planificador.registrar_coste((ahora - t0) / len(frames))
+        with self.cond:
+            self.frames_procesados += len(sublote)
+            self.lotes_procesados += 1
+            for direccion, solicitud in sublote:
+                self.latencias.setdefault(direccion, deque(maxlen=500)).append(ahora - solicitud.t_envio)
+        for (_, solicitud), resultado in zip(sublote, resultados):
+            solicitud.resultado = resultado
+            solicitud.evento.set()
+
+    def estadisticas(self):
+        """Devuelve frames/s agregados, tamaño medio de lote y latencias p50/p99 por dirección (ms)"""
+        with self.cond:
+            transcurrido = time.perf_counter() - self.t_inicio if self.t_inicio else 0
+            stats = {
+                'frames_por_segundo': self.frames_procesados / transcurrido if transcurrido > 0 else 0.0,
+                'lote_medio': self.frames_procesados / self.lotes_procesados if self.lotes_procesados else 0.0,
+                'latencias': {}
+            }
+            for direccion, valores in self.latencias.items():
+                if not valores:
+                    continue
+                ordenadas = sorted(valores)
+                stats['latencias'][direccion] = {
+                    'p50': ordenadas[len(ordenadas) // 2] * 1000,
+                    'p99': ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))] * 1000
+                }
+        return stats
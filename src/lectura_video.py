@@ -0,0 +1,114 @@
+import time
+
+import cv2
+
+MODOS_SALTO = ('grab', 'seek', 'keyframes')
+
+
+def iterar_frames(fuente, salto_frames=1, intervalo_ms=None, modo='grab', frame_inicial=0):
+    """
+    Recorre una fuente de video devolviendo solo los frames muestreados,
+    sin decodificar por completo los que se descartan.
+
+    Parameters:
+    -----------
+    fuente : str o int
+        Ruta de archivo, URL o índice de cámara.
+    salto_frames : int
+        Procesa un frame de cada `salto_frames` (se ignora si hay `intervalo_ms`).
+    intervalo_ms : float, opcional
+        Muestreo por tiempo: un frame cada `intervalo_ms` milisegundos de video.
+    modo : str
+        'grab'      -> avanza con cap.grab() y solo decodifica con retrieve()
+                       el frame muestreado. Funciona con cualquier fuente.
+        'seek'      -> salta directamente al siguiente frame/tiempo con
+                       cap.set(). Solo archivos; conviene con saltos grandes.
+        'keyframes' -> decodifica únicamente keyframes (requiere PyAV).
+    frame_inicial : int
+        Último frame ya procesado; la lectura continúa después de él (reanudar).
+
+    Yields:
+    -------
+    (frame_num, frame) con frame_num contado desde 1, como en procesar_video.
+    """
+    if modo not in MODOS_SALTO:
+        raise ValueError(f"Modo de salto desconocido: {modo} (usa uno de {MODOS_SALTO})")
+    if salto_frames < 1:
+        raise ValueError("salto_frames debe ser >= 1")
+
+    if modo == 'keyframes':
+        for frame_num, frame in _iterar_keyframes(fuente, intervalo_ms):
+            if frame_num > frame_inicial:
+                yield frame_num, frame
+        return
+
+    cap = cv2.VideoCapture(fuente)
+    try:
+        if modo == 'seek':
+            yield from _iterar_seek(cap, salto_frames, intervalo_ms, frame_inicial)
+        else:
+            if frame_inicial:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_inicial)
+            yield from _iterar_grab(cap, salto_frames, intervalo_ms, isinstance(fuente, str), frame_inicial)
+    finally:
+        cap.release()
+
+
+def _iterar_grab(cap, salto_frames, intervalo_ms, es_archivo, frame_inicial=0):
+    frame_num = frame_inicial
+    siguiente_ms = cap.get(cv2.CAP_PROP_POS_MSEC) if frame_inicial and es_archivo else 0.0
+    t0 = time.monotonic()
+    while True:
+        if not cap.grab():
+            break
+        frame_num += 1
+        if intervalo_ms is None:
+            if frame_num % salto_frames != 0:
+                continue
+        else:
+            # En archivos se usa el tiempo del video; en vivo, el reloj de pared
+            pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC) if es_archivo else (time.monotonic() - t0) * 1000
+            if pos_ms < siguiente_ms:
+                continue
+            siguiente_ms = pos_ms + intervalo_ms
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        yield frame_num, frame
+
+
+def _iterar_seek(cap, salto_frames, intervalo_ms, frame_inicial=0):
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total <= 0:
+        raise ValueError("El modo 'seek' solo está disponible para archivos de video")
+    paso = salto_frames if intervalo_ms is None else max(1, round(intervalo_ms * fps / 1000))
+    objetivo = (frame_inicial // paso + 1) * paso
+    while objetivo <= total:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, objetivo - 1)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield objetivo, frame
+        objetivo += paso
+
+
+def _iterar_keyframes(fuente, intervalo_ms):
+    try:
+        import av
+    except ImportError as e:
+        raise ImportError("El modo 'keyframes' requiere PyAV: pip install av") from e
+
+    with av.open(fuente) as contenedor:
+        stream = contenedor.streams.video[0]
+        stream.codec_context.skip_frame = "NONKEY"
+        fps = float(stream.average_rate or 30)
+        siguiente_ms = 0.0
+        for frame in contenedor.decode(stream):
+            t_ms = float(frame.time or 0) * 1000
+            if intervalo_ms is not None:
+                if t_ms < siguiente_ms:
+                    continue
+                siguiente_ms = t_ms + intervalo_ms
+            frame_num = int(round(t_ms * fps / 1000)) + 1
+            yield frame_num, frame.to_ndarray(format='bgr24')
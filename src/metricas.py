@@ -0,0 +1,347 @@
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import nullcontext
+
+# Límites de los buckets de latencia: geométricos (x1.2) de 10 µs a ~100 s,
+# el percentil estimado tiene un error relativo de como mucho ~10 %
+LIMITES = tuple(1e-5 * 1.2 ** i for i in range(90))
+CUANTILES = (0.5, 0.95, 0.99)
+PREFIJO = "visotraf"
+
+
+class Histograma:
+    """Latencias (s) en buckets fijos: observar es O(log buckets) y la memoria constante"""
+
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES) + 1)
+        self.n = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.lock = threading.Lock()
+
+    def observar(self, segundos):
+        i = bisect_left(LIMITES, segundos)
+        with self.lock:
+            self.cuentas[i] += 1
+            self.n += 1
+            self.suma += segundos
+            if segundos > self.maximo:
+                self.maximo = segundos
+
+    def cuantil(self, q):
+        with self.lock:
+            if not self.n:
+                return 0.0
+            objetivo = q * self.n
+            acumulado = 0
+            for i, cuenta in enumerate(self.cuentas):
+                acumulado += cuenta
+                if acumulado >= objetivo:
+                    # Punto medio geométrico del bucket, sin pasar del máximo observado
+                    inferior = LIMITES[i - 1] if i else 0.0
+                    superior = LIMITES[i] if i < len(LIMITES) else self.maximo
+                    return min(math.sqrt(inferior * superior) if inferior else superior, self.maximo)
+            return self.maximo
+
+    def resumen(self):
+        return {'n': self.n, 'media_ms': self.suma / self.n * 1000 if self.n else 0.0,
+                'max_ms': self.maximo * 1000,
+                **{f'p{int(q * 100)}_ms': self.cuantil(q) * 1000 for q in CUANTILES}}
+
+
+class Contador:
+    """Total acumulado y su tasa por segundo en los últimos ~`ventana` segundos"""
+
+    def __init__(self, ventana=5):
+        self.total = 0
+        self.muestras = deque(maxlen=ventana + 1)
+        self.t_muestra = 0.0
+        self.lock = threading.Lock()
+
+    def sumar(self, n=1):
+        ahora = time.monotonic()
+        with self.lock:
+            self.total += n
+            if ahora - self.t_muestra >= 1.0:
+                self.t_muestra = ahora
+                self.muestras.append((ahora, self.total))
+
+    def tasa(self):
+        with self.lock:
+            if not self.muestras:
+                return 0.0
+            t0, total0 = self.muestras[0]
+            total = self.total
+        dt = time.monotonic() - t0
+        return (total - total0) / dt if dt > 0 else 0.0
+
+
+class _Etapa:
+    __slots__ = ('histograma', 't0')
+
+    def __init__(self, histograma):
+        self.histograma = histograma
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observar(time.perf_counter() - self.t0)
+        return False
+
+
+class Metricas:
+    """
+    Registro de métricas por etapa y acceso: latencias (histogramas con
+    p50/p95/p99), contadores con tasa (FPS, frames omitidos o descartados)
+    y niveles (profundidad de colas). Las series se crean al primer uso.
+    """
+
+    activas = True
+
+    def __init__(self):
+        self.histogramas = {}
+        self.contadores = {}
+        self.niveles = {}
+        self.lock = threading.Lock()
+        self.traza = None
+
+    def _serie(self, tabla, clave, fabrica):
+        serie = tabla.get(clave)
+        if serie is None:
+            with self.lock:
+                serie = tabla.setdefault(clave, fabrica())
+        return serie
+
+    def etapa(self, nombre, acceso=""):
+        """Context manager que mide la duración del bloque"""
+        return _Etapa(self._serie(self.histogramas, (nombre, acceso), Histograma))
+
+    def observar(self, nombre, segundos, acceso=""):
+        self._serie(self.histogramas, (nombre, acceso), Histograma).observar(segundos)
+
+    def contar(self, nombre, acceso="", n=1):
+        self._serie(self.contadores, (nombre, acceso), Contador).sumar(n)
+
+    def nivel(self, nombre, valor, acceso=""):
+        self.niveles[(nombre, acceso)] = valor
+
+    def instantanea(self):
+        """Estado actual como dict serializable: {'etapas': ..., 'contadores': ..., 'niveles': ...}"""
+        with self.lock:
+            histogramas = list(self.histogramas.items())
+            contadores = list(self.contadores.items())
+        niveles = dict(self.niveles)
+        return {
+            'etapas': [dict(etapa=n, acceso=a, **h.resumen()) for (n, a), h in histogramas],
+            'contadores': [{'nombre': n, 'acceso': a, 'total': c.total, 'por_segundo': c.tasa()}
+                           for (n, a), c in contadores],
+            'niveles': [{'nombre': n, 'acceso': a, 'valor': v} for (n, a), v in niveles.items()],
+        }
+
+    def texto_prometheus(self):
+        """Exposición en formato de texto de Prometheus (summary por etapa, counter y gauge)"""
+        lineas = [f"# TYPE {PREFIJO}_etapa_segundos summary"]
+        with self.lock:
+            histogramas = list(self.histogramas.items())
+            contadores = list(self.contadores.items())
+        for (nombre, acceso), h in histogramas:
+            etiquetas = f'etapa="{nombre}",acceso="{acceso}"'
+            for q in CUANTILES:
+                lineas.append(f'{PREFIJO}_etapa_segundos{{{etiquetas},quantile="{q}"}} {h.cuantil(q):.6g}')
+            lineas.append(f'{PREFIJO}_etapa_segundos_sum{{{etiquetas}}} {h.suma:.6g}')
+            lineas.append(f'{PREFIJO}_etapa_segundos_count{{{etiquetas}}} {h.n}')
+        lineas.append(f"# TYPE {PREFIJO}_eventos_total counter")
+        for (nombre, acceso), c in contadores:
+            lineas.append(f'{PREFIJO}_eventos_total{{nombre="{nombre}",acceso="{acceso}"}} {c.total}')
+        lineas.append(f"# TYPE {PREFIJO}_nivel gauge")
+        for (nombre, acceso), valor in dict(self.niveles).items():
+            lineas.append(f'{PREFIJO}_nivel{{nombre="{nombre}",acceso="{acceso}"}} {valor}')
+        return "\n".join(lineas) + "\n"
+
+    def texto_panel(self, etapas=None):
+        """Resumen corto para el dashboard: p50/p95 por etapa y FPS por acceso"""
+        datos = self.instantanea()
+        lineas = []
+        for e in sorted(datos['etapas'], key=lambda e: (e['etapa'], e['acceso'])):
+            if etapas is None or e['etapa'] in etapas:
+                lineas.append(f"{_etiqueta(e['etapa'], e['acceso'])}: {e['p50_ms']:.1f}/{e['p95_ms']:.1f} ms")
+        for c in sorted(datos['contadores'], key=lambda c: (c['nombre'], c['acceso'])):
+            lineas.append(f"{_etiqueta(c['nombre'], c['acceso'])}: {c['por_segundo']:.1f}/s")
+        for n in sorted(datos['niveles'], key=lambda n: (n['nombre'], n['acceso'])):
+            lineas.append(f"{_etiqueta(n['nombre'], n['acceso'])}: {n['valor']}")
+        return "\n".join(lineas)
+
+
+def _etiqueta(nombre, acceso):
+    # Nombre de la serie con la inicial del acceso (N, S, E, O), como en las vistas;
+    # con varias intersecciones el acceso es "interseccion/Direccion"
+    if not acceso:
+        return nombre
+    interseccion, _, direccion = acceso.rpartition("/")
+    return f"{nombre} {interseccion}/{direccion[:1]}" if interseccion else f"{nombre} {direccion[:1]}"
+
+
+class _MetricasNulas:
+    """Sustituto cuando la instrumentación está desactivada: todo es un no-op"""
+
+    activas = False
+    _nulo = nullcontext()
+
+    def etapa(self, nombre, acceso=""):
+        return self._nulo
+
+    def observar(self, nombre, segundos, acceso=""):
+        pass
+
+    def contar(self, nombre, acceso="", n=1):
+        pass
+
+    def nivel(self, nombre, valor, acceso=""):
+        pass
+
+
+_registro = _MetricasNulas()
+
+
+def registro():
+    """Registro activo (un no-op si la instrumentación no se activó)"""
+    return _registro
+
+
+def etapa(nombre, acceso=""):
+    return _registro.etapa(nombre, acceso)
+
+
+def observar(nombre, segundos, acceso=""):
+    _registro.observar(nombre, segundos, acceso)
+
+
+def contar(nombre, acceso="", n=1):
+    _registro.contar(nombre, acceso, n)
+
+
+def nivel(nombre, valor, acceso=""):
+    _registro.nivel(nombre, valor, acceso)
+
+
+def medir_iterador(iterable, nombre, acceso=""):
+    """Mide lo que tarda cada `next()` (p. ej. la decodificación de frames); sin métricas devuelve el iterable"""
+    if not _registro.activas:
+        return iterable
+    return _iterar_medido(iter(iterable), _registro.etapa(nombre, acceso).histograma)
+
+
+def _iterar_medido(iterador, histograma):
+    while True:
+        t0 = time.perf_counter()
+        try:
+            valor = next(iterador)
+        except StopIteration:
+            return
+        histograma.observar(time.perf_counter() - t0)
+        yield valor
+
+
+def servir_prometheus(metricas, puerto, host="127.0.0.1"):
+    """Sirve /metrics en texto de Prometheus desde un hilo daemon; devuelve el servidor"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            cuerpo = metricas.texto_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class EscritorTraza:
+    """Añade cada `periodo` segundos una línea JSON con la instantánea de las métricas"""
+
+    def __init__(self, metricas, ruta, periodo=10.0):
+        self.metricas = metricas
+        self.ruta = ruta
+        self.periodo = periodo
+        self.parada = threading.Event()
+        self.hilo = threading.Thread(target=self._bucle, daemon=True)
+        self.hilo.start()
+
+    def escribir(self):
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(self.metricas.instantanea(), timestamp=time.time())) + "\n")
+
+    def _bucle(self):
+        while not self.parada.wait(self.periodo):
+            self.escribir()
+
+    def cerrar(self):
+        self.parada.set()
+        self.hilo.join(timeout=1)
+        self.escribir()
+
+
+def activar(config_metricas=None):
+    """
+    Activa la instrumentación según la sección 'metricas' de la configuración
+    (endpoint de Prometheus y traza JSONL opcionales). Devuelve el registro,
+    o None si está desactivada: en ese caso medir no cuesta más que una llamada vacía.
+    """
+    global _registro
+    if config_metricas is None:
+        from src.configuracion import cargar_configuracion
+        config_metricas = cargar_configuracion()['metricas']
+    if not config_metricas['activo']:
+        return None
+    if not _registro.activas:
+        _registro = Metricas()
+        if config_metricas['puerto']:
+            try:
+                servir_prometheus(_registro, config_metricas['puerto'], config_metricas['host'])
+            except OSError as e:
+                print(f"⚠️ No se pudo abrir el endpoint de métricas: {e}")
+        if config_metricas['traza']:
+            _registro.traza = EscritorTraza(_registro, config_metricas['traza'], config_metricas['periodo_traza'])
+    return _registro
+
+
+def activar_trabajador(config_metricas, sufijo):
+    """
+    Activación en un proceso hijo (workers de lote, procesos de cámara): sin
+    endpoint, porque todos pedirían el mismo puerto, y con la traza propia
+    `<traza>.<sufijo>`. Sin traza configurada no se mide nada en el hijo.
+    """
+    if not config_metricas['activo'] or not config_metricas['traza']:
+        return None
+    return activar(dict(config_metricas, puerto=None, traza=f"{config_metricas['traza']}.{sufijo}"))
+
+
+def volcar():
+    """Escribe ya una línea en la traza (si la hay), p. ej. al terminar un video en un worker"""
+    traza = getattr(_registro, 'traza', None)
+    if traza is not None:
+        traza.escribir()
+
+
+def cerrar():
+    """Detiene la traza periódica escribiendo su última línea"""
+    traza = getattr(_registro, 'traza', None)
+    if traza is not None:
+        traza.cerrar()
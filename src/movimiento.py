@@ -0,0 +1,93 @@
+import time
+
+import cv2
+
+
+class FiltroMovimiento:
+    """
+    Pre-filtro barato que decide si vale la pena ejecutar YOLO sobre un frame.
+
+    Compara una versión reducida y en gris del frame con la del último frame
+    inferido. Si la fracción de píxeles que cambiaron supera `sensibilidad`,
+    o si pasó más de `refresco_max` segundos desde la última inferencia, el
+    frame se debe inferir; si no, se pueden reutilizar las detecciones previas.
+
+    Parameters:
+    -----------
+    sensibilidad : float
+        Fracción mínima de píxeles cambiados (0-1) para considerar que hubo movimiento.
+    umbral_pixel : int
+        Diferencia de intensidad (0-255) a partir de la cual un píxel cuenta como cambiado.
+    ancho : int
+        Ancho al que se reduce el frame antes de comparar.
+    refresco_max : float, opcional
+        Segundos máximos sin inferir; al superarlos se fuerza un refresco.
+    """
+
+    def __init__(self, sensibilidad=0.01, umbral_pixel=25, ancho=160, refresco_max=30.0):
+        self.sensibilidad = sensibilidad
+        self.umbral_pixel = umbral_pixel
+        self.ancho = ancho
+        self.refresco_max = refresco_max
+        self.referencia = None
+        self.t_ultima_inferencia = None
+        self.inferidos = 0
+        self.omitidos = 0
+
+    def _reducir(self, frame):
+        h, w = frame.shape[:2]
+        alto = max(1, int(h * self.ancho / w))
+        gris = cv2.cvtColor(cv2.resize(frame, (self.ancho, alto), interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gris, (5, 5), 0)
+
+    def hay_cambio(self, frame, ahora=None):
+        """
+        Devuelve True si el frame debe pasar por el detector.
+        `ahora` es el tiempo en segundos (del video o del reloj); por defecto time.monotonic().
+        """
+        if ahora is None:
+            ahora = time.monotonic()
+        reducido = self._reducir(frame)
+
+        inferir = self.referencia is None or reducido.shape != self.referencia.shape
+        if not inferir and self.refresco_max is not None:
+            inferir = ahora - self.t_ultima_inferencia >= self.refresco_max
+        if not inferir:
+            diferencia = cv2.absdiff(reducido, self.referencia)
+            _, mascara = cv2.threshold(diferencia, self.umbral_pixel, 255, cv2.THRESH_BINARY)
+            inferir = cv2.countNonZero(mascara) / mascara.size >= self.sensibilidad
+
+        if inferir:
+            # La referencia es el último frame inferido: un cambio lento acaba disparando
+            self.referencia = reducido
+            self.t_ultima_inferencia = ahora
+            self.inferidos += 1
+        else:
+            self.omitidos += 1
+        return inferir
+
+    def fraccion_omitida(self):
+        total = self.inferidos + self.omitidos
+        return self.omitidos / total if total else 0.0
+
+    def reiniciar(self):
+        self.referencia = None
+        self.t_ultima_inferencia = None
+
+
+def crear_filtro(direccion=None, config_movimiento=None):
+    """
+    Construye un FiltroMovimiento con la sensibilidad configurada para `direccion`.
+    Devuelve None si el filtro está desactivado en la configuración.
+    """
+    if config_movimiento is None:
+        from src.configuracion import cargar_configuracion
+        config_movimiento = cargar_configuracion()['movimiento']
+    if not config_movimiento['activo']:
+        return None
+    sensibilidad = config_movimiento['sensibilidad']
+    if isinstance(sensibilidad, dict):
+        sensibilidad = sensibilidad.get(direccion, sensibilidad.get('defecto', 0.01))
+    return FiltroMovimiento(sensibilidad, config_movimiento['umbral_pixel'],
+                            config_movimiento['ancho'], config_movimiento['refresco_max'])
@@ -0,0 +1,273 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import cv2
+
+from src import metricas
+from src.inferencia_lotes import FrameSinInferir
+
+DESCARTAR_ANTIGUO = 'descartar_antiguo'
+DESCARTAR_NUEVO = 'descartar_nuevo'
+
+
+class ColaAcotada:
+    """
+    Cola de capacidad fija con política de descarte explícita.
+
+    Con DESCARTAR_ANTIGUO un `poner` sobre la cola llena expulsa el elemento
+    más viejo; con DESCARTAR_NUEVO se descarta el que llega. En ambos casos
+    se incrementa `descartados`.
+    """
+
+    def __init__(self, capacidad=1, politica=DESCARTAR_ANTIGUO):
+        if politica not in (DESCARTAR_ANTIGUO, DESCARTAR_NUEVO):
+            raise ValueError(f"Política de descarte desconocida: {politica}")
+        self.capacidad = capacidad
+        self.politica = politica
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.descartados = 0
+        self.cerrada = False
+
+    def poner(self, item):
+        with self.cond:
+            if len(self.items) >= self.capacidad:
+                self.descartados += 1
+                if self.politica == DESCARTAR_NUEVO:
+                    return False
+                self.items.popleft()
+            self.items.append(item)
+            self.cond.notify()
+            return True
+
+    def sacar(self, timeout=None):
+        """Devuelve el siguiente elemento o None si la cola se cerró o venció el timeout"""
+        with self.cond:
+            if not self.items and not self.cerrada:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def cerrar(self):
+        with self.cond:
+            self.cerrada = True
+            self.cond.notify_all()
+
+    def profundidad(self):
+        with self.cond:
+            return len(self.items)
+
+
+class BufferDoble:
+    """
+    Doble buffer para pasar imágenes listas para mostrar del hilo de render
+    al hilo de la GUI sin copias intermedias.
+
+    El render escribe en el buffer trasero (sin lock) y lo publica con un
+    intercambio; la GUI lee el frontal dentro de `leer()`, que mantiene el
+    lock mientras se construye la imagen de Qt.
+    """
+
+    def __init__(self):
+        self.buffers = [None, None]
+        self.frente = 0
+        self.secuencia = 0
+        self.forma_original = None
+        self.lock = threading.Lock()
+
+    def trasero(self, forma, dtype):
+        """Buffer trasero con la forma pedida (se reserva solo si cambia la forma)"""
+        import numpy as np
+        indice = 1 - self.frente
+        buffer = self.buffers[indice]
+        if buffer is None or buffer.shape != forma:
+            buffer = self.buffers[indice] = np.empty(forma, dtype=dtype)
+        return buffer
+
+    def publicar(self, forma_original=None):
+        """Intercambia los buffers; `forma_original` es el tamaño del frame antes de reducirlo"""
+        with self.lock:
+            self.frente = 1 - self.frente
+            self.secuencia += 1
+            self.forma_original = forma_original
+
+    @contextmanager
+    def leer(self):
+        """Entrega (imagen_frontal, secuencia); la imagen no debe usarse fuera del bloque"""
+        with self.lock:
+            yield self.buffers[self.frente] if self.secuencia else None, self.secuencia
+
+
+class _Paquete:
+    __slots__ = ('frame', 't_captura', 'resultado')
+
+    def __init__(self, frame, t_captura):
+        self.frame = frame
+        self.t_captura = t_captura
+        self.resultado = None
+
+
+class PipelineVideo:
+    """
+    Pipeline captura -> inferencia -> render en hilos separados.
+
+    - Captura: lee continuamente la fuente y deja solo el frame más reciente
+      en una cola de capacidad 1 (descarta el antiguo), así el buffer de una
+      cámara en vivo nunca se acumula.
+    - Inferencia: toma el frame más reciente y llama a `inferir(frame)`.
+    - Render: llama a `dibujar(frame, resultado, salida)`, que escribe la
+      imagen lista para mostrar en el BufferDoble `salida` y la publica. Si
+      `debe_renderizar()` es False (vista oculta) el frame se descarta sin dibujar.
+
+    Parameters:
+    -----------
+    fuente : str o int
+        Ruta, URL o índice de cámara para cv2.VideoCapture.
+    inferir : callable
+        inferir(frame) -> resultado. Se ejecuta en el hilo de inferencia.
+    dibujar : callable
+        dibujar(frame, resultado, salida). Se ejecuta en el hilo de render.
+    debe_renderizar : callable, opcional
+        Devuelve False cuando nadie va a ver el frame.
+    salida : opcional
+        Destino del render con la interfaz de BufferDoble (p. ej. un
+        AnilloFrames en memoria compartida); por defecto un BufferDoble.
+    nombre : str
+        Acceso con el que se etiquetan las métricas de las etapas.
+    """
+
+    def __init__(self, fuente, inferir, dibujar, capacidad_render=2, debe_renderizar=None, salida=None,
+                 nombre=""):
+        self.fuente = fuente
+        self.nombre = nombre
+        self.inferir = inferir
+        self.dibujar = dibujar
+        self.debe_renderizar = debe_renderizar or (lambda: True)
+        self.cola_captura = ColaAcotada(1, DESCARTAR_ANTIGUO)
+        self.cola_render = ColaAcotada(capacidad_render, DESCARTAR_ANTIGUO)
+        self.corriendo = False
+        self.hilos = []
+        self.cap = None
+        self.salida = BufferDoble() if salida is None else salida
+        self.frames_sin_render = 0
+        self.latencias = deque(maxlen=500)
+        self.frames_capturados = 0
+        self.frames_inferidos = 0
+        self.errores_inferencia = 0
+        # Solo se imprime un error cuando cambia, para no repetirlo en cada frame
+        self.ultimo_error = None
+
+    def iniciar(self):
+        self.cap = cv2.VideoCapture(self.fuente)
+        if not self.cap.isOpened():
+            raise IOError(f"No se pudo abrir la fuente: {self.fuente}")
+        self.corriendo = True
+        self.hilos = [
+            threading.Thread(target=self._capturar, daemon=True),
+            threading.Thread(target=self._inferir, daemon=True),
+            threading.Thread(target=self._renderizar, daemon=True),
+        ]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def detener(self, timeout=1):
+        self.corriendo = False
+        self.cola_captura.cerrar()
+        self.cola_render.cerrar()
+        for hilo in self.hilos:
+            hilo.join(timeout=timeout)
+        # La captura la libera su propio hilo al salir: si sigue bloqueado en cap.read()
+        # liberarla desde aquí sería usarla después de liberada
+        if self.cap is not None and not self.hilos:
+            self.cap.release()
+        self.hilos = []
+        self.cap = None
+
+    def _capturar(self):
+        # Los archivos se leen a su velocidad nominal para simular una cámara;
+        # las fuentes en vivo se leen tan rápido como entregan frames.
+        cap = self.cap
+        try:
+            es_archivo = isinstance(self.fuente, str) and cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+            periodo = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 25.0) if es_archivo else 0
+            siguiente = time.perf_counter()
+            while self.corriendo:
+                with metricas.etapa('decodificacion', self.nombre):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                self.frames_capturados += 1
+                metricas.contar('capturados', self.nombre)
+                self.cola_captura.poner(_Paquete(frame, time.perf_counter()))
+                if periodo:
+                    siguiente += periodo
+                    espera = siguiente - time.perf_counter()
+                    if espera > 0:
+                        time.sleep(espera)
+                    else:
+                        siguiente = time.perf_counter()
+        finally:
+            cap.release()
+            self.cola_captura.cerrar()
+
+    def _inferir(self):
+        while self.corriendo:
+            paquete = self.cola_captura.sacar(timeout=0.5)
+            if paquete is None:
+                if self.cola_captura.cerrada:
+                    break
+                continue
+            try:
+                paquete.resultado = self.inferir(paquete.frame)
+            except FrameSinInferir:
+                # El servicio de inferencia se detuvo o el frame fue reemplazado por uno más reciente
+                continue
+            except Exception as e:
+                # Un frame que falla (ROI, seguidor, modelo...) no debe parar la etapa ni congelar la vista
+                self.errores_inferencia += 1
+                metricas.contar('errores_inferencia', self.nombre)
+                mensaje = f"{type(e).__name__}: {e}"
+                if mensaje != self.ultimo_error:
+                    self.ultimo_error = mensaje
+                    print(f"⚠️ {self.nombre or self.fuente}: error de inferencia ({mensaje})")
+                continue
+            self.frames_inferidos += 1
+            latencia = time.perf_counter() - paquete.t_captura
+            self.latencias.append(latencia)
+            self.cola_render.poner(paquete)
+            metricas.contar('inferidos', self.nombre)
+            metricas.observar('captura_conteo', latencia, self.nombre)
+            metricas.nivel('cola_render', self.cola_render.profundidad(), self.nombre)
+            metricas.nivel('descartados', self.cola_captura.descartados + self.cola_render.descartados,
+                           self.nombre)
+        self.cola_render.cerrar()
+
+    def _renderizar(self):
+        while self.corriendo:
+            paquete = self.cola_render.sacar(timeout=0.5)
+            if paquete is None:
+                if self.cola_render.cerrada:
+                    break
+                continue
+            if not self.debe_renderizar():
+                self.frames_sin_render += 1
+                continue
+            with metricas.etapa('dibujo', self.nombre):
+                self.dibujar(paquete.frame, paquete.resultado, self.salida)
+
+    def estadisticas(self):
+        """Contadores de frames, descartes por cola y latencia captura->conteo (ms)"""
+        latencias = sorted(self.latencias)
+        return {
+            'capturados': self.frames_capturados,
+            'inferidos': self.frames_inferidos,
+            'errores_inferencia': self.errores_inferencia,
+            'descartados_captura': self.cola_captura.descartados,
+            'descartados_render': self.cola_render.descartados,
+            'sin_render': self.frames_sin_render,
+            'latencia_p50': latencias[len(latencias) // 2] * 1000 if latencias else 0.0,
+            'latencia_max': latencias[-1] * 1000 if latencias else 0.0,
+        }
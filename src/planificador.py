@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Estado del semáforo que corresponde a cada acceso en calculate_cycle_sequence
+MOVIMIENTO_DIRECCION = {'Norte': 'ns_main', 'Sur': 'ns_main', 'Este': 'eo_main', 'Oeste': 'eo_main'}
+# Con varias intersecciones el acceso se nombra "interseccion/Direccion"
+SEPARADOR_ACCESO = "/"
+# Peso base por estado: en rojo la cola crece y es lo que la predicción necesita medir
+PESO_ESTADO = {'RED': 1.0, 'YELLOW': 0.7, 'GREEN': 0.5}
+PESO_VERDE_VACIO = 0.15
+
+
+def clave_acceso(interseccion, direccion):
+    """Nombre único de un acceso entre varias intersecciones (sin intersección, la dirección)"""
+    return f"{interseccion}{SEPARADOR_ACCESO}{direccion}" if interseccion else direccion
+
+
+def _separar(acceso):
+    interseccion, _, direccion = acceso.rpartition(SEPARADOR_ACCESO)
+    return interseccion, direccion
+
+
+class _Acceso:
+    def __init__(self, ventana):
+        self.conteos = deque(maxlen=ventana)
+        self.t_medicion = None
+        self.inferencias = 0
+
+
+class PlanificadorInferencia:
+    """
+    Reparte un presupuesto global de inferencia entre los accesos según su
+    demanda, en lugar de dar a todos el mismo esfuerzo.
+
+    El peso de cada acceso combina:
+    - la fase del semáforo (rojo > ámbar > verde; verde sin vehículos casi nada),
+    - la volatilidad reciente de su conteo (coeficiente de variación),
+    - la antigüedad de su última medición.
+
+    La tasa total (inferencias/s) es `presupuesto_cpu / coste`, donde `coste`
+    es la media móvil de segundos de inferencia por frame: con 0.6 el modelo
+    ocupa como mucho el 60 % del tiempo. Ningún acceso baja de `tasa_min` ni
+    pasa más de `max_antiguedad` segundos sin medir. Con varias
+    intersecciones cada una tiene su ciclo (ver `clave_acceso`).
+
+    También coordina los hilos: torch usa `hilos_torch` hilos y las
+    inferencias directas (sin ServicioInferencia) se serializan con `turno()`,
+    así los accesos no se pisan los núcleos.
+
+    Parameters:
+    -----------
+    presupuesto_cpu : float
+        Fracción del tiempo que puede ocupar la inferencia.
+    max_antiguedad : float
+        Segundos máximos entre mediciones de un acceso.
+    tasa_min : float
+        Inferencias/s mínimas por acceso.
+    hilos_torch : int, opcional
+        Hilos intra-op de torch; por defecto núcleos - 2 (captura, render y GUI).
+    """
+
+    def __init__(self, presupuesto_cpu=0.6, max_antiguedad=5.0, tasa_min=0.2, hilos_torch=None,
+                 ventana=20, coef_volatilidad=2.0):
+        self.presupuesto_cpu = presupuesto_cpu
+        self.max_antiguedad = max_antiguedad
+        self.tasa_min = tasa_min
+        self.hilos_torch = hilos_torch or max(1, (os.cpu_count() or 1) - 2)
+        self.ventana = ventana
+        self.coef_volatilidad = coef_volatilidad
+        self.accesos = {}
+        self.coste = 0.1
+        # Intersección -> [ciclo, inicio del ciclo, ciclo siguiente]
+        self.ciclos = {}
+        self.lock = threading.Lock()
+        self.lock_turno = threading.Lock()
+        self.hilos_configurados = False
+
+    def configurar_hilos(self):
+        """Fija los hilos de torch y OpenCV una sola vez (importa torch: llamar al inferir)"""
+        if self.hilos_configurados:
+            return
+        self.hilos_configurados = True
+        import cv2
+        import torch
+        torch.set_num_threads(self.hilos_torch)
+        # El resto de núcleos queda para decodificar y dibujar en los hilos de cada vista
+        cv2.setNumThreads(max(1, (os.cpu_count() or 1) - self.hilos_torch))
+
+    @contextmanager
+    def turno(self):
+        """Serializa las inferencias directas para que no compitan por los hilos de torch"""
+        self.configurar_hilos()
+        with self.lock_turno:
+            t0 = time.perf_counter()
+            yield
+            self.registrar_coste(time.perf_counter() - t0)
+
+    def registrar_coste(self, segundos_por_frame):
+        with self.lock:
+            self.coste = 0.9 * self.coste + 0.1 * segundos_por_frame
+
+    def actualizar_ciclo(self, ciclo, inicio=None, interseccion=""):
+        """
+        Ciclo nuevo de calculate_cycle_sequence. El primero empieza en `inicio`
+        (ahora por defecto); los siguientes esperan a que termine el actual,
+        como haría el controlador del semáforo.
+        """
+        with self.lock:
+            estado = self.ciclos.get(interseccion)
+            if estado is None:
+                self.ciclos[interseccion] = [ciclo, time.monotonic() if inicio is None else inicio, None]
+            else:
+                estado[2] = ciclo
+
+    def _estado(self, acceso, ahora):
+        interseccion, direccion = _separar(acceso)
+        estado = self.ciclos.get(interseccion)
+        if estado is None or not estado[0]:
+            return None
+        ciclo, t_ciclo, siguiente = estado
+        duracion = sum(fase['duration'] for fase in ciclo)
+        if duracion <= 0:
+            return None
+        while ahora - t_ciclo >= duracion:
+            t_ciclo += duracion
+            if siguiente is not None:
+                ciclo, siguiente = siguiente, None
+                duracion = sum(fase['duration'] for fase in ciclo)
+        estado[:] = ciclo, t_ciclo, siguiente
+        t = ahora - t_ciclo
+        for fase in ciclo:
+            if t < fase['duration']:
+                return fase['states'].get(MOVIMIENTO_DIRECCION.get(direccion))
+            t -= fase['duration']
+        return None
+
+    def _pesos(self, ahora):
+        direcciones = list(self.accesos)
+        pesos = np.empty(len(direcciones))
+        for i, direccion in enumerate(direcciones):
+            acceso = self.accesos[direccion]
+            conteos = np.asarray(acceso.conteos, dtype=float)
+            estado = self._estado(direccion, ahora)
+            peso = PESO_ESTADO.get(estado, 1.0)
+            if estado == 'GREEN' and len(conteos) and conteos[-1] == 0:
+                peso = PESO_VERDE_VACIO
+            if len(conteos) > 1:
+                peso *= 1 + self.coef_volatilidad * conteos.std() / (conteos.mean() + 1)
+            if acceso.t_medicion is not None:
+                peso *= 1 + (ahora - acceso.t_medicion) / self.max_antiguedad
+            pesos[i] = peso
+        return direcciones, pesos
+
+    def tasas(self, ahora=None):
+        """Inferencias/s asignadas a cada acceso"""
+        ahora = time.monotonic() if ahora is None else ahora
+        with self.lock:
+            if not self.accesos:
+                return {}
+            direcciones, pesos = self._pesos(ahora)
+            total = self.presupuesto_cpu / max(self.coste, 1e-3)
+            tasas = np.maximum(total * pesos / pesos.sum(), self.tasa_min)
+        return dict(zip(direcciones, tasas.tolist()))
+
+    def debe_inferir(self, direccion, ahora=None):
+        """True si al acceso le toca medir; si no, debe reutilizar su último resultado"""
+        ahora = time.monotonic() if ahora is None else ahora
+        with self.lock:
+            acceso = self.accesos.setdefault(direccion, _Acceso(self.ventana))
+            if acceso.t_medicion is None:
+                return True
+        antiguedad = ahora - acceso.t_medicion
+        if antiguedad >= self.max_antiguedad:
+            return True
+        return antiguedad >= 1.0 / self.tasas(ahora).get(direccion, self.tasa_min)
+
+    def registrar_medicion(self, direccion, conteo, ahora=None):
+        with self.lock:
+            acceso = self.accesos.setdefault(direccion, _Acceso(self.ventana))
+            acceso.conteos.append(conteo)
+            acceso.t_medicion = time.monotonic() if ahora is None else ahora
+            acceso.inferencias += 1
+
+    def retirar(self, direccion):
+        with self.lock:
+            self.accesos.pop(direccion, None)
+
+    def estadisticas(self):
+        """Tasa asignada, antigüedad de la medición y coste medio por frame"""
+        ahora = time.monotonic()
+        tasas = self.tasas(ahora)
+        with self.lock:
+            return {
+                'coste_ms': self.coste * 1000,
+                'accesos': {
+                    direccion: {
+                        'tasa': tasas.get(direccion, 0.0),
+                        'antiguedad': None if a.t_medicion is None else ahora - a.t_medicion,
+                        'inferencias': a.inferencias,
+                        'estado': self._estado(direccion, ahora),
+                    } for direccion, a in self.accesos.items()
+                },
+            }
+
+
+def crear_planificador(config_planificador=None):
+    """PlanificadorInferencia según visotraf_config.json, o None si está desactivado"""
+    if config_planificador is None:
+        from src.configuracion import cargar_configuracion
+        config_planificador = cargar_configuracion()['planificador']
+    if not config_planificador['activo']:
+        return None
+    return PlanificadorInferencia(
+        config_planificador['presupuesto_cpu'], config_planificador['max_antiguedad'],
+        config_planificador['tasa_min'], config_planificador['hilos_torch'],
+    )
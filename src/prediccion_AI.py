@@ -1,174 +1,290 @@
-import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-import time
-from collections import deque
 from datetime import datetime
-import os
+from types import MappingProxyType
+
+from src import metricas
+
+DIRECCIONES = ('Norte', 'Sur', 'Este', 'Oeste')
+YELLOW_TIME = 3
+ALL_RED = 2
+# 'proporcional': verde según la proporción de flujo; 'optimo': mínima demora simulada
+MODOS = ('proporcional', 'optimo')
+# Margen (s) de la compuerta de intervalo: los temporizadores de la GUI llegan con algo de retraso
+# o de adelanto y un tic de 9.99 s no debe perder su muestra
+TOLERANCIA_INTERVALO = 0.5
+
+# Fases del ciclo (constantes): solo las duraciones cambian entre llamadas.
+# Columnas de `duraciones_ciclo`: verde N-S, ámbar, todo rojo, verde E-O, ámbar, todo rojo
+FASES_CICLO = (
+    {'phase': 'NS_MAIN_AND_TURN', 'description': 'Verde principal y giro N-S',
+     'states': {'ns_main': 'GREEN', 'ns_turn': 'GREEN', 'eo_main': 'RED', 'eo_turn': 'RED'}},
+    {'phase': 'NS_YELLOW', 'description': 'Ámbar N-S',
+     'states': {'ns_main': 'YELLOW', 'ns_turn': 'YELLOW', 'eo_main': 'RED', 'eo_turn': 'RED'}},
+    {'phase': 'ALL_RED_1', 'description': 'Todo Rojo',
+     'states': {'ns_main': 'RED', 'ns_turn': 'RED', 'eo_main': 'RED', 'eo_turn': 'RED'}},
+    {'phase': 'EO_MAIN_AND_TURN', 'description': 'Verde principal y giro E-O',
+     'states': {'ns_main': 'RED', 'ns_turn': 'RED', 'eo_main': 'GREEN', 'eo_turn': 'GREEN'}},
+    {'phase': 'EO_YELLOW', 'description': 'Ámbar E-O',
+     'states': {'ns_main': 'RED', 'ns_turn': 'RED', 'eo_main': 'YELLOW', 'eo_turn': 'YELLOW'}},
+    {'phase': 'ALL_RED_2', 'description': 'Todo Rojo',
+     'states': {'ns_main': 'RED', 'ns_turn': 'RED', 'eo_main': 'RED', 'eo_turn': 'RED'}},
+)
+
+
+class PredictorIntersecciones:
+    """
+    Predicción de tiempos para N intersecciones a la vez, con NumPy.
+
+    El histórico es un buffer circular preasignado (N, 4, historia) en el
+    orden de DIRECCIONES; flujos, repartos de verde y giros se calculan para
+    todas las intersecciones en una sola llamada y se devuelven como arreglos
+    (columnas [ns, eo]), sin construir diccionarios.
+
+    Los límites (min_verde, max_verde, min_giro, max_giro) pueden ser
+    escalares o arreglos (N,), p. ej. para evaluar varias configuraciones.
+
+    Con `modo='optimo'` los verdes no salen de la regla proporcional sino
+    del reparto que minimiza la demora en el simulador de colas
+    (ver src.simulador_colas), dentro de los mismos límites.
+
+    Parameters:
+    -----------
+    n : int
+        Número de intersecciones.
+    historia : int
+        Conteos que se promedian por dirección (6 x 10 s = último minuto).
+    intervalo : float
+        Segundos mínimos entre dos conteos guardados de una intersección.
+    carriles, saturacion_carril :
+        Carriles por dirección y veh/h de verde por carril (modo 'optimo').
+    """
+
+    def __init__(self, n, historia=6, intervalo=10.0, min_verde=20, max_verde=90, min_giro=15, max_giro=30,
+                 modo='proporcional', carriles=(2, 2, 2, 2), saturacion_carril=1800.0, paso_optimo=2.0):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de predicción desconocido: {modo} (usa uno de {MODOS})")
+        self.n = n
+        self.modo = modo
+        self.carriles = carriles
+        self.saturacion_carril = saturacion_carril
+        self.paso_optimo = paso_optimo
+        self.historia = historia
+        self.intervalo = intervalo
+        self.min_verde = min_verde
+        self.max_verde = max_verde
+        self.min_giro = min_giro
+        self.max_giro = max_giro
+        self.conteos = np.zeros((n, len(DIRECCIONES), historia), dtype=np.float32)
+        self.posicion = np.zeros(n, dtype=np.int64)
+        self.llenos = np.zeros(n, dtype=np.int64)
+        self.ultimo = np.full(n, np.nan)
+
+    def actualizar(self, conteos, ahora, indices=None):
+        """
+        Guarda conteos (k, 4) de las intersecciones `indices` (todas por
+        defecto) si pasó `intervalo` desde su último conteo guardado.
+        Devuelve la máscara (k,) de las que se actualizaron.
+        """
+        indices = np.arange(self.n) if indices is None else np.asarray(indices)
+        conteos = np.asarray(conteos, dtype=np.float32).reshape(len(indices), len(DIRECCIONES))
+        ultimo = self.ultimo[indices]
+        mascara = np.isnan(ultimo) | (ahora - ultimo >= self.intervalo)
+        sel = indices[mascara]
+        self.conteos[sel, :, self.posicion[sel]] = conteos[mascara]
+        self.posicion[sel] = (self.posicion[sel] + 1) % self.historia
+        self.llenos[sel] = np.minimum(self.llenos[sel] + 1, self.historia)
+        self.ultimo[sel] = np.broadcast_to(ahora, mascara.shape)[mascara]
+        return mascara
+
+    def historial(self, i):
+        """Conteos guardados de la intersección `i`, del más antiguo al más reciente: (4, k)"""
+        k = self.llenos[i]
+        orden = (self.posicion[i] - k + np.arange(k)) % self.historia
+        return self.conteos[i][:, orden]
+
+    def flujos(self):
+        """Vehículos/hora por dirección (N, 4): media del histórico * 360"""
+        suma = self.conteos.sum(axis=2)
+        llenos = np.maximum(self.llenos, 1)[:, None]
+        return np.trunc(suma / llenos * 360)
+
+    def predecir(self, conteos_actuales, flujos=None):
+        """
+        Tiempos de verde principal y de giro para todas las intersecciones.
+
+        Parameters:
+        -----------
+        conteos_actuales : array (N, 4)
+            Vehículos visibles ahora; dimensionan los giros.
+        flujos : array (N, 4), opcional
+            Flujo ya calculado; por defecto `self.flujos()`.
+
+        Returns:
+        --------
+        (verde, giro), arreglos (N, 2) con columnas [ns, eo].
+        """
+        flujos = self.flujos() if flujos is None else flujos
+        verde, giro = predecir_tiempos(conteos_actuales, flujos, self.min_verde, self.max_verde,
+                                       self.min_giro, self.max_giro)
+        if self.modo == 'optimo':
+            from src.simulador_colas import optimizar_verdes
+            verde, _ = optimizar_verdes(flujos, self.min_verde, self.max_verde, self.paso_optimo,
+                                        self.carriles, self.saturacion_carril)
+        return verde, giro
+
+    def paso(self, conteos, ahora, flujos_medidos=None):
+        """Actualiza el histórico (con `flujos_medidos` si los hay) y predice"""
+        self.actualizar(conteos if flujos_medidos is None else flujos_medidos, ahora)
+        return self.predecir(conteos)
+
+
+def predecir_tiempos(conteos_actuales, flujos, min_verde=20, max_verde=90, min_giro=15, max_giro=30):
+    """
+    Regla de reparto de PredictorIntersecciones sobre arreglos (N, 4): cada
+    fila puede ser una intersección o un instante de un histórico.
+    Devuelve (verde, giro), arreglos (N, 2) con columnas [ns, eo].
+    """
+    conteos_actuales = np.asarray(conteos_actuales, dtype=np.float64)
+    flujos = np.asarray(flujos, dtype=np.float64)
+    por_eje = np.stack([flujos[:, 0] + flujos[:, 1], flujos[:, 2] + flujos[:, 3]], axis=1)
+    total = por_eje.sum(axis=1, keepdims=True)
+    hay_flujo = total > 0
+    ratio = np.divide(por_eje, total, out=np.zeros_like(por_eje), where=hay_flujo)
+
+    min_verde, max_verde = _columna(min_verde), _columna(max_verde)
+    min_giro, max_giro = _columna(min_giro), _columna(max_giro)
+    verde = np.clip(min_verde + (max_verde - min_verde) * ratio, min_verde, max_verde)
+    eje = np.stack([conteos_actuales[:, 0] + conteos_actuales[:, 1],
+                    conteos_actuales[:, 2] + conteos_actuales[:, 3]], axis=1)
+    giro = np.clip(min_giro + (max_giro - min_giro) * eje / 30, min_giro, max_giro)
+    # Sin flujo se usan los mínimos
+    verde = np.where(hay_flujo, verde, min_verde)
+    giro = np.where(hay_flujo, giro, min_giro)
+    return verde, giro
+
+
+def _columna(valor):
+    # Escalar o arreglo (N,) de límites, con forma que se difunde sobre (N, 2)
+    return valor if np.ndim(valor) == 0 else np.asarray(valor, dtype=np.float64)[:, None]
+
+
+def duraciones_ciclo(verde):
+    """Duraciones (N, 6) de las fases de FASES_CICLO a partir de los verdes (N, 2)"""
+    verde = np.asarray(verde, dtype=np.float64)
+    duraciones = np.empty((len(verde), len(FASES_CICLO)))
+    duraciones[:, 0] = verde[:, 0]
+    duraciones[:, 3] = verde[:, 1]
+    duraciones[:, [1, 4]] = YELLOW_TIME
+    duraciones[:, [2, 5]] = ALL_RED
+    return duraciones
 
 
 class TrafficPredictor:
-    def __init__(self):
-        self.scaler = StandardScaler()
+    """
+    Predictor de una intersección: envoltorio de PredictorIntersecciones con n=1.
+
+    `reloj` (por defecto datetime.now) devuelve la hora actual; inyectar otro
+    permite reproducir históricos sin esperar en tiempo real. `modo` y el
+    resto de opciones se pasan a PredictorIntersecciones.
+
+    Con `aprendizaje` (un PredictorIncremental de src.aprendizaje) cada
+    conteo guardado entrena el modelo y, cuando está listo, su pronóstico
+    del siguiente intervalo sustituye a la media del último minuto.
+    """
+
+    def __init__(self, reloj=None, modo='proporcional', aprendizaje=None, **opciones):
+        self._scaler = None
+        self.aprendizaje = aprendizaje
+        self.reloj = reloj or datetime.now
         self.last_timestamp = None
-        self.historical_counts = {
-            'Norte': deque(maxlen=6),
-            'Sur': deque(maxlen=6),
-            'Este': deque(maxlen=6),
-            'Oeste': deque(maxlen=6)
-        }
+        # Cruces entregados en tics cuya muestra no se aceptó: se suman a la siguiente
+        self.flujo_pendiente = None
+        self.lote = PredictorIntersecciones(1, modo=modo, **opciones)
         # Definir tiempos límite
-        self.MIN_GREEN = 20    
-        self.MAX_GREEN = 90    
-        self.MIN_TURN = 15     
-        self.MAX_TURN = 30     
+        self.MIN_GREEN = 20
+        self.MAX_GREEN = 90
+        self.MIN_TURN = 15
+        self.MAX_TURN = 30
+
+    # Los límites viven en el predictor por lotes
+    MIN_GREEN = property(lambda self: self.lote.min_verde, lambda self, v: setattr(self.lote, 'min_verde', v))
+    MAX_GREEN = property(lambda self: self.lote.max_verde, lambda self, v: setattr(self.lote, 'max_verde', v))
+    MIN_TURN = property(lambda self: self.lote.min_giro, lambda self, v: setattr(self.lote, 'min_giro', v))
+    MAX_TURN = property(lambda self: self.lote.max_giro, lambda self, v: setattr(self.lote, 'max_giro', v))
+
+    @property
+    def historical_counts(self):
+        """
+        Vista de compatibilidad de solo lectura: {direccion: tupla} con los
+        últimos conteos, del más antiguo al más reciente. Es una copia del
+        historial, no el historial: para añadir conteos usa update_counts().
+        """
+        historial = self.lote.historial(0)
+        return MappingProxyType({d: tuple(historial[i].astype(int).tolist()) for i, d in enumerate(DIRECCIONES)})
 
-    def update_counts(self, counts):
+    @property
+    def scaler(self):
+        # sklearn tarda en importarse; solo se carga si alguien usa el escalador
+        if self._scaler is None:
+            from sklearn.preprocessing import StandardScaler
+            self._scaler = StandardScaler()
+        return self._scaler
+
+    def update_counts(self, counts, timestamp=None):
         """
         Actualiza los conteos históricos con nuevos datos
-        
+
         Parameters:
         -----------
         counts : dict
             Diccionario con conteos actuales {'Norte': n, 'Sur': n, 'Este': n, 'Oeste': n}
+        timestamp : datetime, opcional
+            Momento del conteo; por defecto el del reloj.
         """
-        timestamp = datetime.now()
-        if self.last_timestamp is None or (timestamp - self.last_timestamp).seconds >= 10:
+        timestamp = self.reloj() if timestamp is None else timestamp
+        transcurrido = None if self.last_timestamp is None else (timestamp - self.last_timestamp).total_seconds()
+        if transcurrido is None or transcurrido >= self.lote.intervalo - TOLERANCIA_INTERVALO:
             self.last_timestamp = timestamp
-            for direction, count in counts.items():
-                self.historical_counts[direction].append(count)
+            # El intervalo ya se comprobó arriba: se fuerza la escritura
+            self.lote.ultimo[0] = np.nan
+            valores = [counts.get(d, 0) for d in DIRECCIONES]
+            self.lote.actualizar([valores], timestamp.timestamp())
+            if self.aprendizaje is not None:
+                self.aprendizaje.actualizar(valores, timestamp)
             return True
         return False
 
-    def predict_green_times(self, current_counts):
+    def predict_green_times(self, current_counts, flows=None, timestamp=None):
         """
         Predice tiempos óptimos usando los conteos actuales
+
+        Con `flows` (vehículos que cruzaron la línea de detención en el último
+        intervalo, por dirección) el histórico usa ese flujo real en lugar de
+        los vehículos visibles; `current_counts` sigue dimensionando los giros.
         """
-        # Actualizar histórico
-        self.update_counts(current_counts)
-        
-        # Calcular flujos
-        flow_rates = self.calculate_flow_rates()
-        
-        # Flujos agrupados N-S y E-O
-        ns_flow = flow_rates['Norte'] + flow_rates['Sur']
-        eo_flow = flow_rates['Este'] + flow_rates['Oeste']
-        
-        # Calcular tiempos
-        total_flow = ns_flow + eo_flow
-        if total_flow > 0:
-            ns_ratio = ns_flow / total_flow
-            eo_ratio = eo_flow / total_flow
-            
-            base_ns = np.clip(self.MIN_GREEN + (self.MAX_GREEN - self.MIN_GREEN) * ns_ratio, 
-                            self.MIN_GREEN, self.MAX_GREEN)
-            base_eo = np.clip(self.MIN_GREEN + (self.MAX_GREEN - self.MIN_GREEN) * eo_ratio,
-                            self.MIN_GREEN, self.MAX_GREEN)
-            
-            predictions = {
-                'main': {
-                    'ns': base_ns,
-                    'eo': base_eo
-                },
-                'turn': {
-                    'ns': np.clip(self.MIN_TURN + (self.MAX_TURN - self.MIN_TURN) * 
-                                (current_counts['Norte'] + current_counts['Sur']) / 30,
-                                self.MIN_TURN, self.MAX_TURN),
-                    'eo': np.clip(self.MIN_TURN + (self.MAX_TURN - self.MIN_TURN) * 
-                                (current_counts['Este'] + current_counts['Oeste']) / 30,
-                                self.MIN_TURN, self.MAX_TURN)
-                }
-            }
-        else:
-            predictions = {
-                'main': {'ns': self.MIN_GREEN, 'eo': self.MIN_GREEN},
-                'turn': {'ns': self.MIN_TURN, 'eo': self.MIN_TURN}
-            }
-        
+        with metricas.etapa('prediccion'):
+            # Actualizar histórico. Los cruces ya se tomaron de los contadores: si la muestra
+            # no se acepta se guardan para la siguiente en vez de perderlos
+            if flows is not None and self.flujo_pendiente is not None:
+                flows = {d: flows.get(d, 0) + self.flujo_pendiente.get(d, 0) for d in DIRECCIONES}
+            aceptado = self.update_counts(current_counts if flows is None else flows, timestamp)
+            self.flujo_pendiente = None if aceptado or flows is None else flows
+
+            previsto = None if self.aprendizaje is None else self.aprendizaje.predecir()
+            verde, giro = self.lote.predecir([[current_counts.get(d, 0) for d in DIRECCIONES]],
+                                             None if previsto is None else previsto[None])
+        predictions = {
+            'main': {'ns': float(verde[0, 0]), 'eo': float(verde[0, 1])},
+            'turn': {'ns': float(giro[0, 0]), 'eo': float(giro[0, 1])},
+        }
         return predictions, self.calculate_cycle_sequence(predictions)
 
     def calculate_flow_rates(self):
         """Calcula tasas de flujo basadas en los últimos 6 conteos"""
-        flow_rates = {}
-        for direction, counts in self.historical_counts.items():
-            if counts:
-                avg_count = sum(counts) / len(counts)
-                flow_rates[direction] = int(avg_count * 360)
-            else:
-                flow_rates[direction] = 0
-        return flow_rates
+        flujos = self.lote.flujos()[0]
+        return {d: int(f) for d, f in zip(DIRECCIONES, flujos)}
 
     def calculate_cycle_sequence(self, predictions):
         """Calcula la secuencia completa del ciclo"""
-        YELLOW_TIME = 3
-        ALL_RED = 2
-        
-        cycle_sequence = [
-            {
-                'phase': 'NS_MAIN_AND_TURN',
-                'duration': predictions['main']['ns'],
-                'description': 'Verde principal y giro N-S',
-                'states': {
-                    'ns_main': 'GREEN',
-                    'ns_turn': 'GREEN',
-                    'eo_main': 'RED',
-                    'eo_turn': 'RED'
-                }
-            },
-            {
-                'phase': 'NS_YELLOW',
-                'duration': YELLOW_TIME,
-                'description': 'Ámbar N-S',
-                'states': {
-                    'ns_main': 'YELLOW',
-                    'ns_turn': 'YELLOW',
-                    'eo_main': 'RED',
-                    'eo_turn': 'RED'
-                }
-            },
-            {
-                'phase': 'ALL_RED_1',
-                'duration': ALL_RED,
-                'description': 'Todo Rojo',
-                'states': {
-                    'ns_main': 'RED',
-                    'ns_turn': 'RED',
-                    'eo_main': 'RED',
-                    'eo_turn': 'RED'
-                }
-            },
-            {
-                'phase': 'EO_MAIN_AND_TURN',
-                'duration': predictions['main']['eo'],
-                'description': 'Verde principal y giro E-O',
-                'states': {
-                    'ns_main': 'RED',
-                    'ns_turn': 'RED',
-                    'eo_main': 'GREEN',
-                    'eo_turn': 'GREEN'
-                }
-            },
-            {
-                'phase': 'EO_YELLOW',
-                'duration': YELLOW_TIME,
-                'description': 'Ámbar E-O',
-                'states': {
-                    'ns_main': 'RED',
-                    'ns_turn': 'RED',
-                    'eo_main': 'YELLOW',
-                    'eo_turn': 'YELLOW'
-                }
-            },
-            {
-                'phase': 'ALL_RED_2',
-                'duration': ALL_RED,
-                'description': 'Todo Rojo',
-                'states': {
-                    'ns_main': 'RED',
-                    'ns_turn': 'RED',
-                    'eo_main': 'RED',
-                    'eo_turn': 'RED'
-                }
-            }
-        ]
-        return cycle_sequence
\ No newline at end of file
+        duraciones = duraciones_ciclo([[predictions['main']['ns'], predictions['main']['eo']]])[0]
+        return [dict(fase, duration=float(d)) for fase, d in zip(FASES_CICLO, duraciones)]
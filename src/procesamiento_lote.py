@@ -0,0 +1,224 @@
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+EXTENSIONES_VIDEO = ('.mp4', '.avi', '.mov', '.mkv')
+ARCHIVO_ESTADO = "estado_lote.jsonl"
+ARCHIVO_RESUMEN = "resumen_lote.csv"
+CAMPOS_RESUMEN = ['video', 'salida', 'frames_procesados', 'total_vehiculos',
+                  'media_vehiculos', 'max_vehiculos', 'cruces_acumulados', 'segundos', 'cache',
+                  'tasa_escalado']
+
+
+def listar_videos(entrada):
+    """
+    Devuelve la lista de videos a procesar.
+
+    `entrada` puede ser un directorio (se recorre recursivamente) o un
+    manifiesto: .txt con una ruta por línea o .csv con una columna 'video'.
+    Las rutas relativas del manifiesto se resuelven respecto a su carpeta.
+    """
+    if os.path.isdir(entrada):
+        videos = []
+        for raiz, _, archivos in os.walk(entrada):
+            for nombre in archivos:
+                if nombre.lower().endswith(EXTENSIONES_VIDEO):
+                    videos.append(os.path.join(raiz, nombre))
+        return sorted(videos)
+
+    if not os.path.isfile(entrada):
+        raise FileNotFoundError(f"No se encontró la entrada: {entrada}")
+    base = os.path.dirname(os.path.abspath(entrada))
+    with open(entrada, newline='', encoding='utf-8') as f:
+        if entrada.lower().endswith('.csv'):
+            rutas = [fila['video'] for fila in csv.DictReader(f) if fila.get('video')]
+        else:
+            rutas = [linea.strip() for linea in f if linea.strip() and not linea.startswith('#')]
+    return [ruta if os.path.isabs(ruta) else os.path.join(base, ruta) for ruta in rutas]
+
+
+def nombre_salida(video):
+    """Nombre de CSV único por video (incluye un hash corto de la ruta absoluta)"""
+    base = os.path.splitext(os.path.basename(video))[0]
+    sufijo = hashlib.sha1(os.path.abspath(video).encode('utf-8')).hexdigest()[:8]
+    return f"{base}_{sufijo}.csv"
+
+
+def _inicializar_worker(hilos_torch):
+    # Se ejecuta una vez por proceso: fija los hilos de torch y carga el modelo
+    import torch
+    torch.set_num_threads(hilos_torch)
+    from src.vision_vehicular import obtener_modelo
+    obtener_modelo()
+    # Cada worker escribe su propia traza de métricas
+    from src import metricas
+    from src.configuracion import cargar_configuracion
+    metricas.activar_trabajador(cargar_configuracion()['metricas'], os.getpid())
+
+
+def _procesar_uno(video, salida_dir, opciones):
+    from src.vision_vehicular import procesar_video
+
+    opciones = dict(opciones)
+    if opciones.pop('movimiento', False):
+        from src.configuracion import cargar_configuracion
+        from src.movimiento import crear_filtro
+        # --movimiento lo activa aunque esté desactivado en la configuración (como --cascada)
+        opciones['filtro_movimiento'] = crear_filtro(
+            config_movimiento=dict(cargar_configuracion()['movimiento'], activo=True))
+    dir_cache = opciones.pop('dir_cache', None)
+    cache = None
+    if dir_cache is not None:
+        from src.cache_resultados import CacheResultados
+        cache = opciones['cache'] = CacheResultados(dir_cache)
+    if opciones.get('linea') is not None:
+        from src.seguimiento import ContadorLinea
+        x1, y1, x2, y2 = opciones['linea']
+        opciones['linea'] = ContadorLinea((x1, y1), (x2, y2))
+    cascada = None
+    if opciones.pop('cascada', False):
+        from src.cascada import crear_cascada
+        from src.configuracion import cargar_configuracion
+        config = cargar_configuracion()
+        cascada = opciones['cascada'] = crear_cascada(config['modelo'], dict(config['cascada'], activo=True))
+
+    salida = os.path.join(salida_dir, nombre_salida(video))
+    temporal = salida + ".tmp"
+    t0 = time.perf_counter()
+    # Si el worker cayó a mitad de este video, procesar_video reanuda desde su checkpoint
+    resumen = procesar_video(video, output_csv=temporal, reanudar=True, devolver_df=False, **opciones)
+    # Renombrado atómico: un CSV final nunca queda a medio escribir
+    os.replace(temporal, salida)
+    from src import metricas
+    metricas.volcar()
+    return {
+        'video': os.path.abspath(video),
+        'salida': salida,
+        **resumen,
+        'segundos': round(time.perf_counter() - t0, 2),
+        'cache': '' if cache is None else ('acierto' if cache.aciertos else 'fallo'),
+        'tasa_escalado': '' if cascada is None else round(cascada.estadisticas()['tasa_escalado'], 4),
+    }
+
+
+def _cargar_estado(ruta_estado):
+    completados = {}
+    if not os.path.exists(ruta_estado):
+        return completados
+    with open(ruta_estado, encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                # Línea truncada por una caída: se ignora y el video se repite
+                continue
+            if os.path.exists(registro.get('salida', '')):
+                completados[registro['video']] = registro
+    return completados
+
+
+def procesar_lote(entrada, salida_dir, procesos=None, hilos_torch=1, salto_frames=3,
+                  modo_salto='grab', intervalo_ms=None, movimiento=False, dir_cache=None, linea=None,
+                  cascada=False):
+    """
+    Procesa muchos videos sin interfaz repartiéndolos en un pool de procesos.
+
+    Cada worker carga el modelo una sola vez. Cada video produce su propio CSV
+    en `salida_dir`, se registra en un archivo de estado al terminar y, al
+    final, se escribe un resumen combinado. Si la ejecución se interrumpe,
+    volver a lanzarla omite los videos ya completados.
+
+    Parameters:
+    -----------
+    procesos : int, opcional
+        Número de procesos worker. Por defecto núcleos // hilos_torch.
+    hilos_torch : int
+        Hilos intra-op de torch por worker (procesos * hilos_torch ~ núcleos).
+    movimiento : bool
+        Activa el pre-filtro de movimiento (ver src.movimiento) en cada video.
+    dir_cache : str, opcional
+        Directorio de la caché de detecciones (ver src.cache_resultados).
+    linea : (x1, y1, x2, y2), opcional
+        Línea de conteo común a todos los videos: añade el seguimiento y los
+        cruces acumulados (ver src.seguimiento).
+    cascada : bool
+        Usa la cascada nano -> modelo principal (ver src.cascada).
+    """
+    os.makedirs(salida_dir, exist_ok=True)
+    if procesos is None:
+        procesos = max(1, (os.cpu_count() or 1) // hilos_torch)
+
+    ruta_estado = os.path.join(salida_dir, ARCHIVO_ESTADO)
+    completados = _cargar_estado(ruta_estado)
+    videos = listar_videos(entrada)
+    pendientes = [v for v in videos if os.path.abspath(v) not in completados]
+    print(f"🎬 {len(videos)} videos, {len(videos) - len(pendientes)} ya completados, "
+          f"{len(pendientes)} pendientes ({procesos} procesos x {hilos_torch} hilos)")
+
+    opciones = {'salto_frames': salto_frames, 'modo_salto': modo_salto, 'intervalo_ms': intervalo_ms,
+                'movimiento': movimiento, 'dir_cache': dir_cache, 'linea': linea, 'cascada': cascada}
+    errores = []
+    if pendientes:
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                                 initializer=_inicializar_worker, initargs=(hilos_torch,)) as pool, \
+                open(ruta_estado, 'a', encoding='utf-8') as estado:
+            futuros = {pool.submit(_procesar_uno, v, salida_dir, opciones): v for v in pendientes}
+            for futuro in as_completed(futuros):
+                video = futuros[futuro]
+                try:
+                    registro = futuro.result()
+                except Exception as e:
+                    errores.append((video, e))
+                    print(f"❌ Error en {video}: {e}")
+                    continue
+                estado.write(json.dumps(registro) + "\n")
+                estado.flush()
+                completados[registro['video']] = registro
+
+    ruta_resumen = os.path.join(salida_dir, ARCHIVO_RESUMEN)
+    with open(ruta_resumen, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS_RESUMEN)
+        writer.writeheader()
+        for video in sorted(completados):
+            writer.writerow(completados[video])
+    print(f"✅ Resumen guardado en: {ruta_resumen} ({len(errores)} errores)")
+    if dir_cache is not None:
+        from src.cache_resultados import CacheResultados
+        aciertos = sum(1 for r in completados.values() if r.get('cache') == 'acierto')
+        print(f"🗃️ Caché: {aciertos} aciertos / {len(completados)} videos, {CacheResultados(dir_cache).informe()}")
+    return ruta_resumen, errores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conteo vehicular por lotes sin interfaz gráfica")
+    parser.add_argument("entrada", help="Directorio de videos o manifiesto (.txt/.csv)")
+    parser.add_argument("salida", help="Directorio de salida")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--hilos-torch", type=int, default=1)
+    parser.add_argument("--salto-frames", type=int, default=3)
+    parser.add_argument("--modo-salto", default='grab', choices=['grab', 'seek', 'keyframes'])
+    parser.add_argument("--intervalo-ms", type=float, default=None)
+    parser.add_argument("--movimiento", action="store_true", help="Omitir YOLO en escenas estáticas")
+    parser.add_argument("--cache", default=None, help="Directorio de caché de detecciones")
+    parser.add_argument("--linea", default=None, metavar="X1,Y1,X2,Y2",
+                        help="Línea de conteo: sigue vehículos y cuenta cruces únicos")
+    parser.add_argument("--cascada", action="store_true",
+                        help="Modelo nano en todos los frames y el principal solo en los dudosos")
+    args = parser.parse_args(argv)
+    linea = [float(v) for v in args.linea.split(',')] if args.linea else None
+    if linea is not None and len(linea) != 4:
+        parser.error("--linea necesita cuatro valores: X1,Y1,X2,Y2")
+    _, errores = procesar_lote(args.entrada, args.salida, args.procesos, args.hilos_torch,
+                               args.salto_frames, args.modo_salto, args.intervalo_ms, args.movimiento,
+                               args.cache, linea, args.cascada)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,449 @@
+import multiprocessing
+import os
+import queue
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Cabecera de cada ranura (int64): secuencia (impar mientras se escribe), tamaño de la imagen,
+# detecciones publicadas, conteo, cruces acumulados (-1 sin línea) y tamaño del frame original
+SECUENCIA, ALTO, ANCHO, N_DET, CONTEO, CRUCES, ALTO_ORIGINAL, ANCHO_ORIGINAL = range(8)
+# Control compartido (float64): escrito por el trabajador (latido, contadores) o por la GUI (tasa,
+# visible, segundos mínimos entre imágenes y escala de la imagen respecto al tamaño del anillo).
+# Conteo y cruces de la última inferencia se publican aquí en cada inferencia, se dibuje o no
+# el frame; GENERACION dice de qué línea (o de qué trabajador) son esos cruces
+LATIDO, TASA, VISIBLE, CAPTURADOS, INFERIDOS, PERIODO_RENDER, ESCALA_RENDER, CONTEO_VIVO, CRUCES_VIVOS, \
+    GENERACION = range(10)
+TAMANO_CONTROL = 16
+# Código de salida del trabajador cuando la fuente no se puede abrir
+SALIDA_FUENTE = 2
+
+
+def componer_vista(frame, detecciones, salida, ancho, alto, poligono=None, poligono_cerrado=True,
+                   punto_linea=None, linea=None, pistas=None):
+    """
+    Reduce el frame al tamaño de la vista, dibuja ROI, detecciones, línea y
+    pistas ya escaladas y lo convierte a RGB directamente en el buffer
+    trasero de `salida` (BufferDoble o AnilloFrames), que después publica.
+    """
+    import cv2
+    from src.detecciones import dibujar_detecciones
+    from src.seguimiento import dibujar_linea, dibujar_pistas
+
+    fh, fw = frame.shape[:2]
+    escala = min(ancho / fw, alto / fh)
+    w, h = max(1, int(fw * escala)), max(1, int(fh * escala))
+    reducido = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+
+    if poligono:
+        cv2.polylines(reducido, [(np.array(poligono) * escala).astype(np.int32)], poligono_cerrado,
+                      (241, 196, 15), 2)
+    dibujar_detecciones(reducido, detecciones, escala, (46, 204, 113), (241, 196, 15),
+                        numerar=pistas is None, tam_texto=0.7)
+    if punto_linea is not None:
+        cv2.circle(reducido, tuple((np.array(punto_linea) * escala).astype(int).tolist()), 4, (52, 152, 219), -1)
+    elif linea is not None:
+        dibujar_linea(reducido, linea, escala)
+        if pistas is not None:
+            dibujar_pistas(reducido, *pistas, escala)
+
+    cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB, dst=salida.trasero((h, w, 3), reducido.dtype))
+    salida.publicar((fh, fw))
+
+
+class AnilloFrames:
+    """
+    Anillo de ranuras en memoria compartida (multiprocessing.shared_memory)
+    para publicar imágenes y detecciones de un proceso a otro sin serializar.
+
+    Cada ranura tiene un número de secuencia a modo de seqlock: el escritor
+    lo deja impar mientras escribe y par al publicar, y `ultima` apunta a la
+    ranura publicada más reciente. El lector copia esa ranura a un buffer
+    propio y comprueba después que la secuencia no cambió; si cambió, la
+    copia se descarta y se repite. Con varias ranuras el escritor tendría que
+    publicar `ranuras - 1` frames durante una sola copia para pisarla.
+
+    Tiene la misma interfaz que BufferDoble (`trasero`, `publicar`, `leer`),
+    así que sirve de `salida` para PipelineVideo.
+
+    Parameters:
+    -----------
+    nombre : str, opcional
+        Bloque existente al que adjuntarse (en el proceso trabajador); sin
+        nombre se crea uno nuevo.
+    alto, ancho : int
+        Tamaño máximo de la imagen publicada.
+    max_detecciones : int
+        Filas [x1, y1, x2, y2, conf, clase] por ranura; el resto se recorta.
+    """
+
+    def __init__(self, nombre=None, ranuras=4, alto=340, ancho=600, max_detecciones=256):
+        self.ranuras = ranuras
+        self.alto = alto
+        self.ancho = ancho
+        self.max_detecciones = max_detecciones
+        tamanos = [8 * 8, TAMANO_CONTROL * 8, ranuras * 8 * 8, ranuras * alto * ancho * 3, ranuras * max_detecciones * 6 * 4]
+        self.creado = nombre is None
+        # El trabajador (hijo 'spawn') comparte el resource_tracker del creador, que es quien lo borra
+        self.shm = shared_memory.SharedMemory(name=nombre, create=self.creado, size=sum(tamanos))
+        offsets = np.cumsum([0] + tamanos)
+        buf = self.shm.buf
+        self.estado = np.ndarray((8,), np.int64, buf, offsets[0])
+        self.control = np.ndarray((TAMANO_CONTROL,), np.float64, buf, offsets[1])
+        self.cabeceras = np.ndarray((ranuras, 8), np.int64, buf, offsets[2])
+        self.imagenes = np.ndarray((ranuras, alto * ancho * 3), np.uint8, buf, offsets[3])
+        self.detecciones = np.ndarray((ranuras, max_detecciones, 6), np.float32, buf, offsets[4])
+        if self.creado:
+            self.estado[:] = 0
+            self.control[:] = 0
+            self.cabeceras[:] = 0
+            self.control[VISIBLE] = 1
+            self.control[ESCALA_RENDER] = 1
+            self.control[CRUCES_VIVOS] = -1
+        self.rasgadas = 0
+        # Buffers del lector (solo si lee): la copia en curso y la última imagen leída entera
+        self.copia = self.buena = None
+        self.forma_buena, self.secuencia_buena = (0, 0), 0
+
+    @property
+    def nombre(self):
+        return self.shm.name
+
+    def parametros(self):
+        """Argumentos para adjuntarse al mismo bloque desde otro proceso"""
+        return {'nombre': self.nombre, 'ranuras': self.ranuras, 'alto': self.alto, 'ancho': self.ancho,
+                'max_detecciones': self.max_detecciones}
+
+    # --- Escritor ---
+
+    def _ranura_siguiente(self):
+        return int(self.estado[0] + 1) % self.ranuras
+
+    def trasero(self, forma, dtype=np.uint8):
+        """Imagen (alto, ancho, 3) contigua dentro de la siguiente ranura; la marca en escritura"""
+        h, w = forma[:2]
+        if h > self.alto or w > self.ancho:
+            raise ValueError(f"Imagen {w}x{h} mayor que el anillo ({self.ancho}x{self.alto})")
+        ranura = self._ranura_siguiente()
+        cabecera = self.cabeceras[ranura]
+        if cabecera[SECUENCIA] % 2 == 0:
+            cabecera[SECUENCIA] += 1
+        cabecera[ALTO], cabecera[ANCHO] = h, w
+        return self.imagenes[ranura, :h * w * 3].reshape(h, w, 3)
+
+    def escribir_detecciones(self, datos, conteo, cruces=-1):
+        """Detecciones (N, 6) del frame que se va a publicar, su conteo y los cruces acumulados"""
+        ranura = self._ranura_siguiente()
+        n = min(len(datos), self.max_detecciones)
+        self.detecciones[ranura, :n] = datos[:n]
+        cabecera = self.cabeceras[ranura]
+        cabecera[N_DET], cabecera[CONTEO], cabecera[CRUCES] = n, conteo, cruces
+
+    def publicar(self, forma_original=(0, 0)):
+        ranura = self._ranura_siguiente()
+        cabecera = self.cabeceras[ranura]
+        cabecera[ALTO_ORIGINAL], cabecera[ANCHO_ORIGINAL] = forma_original
+        cabecera[SECUENCIA] += 1
+        self.estado[0] += 1
+
+    # --- Lector ---
+
+    @property
+    def secuencia(self):
+        return int(self.estado[0])
+
+    def ultima_cabecera(self):
+        """Copia de la cabecera de la última ranura publicada (None si aún no hay ninguna)"""
+        ultima = self.secuencia
+        return None if not ultima else self.cabeceras[ultima % self.ranuras].copy()
+
+    def _copiar(self, ranura, n, destino):
+        destino[:n] = self.imagenes[ranura, :n]
+
+    @contextmanager
+    def leer(self, reintentos=2):
+        """
+        Entrega (imagen, secuencia) de la última ranura, copiada a un buffer del
+        lector y validada con la secuencia de la ranura; la imagen no debe
+        usarse fuera del bloque. Si el escritor la pisó durante la copia se
+        cuenta en `rasgadas` y se reintenta; si sigue rasgada se entrega la
+        última imagen buena, nunca una a medio escribir.
+        """
+        if self.copia is None:
+            self.copia = np.empty(self.alto * self.ancho * 3, np.uint8)
+            self.buena = np.empty_like(self.copia)
+        ultima = self.secuencia
+        for _ in range(reintentos + 1):
+            ultima = self.secuencia
+            ranura = ultima % self.ranuras
+            cabecera = self.cabeceras[ranura]
+            inicio = int(cabecera[SECUENCIA])
+            if not ultima or inicio % 2:
+                yield None, ultima
+                return
+            h, w = int(cabecera[ALTO]), int(cabecera[ANCHO])
+            self._copiar(ranura, h * w * 3, self.copia)
+            if int(cabecera[SECUENCIA]) == inicio:
+                self.copia, self.buena = self.buena, self.copia
+                self.forma_buena, self.secuencia_buena = (h, w), ultima
+                yield self.buena[:h * w * 3].reshape(h, w, 3), ultima
+                return
+            self.rasgadas += 1
+        if not self.secuencia_buena:
+            yield None, ultima
+            return
+        h, w = self.forma_buena
+        yield self.buena[:h * w * 3].reshape(h, w, 3), self.secuencia_buena
+
+    def ultimas_detecciones(self):
+        """Copia de las detecciones (N, 6) de la última ranura publicada"""
+        ultima = self.secuencia
+        ranura = ultima % self.ranuras
+        return self.detecciones[ranura, :int(self.cabeceras[ranura, N_DET])].copy()
+
+    def cerrar(self):
+        # Las vistas NumPy mantienen exportado el buffer: hay que soltarlas antes de cerrar
+        self.estado = self.control = self.cabeceras = self.imagenes = self.detecciones = None
+        self.shm.close()
+        if self.creado:
+            self.shm.unlink()
+
+
+class _Camara:
+    """Acceso dentro del proceso trabajador: AccesoConteo más los comandos y el dibujo de la GUI"""
+
+    def __init__(self, anillo, direccion, config, roi, linea, comandos, generacion=0):
+        from src.acceso import AccesoConteo
+        self.anillo = anillo
+        self.comandos = comandos
+        self.generacion = generacion
+        self.edicion = None
+        self.t_render = 0.0
+        self.acceso = AccesoConteo(direccion, config, roi, linea, tasa_max=lambda: anillo.control[TASA])
+
+    def debe_renderizar(self):
+        # Oculta no se dibuja; en miniatura, como mucho una imagen cada PERIODO_RENDER segundos
+        control = self.anillo.control
+        if control[VISIBLE] <= 0:
+            return False
+        ahora = time.monotonic()
+        if ahora - self.t_render < control[PERIODO_RENDER]:
+            return False
+        self.t_render = ahora
+        return True
+
+    def atender_comandos(self):
+        while True:
+            try:
+                comando, valor = self.comandos.get_nowait()
+            except queue.Empty:
+                return
+            if comando == 'roi':
+                self.acceso.set_roi(valor)
+            elif comando == 'linea':
+                linea, self.generacion = valor
+                self.acceso.set_linea(linea)
+            elif comando == 'edicion':
+                self.edicion = valor
+
+    def inferir(self, frame):
+        self.atender_comandos()
+        inferencias = self.acceso.inferencias
+        detecciones = self.acceso.inferir(frame)
+        # Conteo y cruces en cada inferencia: la GUI los necesita aunque la vista esté oculta.
+        # La generación se escribe la última, así al verla nueva los cruces ya son de esa línea
+        control, linea = self.anillo.control, self.acceso.linea
+        control[CONTEO_VIVO] = self.acceso.count
+        control[CRUCES_VIVOS] = -1 if linea is None else linea.total
+        control[GENERACION] = self.generacion
+        if self.acceso.inferencias != inferencias:
+            control[INFERIDOS] += 1
+        return detecciones
+
+    def dibujar(self, frame, detecciones, salida):
+        acceso = self.acceso
+        linea, roi = acceso.linea, acceso.roi
+        datos = np.concatenate([detecciones.xyxy, detecciones.confianzas[:, None],
+                                detecciones.clases[:, None].astype(np.float32)], axis=1)
+        salida.escribir_detecciones(datos, len(detecciones), -1 if linea is None else linea.total)
+        edicion = self.edicion
+        poligono, cerrado, punto = (roi.a_lista() if roi else None), True, None
+        if edicion is not None and edicion[0] == 'roi':
+            poligono, cerrado = edicion[1], False
+        elif edicion is not None and edicion[0] == 'linea':
+            punto = edicion[1][0] if edicion[1] else None
+        escala = min(1.0, self.anillo.control[ESCALA_RENDER]) or 1.0
+        componer_vista(frame, detecciones, salida, int(self.anillo.ancho * escala), int(self.anillo.alto * escala),
+                       poligono, cerrado, punto, linea, acceso.pistas if acceso.seguidor is not None else None)
+
+
+def _trabajar(anillo_params, fuente, direccion, config, roi, linea, parada, comandos, hilos_torch, generacion=0):
+    # Proceso trabajador de una cámara: captura, inferencia y dibujo; publica en el anillo
+    from src import metricas
+    from src.pipeline_video import PipelineVideo
+    metricas.activar_trabajador(config['metricas'], os.getpid())
+    if hilos_torch:
+        import torch
+        torch.set_num_threads(hilos_torch)
+    anillo = AnilloFrames(**anillo_params)
+    camara = _Camara(anillo, direccion, config, roi, linea, comandos, generacion)
+    pipeline = PipelineVideo(fuente, camara.inferir, camara.dibujar, salida=anillo,
+                             debe_renderizar=camara.debe_renderizar, nombre=direccion)
+    try:
+        pipeline.iniciar()
+    except IOError:
+        anillo.cerrar()
+        raise SystemExit(SALIDA_FUENTE)
+    captura = pipeline.hilos[0]
+    try:
+        while not parada.is_set() and all(hilo.is_alive() for hilo in pipeline.hilos):
+            anillo.control[LATIDO] = time.time()
+            anillo.control[CAPTURADOS] = pipeline.frames_capturados
+            parada.wait(0.2)
+        # Si la captura sigue viva otra etapa murió por un error: sale con fallo para que se reinicie
+        fallo = not parada.is_set() and captura.is_alive()
+    finally:
+        pipeline.detener(timeout=5)
+        anillo.cerrar()
+        metricas.cerrar()
+    if fallo:
+        raise SystemExit(1)
+
+
+class ProcesoCamara:
+    """
+    Captura e inferencia de una cámara en un proceso aparte (sin compartir el
+    GIL con la GUI). Las imágenes ya dibujadas y las detecciones llegan por un
+    AnilloFrames; la GUI solo las muestra.
+
+    `vigilar()` se llama periódicamente desde la GUI: si el trabajador murió
+    (código distinto de 0) o su latido se detuvo más de `latido_max`
+    segundos, se vuelve a lanzar con la ROI y la línea actuales, hasta
+    `max_reinicios` veces. Los cruces acumulados se conservan entre reinicios.
+
+    Tiene `salida`, `detener()` y `estadisticas()` como PipelineVideo.
+    """
+
+    def __init__(self, fuente, direccion, config, roi=None, linea=None, ancho=600, alto=340,
+                 ranuras=4, max_detecciones=256, max_reinicios=5, latido_max=10.0, hilos_torch=None):
+        self.fuente = fuente
+        self.direccion = direccion
+        self.config = config
+        self.roi = roi
+        self.linea = linea
+        self.max_reinicios = max_reinicios
+        self.latido_max = latido_max
+        self.hilos_torch = hilos_torch
+        self.contexto = multiprocessing.get_context('spawn')
+        self.salida = AnilloFrames(None, ranuras, alto, ancho, max_detecciones)
+        self.proceso = None
+        self.parada = None
+        self.comandos = None
+        self.t_lanzamiento = None
+        self.reinicios = 0
+        self.cruces_base = 0
+        self.cruces_ultimos = 0
+        # Cambia con cada línea nueva y cada reinicio: los cruces publicados con otra
+        # generación son de la línea o del trabajador anteriores
+        self.generacion = 0
+
+    def iniciar(self):
+        self.parada = self.contexto.Event()
+        self.comandos = self.contexto.Queue()
+        self.salida.control[LATIDO] = 0
+        self.proceso = self.contexto.Process(
+            target=_trabajar, daemon=True,
+            args=(self.salida.parametros(), self.fuente, self.direccion, self.config, self.roi, self.linea,
+                  self.parada, self.comandos, self.hilos_torch, self.generacion))
+        self.proceso.start()
+        self.t_lanzamiento = time.time()
+
+    def _parar_proceso(self, timeout):
+        self.parada.set()
+        self.proceso.join(timeout)
+        if self.proceso.is_alive():
+            self.proceso.terminate()
+            self.proceso.join(timeout)
+        self.comandos.close()
+        self.proceso = None
+
+    def detener(self, timeout=2):
+        if self.proceso is not None:
+            self._parar_proceso(timeout)
+        self.salida.cerrar()
+
+    def enviar(self, comando, valor):
+        """Cambia la ROI ('roi'), la línea ('linea') o la edición en curso ('edicion') del trabajador"""
+        if comando == 'roi':
+            self.roi = valor
+        elif comando == 'linea':
+            self.linea = valor
+            self.cruces_base = self.cruces_ultimos = 0
+            self.generacion += 1
+            valor = (valor, self.generacion)
+        if self.proceso is not None:
+            self.comandos.put((comando, valor))
+
+    def fijar_control(self, tasa=0.0, visible=True, periodo_render=0.0, escala_render=1.0):
+        """
+        Tasa máxima de inferencias/s (0 sin límite), si la vista se está
+        mostrando y, para miniaturas, segundos mínimos entre imágenes y escala
+        de la imagen dibujada.
+        """
+        control = self.salida.control
+        control[TASA] = tasa
+        control[VISIBLE] = 1 if visible else 0
+        control[PERIODO_RENDER] = periodo_render
+        control[ESCALA_RENDER] = escala_render
+
+    def vigilar(self):
+        """
+        Comprueba el trabajador: 'activo', 'reiniciado', 'terminado' (fin de
+        la fuente), 'sin_fuente' o 'fallido' (se agotaron los reinicios).
+        """
+        if self.proceso is None:
+            return 'fallido'
+        latido = self.salida.control[LATIDO] or self.t_lanzamiento
+        colgado = self.proceso.is_alive() and time.time() - latido > self.latido_max
+        if self.proceso.is_alive() and not colgado:
+            return 'activo'
+        codigo = self.proceso.exitcode
+        if not colgado and codigo == 0:
+            return 'terminado'
+        if codigo == SALIDA_FUENTE:
+            return 'sin_fuente'
+        self._parar_proceso(1)
+        if self.reinicios >= self.max_reinicios:
+            return 'fallido'
+        self.reinicios += 1
+        # El trabajador nuevo empieza sus cruces en 0
+        self.cruces_base += self.cruces_ultimos
+        self.cruces_ultimos = 0
+        self.generacion += 1
+        self.iniciar()
+        return 'reiniciado'
+
+    @property
+    def conteo(self):
+        """Vehículos de la última inferencia del trabajador (se publica aunque no se dibuje)"""
+        return int(self.salida.control[CONTEO_VIVO])
+
+    @property
+    def cruces(self):
+        """Cruces acumulados de la línea, sumando los de trabajadores anteriores"""
+        control = self.salida.control
+        if control[GENERACION] == self.generacion and control[CRUCES_VIVOS] >= 0:
+            self.cruces_ultimos = max(self.cruces_ultimos, int(control[CRUCES_VIVOS]))
+        return self.cruces_base + self.cruces_ultimos
+
+    def estadisticas(self):
+        control = self.salida.control
+        return {
+            'capturados': int(control[CAPTURADOS]),
+            'inferidos': int(control[INFERIDOS]),
+            'publicados': self.salida.secuencia,
+            'rasgados': self.salida.rasgadas,
+            'reinicios': self.reinicios,
+        }
@@ -0,0 +1,239 @@
+import argparse
+import multiprocessing
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from src.almacenamiento import DIRECCIONES, FORMATO_TIMESTAMP
+from src.prediccion_AI import MODOS
+
+INTERVALO = 10.0
+# Límites de TrafficPredictor que se pueden barrer
+PARAMETROS = ('MIN_GREEN', 'MAX_GREEN', 'MIN_TURN', 'MAX_TURN')
+POR_DEFECTO = {'MIN_GREEN': 20, 'MAX_GREEN': 90, 'MIN_TURN': 15, 'MAX_TURN': 30}
+
+
+def cargar_historico(ruta, interseccion=None, tam_bloque=100_000):
+    """
+    Lee por bloques un histórico con el formato de conteo_vehiculos.csv
+    (timestamp, Norte, Sur, Este, Oeste) o una exportación con columna
+    'interseccion'. Devuelve (ts (T,) en segundos, conteos (T, 4)) ordenados.
+    """
+    import pandas as pd
+    tiempos, conteos = [], []
+    for bloque in pd.read_csv(ruta, chunksize=tam_bloque):
+        if 'interseccion' in bloque:
+            if interseccion is None:
+                nombres = bloque['interseccion'].unique()
+                if len(nombres) > 1:
+                    raise ValueError(f"El archivo tiene varias intersecciones ({', '.join(map(str, nombres))}): "
+                                     "indica cuál reproducir")
+            else:
+                bloque = bloque[bloque['interseccion'] == interseccion]
+        # Hora local, como datetime.timestamp() en vivo (datetime64 la tomaría como UTC)
+        tiempos.append(np.fromiter((datetime.strptime(t, FORMATO_TIMESTAMP).timestamp() for t in bloque['timestamp']),
+                                   np.float64, len(bloque)))
+        conteos.append(bloque[list(DIRECCIONES)].to_numpy(np.float32))
+    if not tiempos:
+        return np.zeros(0), np.zeros((0, len(DIRECCIONES)), np.float32)
+    ts, conteos = np.concatenate(tiempos), np.concatenate(conteos)
+    orden = np.argsort(ts, kind='stable')
+    return ts[orden], conteos[orden]
+
+
+def cargar_salidas_video(rutas, fps, inicio=0.0, intervalo=INTERVALO, formato='csv'):
+    """
+    Convierte salidas de procesar_video, una por dirección ({'Norte': ruta, ...}),
+    en una serie por intervalos de `intervalo` segundos. Con la columna
+    'cruces_acumulados' se usan los cruces de cada intervalo (flujo real);
+    si no, la media de vehículos visibles.
+    """
+    from src.salida_conteo import leer_conteo
+    series = {}
+    for direccion, ruta in rutas.items():
+        df = leer_conteo(ruta, formato)
+        intervalos = (df['frame'].to_numpy() / fps // intervalo).astype(np.int64)
+        n = intervalos.max() + 1 if len(intervalos) else 0
+        if 'cruces_acumulados' in df:
+            ultimo = np.zeros(n)
+            np.maximum.at(ultimo, intervalos, df['cruces_acumulados'].to_numpy())
+            ultimo = np.maximum.accumulate(ultimo)
+            series[direccion] = np.diff(ultimo, prepend=0.0)
+        else:
+            suma = np.bincount(intervalos, df['vehiculos_detectados'].to_numpy(), minlength=n)
+            series[direccion] = suma / np.maximum(np.bincount(intervalos, minlength=n), 1)
+    n = max((len(v) for v in series.values()), default=0)
+    conteos = np.zeros((n, len(DIRECCIONES)), np.float32)
+    for i, direccion in enumerate(DIRECCIONES):
+        if direccion in series:
+            conteos[:len(series[direccion]), i] = series[direccion]
+    return inicio + (np.arange(n) + 1) * intervalo, conteos
+
+
+def crear_predictor(reloj, parametros=None, modo=None, config=None):
+    """
+    TrafficPredictor configurado como en el dashboard (modo, carriles,
+    saturación, paso óptimo y aprendizaje de visotraf_config.json), con el
+    reloj de la repetición y los límites de `parametros` sobrescritos.
+    """
+    from src.aprendizaje import crear_aprendizaje
+    from src.prediccion_AI import TrafficPredictor
+    if config is None:
+        from src.configuracion import cargar_configuracion
+        config = cargar_configuracion()
+    config_prediccion = config['prediccion']
+    predictor = TrafficPredictor(
+        reloj=reloj, modo=modo or config_prediccion['modo'], aprendizaje=crear_aprendizaje(config['aprendizaje']),
+        carriles=tuple(config_prediccion['carriles']), saturacion_carril=config_prediccion['saturacion_carril'],
+        paso_optimo=config_prediccion['paso_optimo'])
+    for nombre, valor in (parametros or {}).items():
+        setattr(predictor, nombre, valor)
+    return predictor
+
+
+def reproducir(ts, conteos, parametros=None, modo=None, config=None, cruces=None):
+    """
+    Reproduce un histórico por TrafficPredictor, fila a fila y sin esperar:
+    el reloj inyectado marca el timestamp de cada fila, así la compuerta de
+    intervalo, el aprendizaje y el modo óptimo son los del código en vivo.
+
+    Cada fila es un tick de predicción (como las llamadas cada 10 s del
+    dashboard); `cruces` (T, 4), si se da, son los flujos medidos en la línea
+    de detención de cada tick. Devuelve el plan: dict con 'ts', 'flujos'
+    (T, 4) del histórico del predictor, 'verde' (T, 2), 'giro' (T, 2) y
+    'ciclo' (T,) en segundos.
+    """
+    momento = [None]
+    predictor = crear_predictor(lambda: momento[0], parametros, modo, config)
+    n = len(ts)
+    flujos = np.zeros((n, len(DIRECCIONES)))
+    verde, giro, ciclo = np.zeros((n, 2)), np.zeros((n, 2)), np.zeros(n)
+    for i, (t, fila) in enumerate(zip(ts.tolist(), conteos.tolist())):
+        momento[0] = datetime.fromtimestamp(t)
+        medidos = None if cruces is None else dict(zip(DIRECCIONES, cruces[i].tolist()))
+        predicciones, fases = predictor.predict_green_times(dict(zip(DIRECCIONES, fila)), medidos)
+        flujos[i] = predictor.lote.flujos()[0]
+        verde[i] = predicciones['main']['ns'], predicciones['main']['eo']
+        giro[i] = predicciones['turn']['ns'], predicciones['turn']['eo']
+        ciclo[i] = sum(fase['duration'] for fase in fases)
+    return {'ts': ts, 'flujos': flujos, 'verde': verde, 'giro': giro, 'ciclo': ciclo}
+
+
+def metricas(conteos, plan):
+    """
+    Resumen de un plan: ciclo y verdes medios, desajuste medio entre el
+    reparto de verde N-S y la proporción de demanda N-S del tick siguiente,
+    y demora media por vehículo en el simulador de colas.
+    """
+    from src.simulador_colas import simular
+    verde = plan['verde']
+    demanda = np.stack([conteos[:, 0] + conteos[:, 1], conteos[:, 2] + conteos[:, 3]], axis=1)
+    total = demanda[1:].sum(axis=1)
+    validos = total > 0
+    reparto_verde = verde[:-1, 0] / verde[:-1].sum(axis=1)
+    reparto_demanda = demanda[1:, 0] / np.where(validos, total, 1)
+    ts = plan['ts']
+    return {
+        'ticks': len(ts),
+        'horas': round(float(ts[-1] - ts[0]) / 3600, 2) if len(ts) else 0.0,
+        'ciclo_medio': float(plan['ciclo'].mean()) if len(ts) else 0.0,
+        'verde_ns_medio': float(verde[:, 0].mean()) if len(ts) else 0.0,
+        'verde_eo_medio': float(verde[:, 1].mean()) if len(ts) else 0.0,
+        'giro_ns_medio': float(plan['giro'][:, 0].mean()) if len(ts) else 0.0,
+        'giro_eo_medio': float(plan['giro'][:, 1].mean()) if len(ts) else 0.0,
+        'desajuste_medio': float(np.abs(reparto_verde - reparto_demanda)[validos].mean()) if validos.any() else 0.0,
+        'demora_media': float(simular(plan['flujos'], verde)['demora'].mean()) if len(ts) else 0.0,
+    }
+
+
+def guardar_plan(ruta, plan):
+    """Escribe el plan de ciclos como CSV (timestamp, verdes, giros y ciclo)"""
+    import pandas as pd
+    pd.DataFrame({
+        'timestamp': [datetime.fromtimestamp(t).strftime(FORMATO_TIMESTAMP) for t in plan['ts'].tolist()],
+        'verde_ns': plan['verde'][:, 0], 'verde_eo': plan['verde'][:, 1],
+        'giro_ns': plan['giro'][:, 0], 'giro_eo': plan['giro'][:, 1],
+        'ciclo': plan['ciclo'],
+    }).round(2).to_csv(ruta, index=False)
+
+
+# Datos compartidos por los workers del barrido (se envían una vez por proceso)
+_datos_barrido = None
+
+
+def _inicializar_barrido(ts, conteos, modo=None, config=None):
+    global _datos_barrido
+    _datos_barrido = (ts, conteos, modo, config)
+
+
+def _evaluar(combinacion):
+    ts, conteos, modo, config = _datos_barrido
+    parametros = dict(zip(PARAMETROS, combinacion))
+    return dict(parametros, **metricas(conteos, reproducir(ts, conteos, parametros, modo, config)))
+
+
+def barrer(ts, conteos, rejilla, procesos=None, criterio='desajuste_medio', modo=None, config=None):
+    """
+    Evalúa todas las combinaciones de la rejilla, p. ej.
+    {'MIN_GREEN': [15, 20], 'MAX_GREEN': [60, 90]}, repartidas entre
+    `procesos` procesos; cada una es una repetición completa por
+    TrafficPredictor. Devuelve la lista de resultados ordenada por `criterio`.
+    """
+    if config is None:
+        from src.configuracion import cargar_configuracion
+        config = cargar_configuracion()
+    valores = [rejilla.get(nombre, [POR_DEFECTO[nombre]]) for nombre in PARAMETROS]
+    combinaciones = [c for c in product(*valores) if c[0] <= c[1] and c[2] <= c[3]]
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(combinaciones) < 2 * procesos:
+        _inicializar_barrido(ts, conteos, modo, config)
+        resultados = [_evaluar(c) for c in combinaciones]
+    else:
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=_inicializar_barrido,
+                                 initargs=(ts, conteos, modo, config)) as pool:
+            resultados = list(pool.map(_evaluar, combinaciones,
+                                       chunksize=max(1, len(combinaciones) // (4 * procesos))))
+    return sorted(resultados, key=lambda r: r[criterio])
+
+
+def _lista(texto):
+    return [float(v) for v in texto.split(',')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce históricos por el predictor y ajusta sus límites")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_rep = sub.add_parser("reproducir", help="Genera el plan de ciclos de un histórico")
+    p_rep.add_argument("historico")
+    p_rep.add_argument("--interseccion", default=None)
+    p_rep.add_argument("--plan", default=None, help="CSV donde guardar el plan de ciclos")
+    p_rep.add_argument("--modo", choices=MODOS, default=None, help="Por defecto el de la configuración")
+    p_bar = sub.add_parser("barrer", help="Barre MIN/MAX_GREEN y MIN/MAX_TURN en paralelo")
+    p_bar.add_argument("historico")
+    p_bar.add_argument("--interseccion", default=None)
+    for nombre in PARAMETROS:
+        p_bar.add_argument("--" + nombre.lower().replace('_', '-'), type=_lista, default=None,
+                           metavar="V1,V2,...")
+    p_bar.add_argument("--procesos", type=int, default=None)
+    p_bar.add_argument("--salida", default="barrido_predictor.csv")
+    p_bar.add_argument("--modo", choices=MODOS, default=None, help="Por defecto el de la configuración")
+    p_bar.add_argument("--criterio", choices=('desajuste_medio', 'demora_media'), default='desajuste_medio')
+    args = parser.parse_args()
+
+    ts, conteos = cargar_historico(args.historico, args.interseccion)
+    if args.comando == "reproducir":
+        plan = reproducir(ts, conteos, modo=args.modo)
+        print(metricas(conteos, plan))
+        if args.plan:
+            guardar_plan(args.plan, plan)
+    else:
+        rejilla = {nombre: getattr(args, nombre.lower()) for nombre in PARAMETROS
+                   if getattr(args, nombre.lower()) is not None}
+        resultados = barrer(ts, conteos, rejilla, args.procesos, criterio=args.criterio, modo=args.modo)
+        import pandas as pd
+        pd.DataFrame(resultados).to_csv(args.salida, index=False)
+        print(f"✅ {len(resultados)} combinaciones evaluadas; mejor: {resultados[0] if resultados else None}")
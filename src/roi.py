@@ -0,0 +1,96 @@
+import json
+import math
+import os
+
+import numpy as np
+
+
+class RegionInteres:
+    """
+    Polígono que cubre los carriles de un acceso (coordenadas del frame completo).
+
+    La inferencia se hace solo sobre el recorte rectangular que contiene el
+    polígono, a un `imgsz` proporcional a su tamaño, y después se descartan
+    las detecciones cuyo punto de apoyo (centro inferior de la caja) cae
+    fuera del polígono.
+    """
+
+    def __init__(self, poligono, margen=16):
+        self.poligono = np.asarray(poligono, dtype=np.float32).reshape(-1, 2)
+        if len(self.poligono) < 3:
+            raise ValueError("Un ROI necesita al menos 3 vértices")
+        self.margen = margen
+
+    def caja(self, forma_frame):
+        """Rectángulo (x1, y1, x2, y2) del recorte, con margen y limitado al frame"""
+        h, w = forma_frame[:2]
+        x1, y1 = np.floor(self.poligono.min(axis=0)).astype(int) - self.margen
+        x2, y2 = np.ceil(self.poligono.max(axis=0)).astype(int) + self.margen
+        return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+    def recortar(self, frame):
+        """Devuelve (recorte, (dx, dy)) con el desplazamiento del recorte en el frame"""
+        x1, y1, x2, y2 = self.caja(frame.shape)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def imgsz(self, imgsz_base, forma_frame, imgsz_min=320):
+        """
+        Tamaño de entrada para el recorte que conserva la resolución por
+        vehículo que tendría el frame completo a `imgsz_base` (múltiplo de 32).
+        """
+        h, w = forma_frame[:2]
+        x1, y1, x2, y2 = self.caja(forma_frame)
+        lado = imgsz_base * max(x2 - x1, y2 - y1) / max(w, h)
+        return int(min(imgsz_base, max(imgsz_min, math.ceil(lado / 32) * 32)))
+
+    def contiene(self, puntos):
+        """Máscara booleana de los puntos (N, 2) que están dentro del polígono (ray casting)"""
+        puntos = np.asarray(puntos, dtype=np.float32).reshape(-1, 2)
+        x, y = puntos[:, 0], puntos[:, 1]
+        dentro = np.zeros(len(puntos), dtype=bool)
+        xa, ya = self.poligono[:, 0], self.poligono[:, 1]
+        xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+        for i in range(len(self.poligono)):
+            cruza = (ya[i] > y) != (yb[i] > y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_corte = (xb[i] - xa[i]) * (y - ya[i]) / (yb[i] - ya[i]) + xa[i]
+            dentro ^= cruza & (x < x_corte)
+        return dentro
+
+    def filtrar(self, detecciones, desplazamiento=(0, 0)):
+        """
+        Lleva las Detecciones del recorte al frame completo y conserva solo
+        las que apoyan dentro del polígono.
+        """
+        detecciones = detecciones.desplazar(*desplazamiento)
+        return detecciones.filtrar(self.contiene(detecciones.puntos_apoyo()))
+
+    def a_lista(self):
+        return self.poligono.round(1).tolist()
+
+
+def cargar_rois(interseccion, ruta="rois.json"):
+    """Devuelve {direccion: RegionInteres} guardados para la intersección"""
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    return {direccion: RegionInteres(poligono)
+            for direccion, poligono in datos.get(interseccion, {}).items()}
+
+
+def guardar_roi(interseccion, direccion, roi, ruta="rois.json"):
+    """Guarda (o borra, si `roi` es None) el ROI de una dirección de la intersección"""
+    datos = {}
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+    rois = datos.setdefault(interseccion, {})
+    if roi is None:
+        rois.pop(direccion, None)
+    else:
+        rois[direccion] = roi.a_lista()
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+import shutil
+import struct
+
+FORMATOS = ('csv', 'parquet', 'bin')
+COLUMNAS = ('frame', 'vehiculos_detectados')
+# Columna opcional con los cruces de la línea de conteo acumulados (ver seguimiento)
+COLUMNA_CRUCES = 'cruces_acumulados'
+
+
+def registro_bin(columnas=COLUMNAS):
+    """Formato 'bin': registros little-endian de un int32 por columna"""
+    return struct.Struct('<' + 'i' * len(columnas))
+
+
+REGISTRO_BIN = registro_bin()
+
+
+def ruta_checkpoint(ruta):
+    return ruta + ".ckpt.json"
+
+
+class EscritorConteo:
+    """
+    Escribe el conteo por frame en bloques, sin acumular el video en memoria,
+    y guarda un checkpoint tras cada bloque para poder reanudar.
+
+    Formatos:
+    - 'csv': un único CSV (frame, vehiculos_detectados) al que se añaden bloques.
+    - 'parquet': directorio con un archivo part-NNNNN.parquet por bloque (requiere pyarrow).
+    - 'bin': registros binarios int32 (frame, vehiculos); se leen con `leer_conteo`.
+
+    Con `columnas` se pueden añadir columnas enteras tras las dos de
+    COLUMNAS (p. ej. COLUMNA_CRUCES); `escribir` recibe sus valores como
+    argumentos adicionales.
+
+    Parameters:
+    -----------
+    ruta : str
+        Archivo (csv/bin) o directorio (parquet) de salida.
+    parametros : dict
+        Identifican la ejecución (video, salto, etc.). Un checkpoint con
+        parámetros distintos se ignora y se empieza de cero.
+    tam_bloque : int
+        Filas por bloque; también es la frecuencia de checkpoint.
+    reanudar : bool
+        Si hay un checkpoint compatible, continúa desde él.
+    """
+
+    def __init__(self, ruta, formato='csv', parametros=None, tam_bloque=1000, reanudar=True,
+                 columnas=COLUMNAS):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de salida desconocido: {formato} (usa uno de {FORMATOS})")
+        if tuple(columnas[:2]) != COLUMNAS:
+            raise ValueError(f"Las dos primeras columnas deben ser {COLUMNAS}")
+        self.ruta = ruta
+        self.formato = formato
+        self.columnas = tuple(columnas)
+        self.registro = registro_bin(self.columnas)
+        self.parametros = dict(parametros or {}, formato=formato)
+        if self.columnas != COLUMNAS:
+            self.parametros['columnas'] = list(self.columnas)
+        self.tam_bloque = tam_bloque
+        self.bloque = []
+        # Estado que se guarda en el checkpoint
+        self.ultimo_frame = 0
+        self.ultimo_conteo = 0
+        self.ultimos_extra = [0] * (len(self.columnas) - 2)
+        self.filas = 0
+        self.partes = 0
+        self.bytes = 0
+        self.total_vehiculos = 0
+        self.max_vehiculos = 0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        if not (reanudar and self._cargar_checkpoint()):
+            self._limpiar()
+
+    def _cargar_checkpoint(self):
+        try:
+            with open(ruta_checkpoint(self.ruta), encoding='utf-8') as f:
+                estado = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        if estado.get('parametros') != self.parametros:
+            return False
+        for clave in ('ultimo_frame', 'ultimo_conteo', 'filas', 'partes', 'bytes',
+                      'total_vehiculos', 'max_vehiculos'):
+            setattr(self, clave, estado[clave])
+        self.ultimos_extra = estado.get('ultimos_extra', self.ultimos_extra)
+        self._truncar()
+        return True
+
+    def _truncar(self):
+        # Descarta lo escrito después del último checkpoint (caída entre flush y checkpoint)
+        if self.formato == 'parquet':
+            if os.path.isdir(self.ruta):
+                for nombre in os.listdir(self.ruta):
+                    if nombre.startswith("part-") and int(nombre[5:10]) >= self.partes:
+                        os.remove(os.path.join(self.ruta, nombre))
+        elif os.path.exists(self.ruta):
+            with open(self.ruta, 'r+b') as f:
+                f.truncate(self.bytes)
+
+    def _limpiar(self):
+        if os.path.isdir(self.ruta):
+            shutil.rmtree(self.ruta)
+        elif os.path.exists(self.ruta):
+            os.remove(self.ruta)
+        if os.path.exists(ruta_checkpoint(self.ruta)):
+            os.remove(ruta_checkpoint(self.ruta))
+        if self.formato == 'csv':
+            with open(self.ruta, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(self.columnas)
+            self.bytes = os.path.getsize(self.ruta)
+        elif self.formato == 'parquet':
+            os.makedirs(self.ruta)
+
+    def escribir(self, frame, vehiculos, *extra):
+        self.bloque.append((frame, vehiculos, *extra))
+        self.ultimo_frame = frame
+        self.ultimo_conteo = vehiculos
+        self.ultimos_extra = list(extra)
+        self.total_vehiculos += vehiculos
+        self.max_vehiculos = max(self.max_vehiculos, vehiculos)
+        if len(self.bloque) >= self.tam_bloque:
+            self.flush()
+
+    def flush(self):
+        if not self.bloque:
+            return
+        if self.formato == 'csv':
+            with open(self.ruta, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(self.bloque)
+            self.bytes = os.path.getsize(self.ruta)
+        elif self.formato == 'bin':
+            with open(self.ruta, 'ab') as f:
+                f.write(b''.join(self.registro.pack(*fila) for fila in self.bloque))
+            self.bytes = os.path.getsize(self.ruta)
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("El formato 'parquet' requiere pyarrow: pip install pyarrow") from e
+            tabla = pa.table({nombre: pa.array(valores, pa.int32())
+                              for nombre, valores in zip(self.columnas, zip(*self.bloque))})
+            pq.write_table(tabla, os.path.join(self.ruta, f"part-{self.partes:05d}.parquet"))
+            self.partes += 1
+        self.filas += len(self.bloque)
+        self.bloque = []
+        self._guardar_checkpoint()
+
+    def _guardar_checkpoint(self):
+        estado = {
+            'parametros': self.parametros,
+            'ultimo_frame': self.ultimo_frame,
+            'ultimo_conteo': self.ultimo_conteo,
+            'ultimos_extra': self.ultimos_extra,
+            'filas': self.filas,
+            'partes': self.partes,
+            'bytes': self.bytes,
+            'total_vehiculos': self.total_vehiculos,
+            'max_vehiculos': self.max_vehiculos,
+        }
+        temporal = ruta_checkpoint(self.ruta) + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(temporal, ruta_checkpoint(self.ruta))
+
+    def cerrar(self, completo=True):
+        """Escribe el último bloque; si el video terminó, elimina el checkpoint"""
+        self.flush()
+        if completo and os.path.exists(ruta_checkpoint(self.ruta)):
+            os.remove(ruta_checkpoint(self.ruta))
+
+    def resumen(self):
+        resumen = {
+            'frames_procesados': self.filas,
+            'total_vehiculos': self.total_vehiculos,
+            'media_vehiculos': round(self.total_vehiculos / self.filas, 3) if self.filas else 0.0,
+            'max_vehiculos': self.max_vehiculos,
+        }
+        # Columnas acumuladas (p. ej. cruces): su último valor es el total
+        resumen.update(zip(self.columnas[2:], self.ultimos_extra))
+        return resumen
+
+
+def leer_conteo(ruta, formato='csv', columnas=COLUMNAS):
+    """Carga una salida de EscritorConteo como DataFrame (`columnas` solo hace falta en 'bin')"""
+    import pandas as pd
+    if formato == 'csv':
+        return pd.read_csv(ruta)
+    if formato == 'parquet':
+        return pd.read_parquet(ruta)
+    import numpy as np
+    datos = np.fromfile(ruta, dtype='<i4').reshape(-1, len(columnas))
+    return pd.DataFrame(datos, columns=list(columnas))
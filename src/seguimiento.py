@@ -0,0 +1,268 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Matriz de observación: se mide [cx, cy, w, h] de un estado [cx, cy, w, h, vx, vy]
+_H = np.hstack([np.eye(4), np.zeros((4, 2))])
+
+
+def iou_matriz(a, b, expansion=0.0):
+    """
+    IoU (Na, Nb) entre cajas xyxy. Con `expansion` > 0 las cajas se agrandan
+    ese porcentaje antes de comparar (IoU con margen), lo que tolera saltos
+    grandes entre frames muestreados.
+    """
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    if expansion:
+        a, b = _expandir(a, expansion), _expandir(b, expansion)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def _expandir(cajas, factor):
+    w = cajas[:, 2] - cajas[:, 0]
+    h = cajas[:, 3] - cajas[:, 1]
+    return cajas + np.stack([-w, -h, w, h], axis=1) * (factor / 2)
+
+
+def emparejar(iou, umbral):
+    """Emparejamiento voraz por IoU descendente. Devuelve (filas, columnas)"""
+    filas, columnas = [], []
+    if not iou.size:
+        return filas, columnas
+    usadas_f, usadas_c = set(), set()
+    for k in np.argsort(-iou, axis=None):
+        i, j = divmod(int(k), iou.shape[1])
+        if iou[i, j] < umbral:
+            break
+        if i in usadas_f or j in usadas_c:
+            continue
+        usadas_f.add(i)
+        usadas_c.add(j)
+        filas.append(i)
+        columnas.append(j)
+    return filas, columnas
+
+
+def _a_estado(xyxy):
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    cy = (xyxy[:, 1] + xyxy[:, 3]) / 2
+    return np.stack([cx, cy, xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]], axis=1)
+
+
+class Seguidor:
+    """
+    Seguidor multiobjeto ligero para CPU al estilo ByteTrack.
+
+    Cada pista tiene un filtro de Kalman de velocidad constante sobre
+    [cx, cy, w, h]; todas las pistas se predicen y corrigen a la vez con
+    arreglos. Primero se asocian las detecciones de confianza alta, luego las
+    de confianza baja con las pistas que quedaron libres. Como la predicción
+    usa el tiempo transcurrido, las pistas se extrapolan entre frames muy
+    espaciados y el muestreo puede ser disperso.
+
+    Parameters:
+    -----------
+    umbral_alto, umbral_bajo : float
+        Confianza de las detecciones de primera y segunda asociación.
+    iou_min : float
+        IoU mínimo (con margen `expansion`) para asociar.
+    max_edad : float
+        Tiempo sin detección tras el que una pista se elimina (mismas
+        unidades que `t` en `actualizar`: segundos o número de frame).
+    min_impactos : int
+        Detecciones necesarias para confirmar una pista.
+    """
+
+    def __init__(self, umbral_alto=0.5, umbral_bajo=0.1, iou_min=0.2, max_edad=30, min_impactos=2,
+                 expansion=0.3):
+        self.umbral_alto = umbral_alto
+        self.umbral_bajo = umbral_bajo
+        self.iou_min = iou_min
+        self.max_edad = max_edad
+        self.min_impactos = min_impactos
+        self.expansion = expansion
+        self.x = np.zeros((0, 6))
+        self.P = np.zeros((0, 6, 6))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.t_detectada = np.zeros(0)
+        self.impactos = np.zeros(0, dtype=np.int64)
+        self.t_anterior = None
+        self.siguiente_id = 1
+
+    def _predecir(self, dt):
+        if not len(self.x) or dt <= 0:
+            return
+        F = np.eye(6)
+        F[0, 4] = F[1, 5] = dt
+        Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5]) * dt
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+
+    def _corregir(self, indices, medidas):
+        R = np.diag([4.0, 4.0, 9.0, 9.0])
+        P = self.P[indices]
+        S = _H @ P @ _H.T + R
+        K = P @ _H.T @ np.linalg.inv(S)
+        innovacion = medidas - self.x[indices] @ _H.T
+        self.x[indices] += np.einsum('kij,kj->ki', K, innovacion)
+        self.P[indices] = (np.eye(6) - K @ _H) @ P
+
+    def cajas(self):
+        cx, cy, w, h = self.x[:, 0], self.x[:, 1], self.x[:, 2], self.x[:, 3]
+        return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    def actualizar(self, detecciones, t):
+        """
+        Avanza las pistas hasta el instante `t` y las asocia con `detecciones`.
+
+        Returns:
+        --------
+        (ids, xyxy) de las pistas confirmadas y vivas, incluidas las que se
+        están extrapolando sin detección en este frame.
+        """
+        dt = 0 if self.t_anterior is None else t - self.t_anterior
+        self.t_anterior = t
+        self._predecir(dt)
+
+        xyxy, conf = detecciones.xyxy, detecciones.confianzas
+        altas = np.flatnonzero(conf >= self.umbral_alto)
+        bajas = np.flatnonzero((conf >= self.umbral_bajo) & (conf < self.umbral_alto))
+
+        libres = np.arange(len(self.x))
+        predichas = self.cajas()
+        asignadas_p, asignadas_d = [], []
+        for grupo in (altas, bajas):
+            filas, columnas = emparejar(iou_matriz(predichas[libres], xyxy[grupo], self.expansion), self.iou_min)
+            asignadas_p.extend(libres[filas])
+            asignadas_d.extend(grupo[columnas])
+            libres = np.delete(libres, filas)
+        if asignadas_p:
+            indices = np.array(asignadas_p)
+            self._corregir(indices, _a_estado(xyxy[np.array(asignadas_d)]))
+            self.t_detectada[indices] = t
+            self.impactos[indices] += 1
+
+        # Nuevas pistas con las detecciones altas sin asignar
+        nuevas = np.setdiff1d(altas, np.array(asignadas_d, dtype=np.int64))
+        if len(nuevas):
+            estado = np.hstack([_a_estado(xyxy[nuevas]), np.zeros((len(nuevas), 2))])
+            P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0])
+            self.x = np.vstack([self.x, estado])
+            self.P = np.concatenate([self.P, np.repeat(P0[None], len(nuevas), axis=0)])
+            self.ids = np.concatenate([self.ids, np.arange(self.siguiente_id, self.siguiente_id + len(nuevas))])
+            self.siguiente_id += len(nuevas)
+            self.t_detectada = np.concatenate([self.t_detectada, np.full(len(nuevas), t, dtype=float)])
+            self.impactos = np.concatenate([self.impactos, np.ones(len(nuevas), dtype=np.int64)])
+
+        vivas = t - self.t_detectada <= self.max_edad
+        self.x, self.P, self.ids = self.x[vivas], self.P[vivas], self.ids[vivas]
+        self.t_detectada, self.impactos = self.t_detectada[vivas], self.impactos[vivas]
+
+        confirmadas = self.impactos >= self.min_impactos
+        return self.ids[confirmadas], self.cajas()[confirmadas]
+
+
+class ContadorLinea:
+    """
+    Cuenta vehículos únicos que cruzan una línea de detención.
+
+    Se sigue el punto de apoyo (centro inferior) de cada pista; un cruce se
+    cuenta una sola vez por id cuando el punto pasa de un lado al otro del
+    segmento p1-p2. Con `sentido` = 1 o -1 solo cuenta en ese sentido
+    (del lado negativo al positivo, o al revés); con 0 cuenta ambos.
+    """
+
+    def __init__(self, p1, p2, sentido=0):
+        self.p1 = np.asarray(p1, dtype=float)
+        self.p2 = np.asarray(p2, dtype=float)
+        self.sentido = sentido
+        self.total = 0
+        self.ultimo = {}
+        self.contados = set()
+
+    def _lado(self, puntos):
+        d = self.p2 - self.p1
+        return np.sign(d[0] * (puntos[:, 1] - self.p1[1]) - d[1] * (puntos[:, 0] - self.p1[0]))
+
+    def actualizar(self, ids, xyxy):
+        """Procesa las pistas del frame y devuelve cuántos cruces nuevos hubo"""
+        puntos = np.stack([(xyxy[:, 0] + xyxy[:, 2]) / 2, xyxy[:, 3]], axis=1) if len(ids) else np.zeros((0, 2))
+        lados = self._lado(puntos)
+        nuevos = 0
+        actual = {}
+        for id_pista, punto, lado in zip(ids.tolist(), puntos, lados):
+            anterior = self.ultimo.get(id_pista)
+            actual[id_pista] = (punto, lado)
+            if anterior is None or id_pista in self.contados or lado == 0 or anterior[1] == lado:
+                continue
+            if self.sentido and lado != self.sentido:
+                continue
+            if self._corta_segmento(anterior[0], punto):
+                self.contados.add(id_pista)
+                nuevos += 1
+        self.ultimo = actual
+        self.contados &= set(actual)
+        self.total += nuevos
+        return nuevos
+
+    def _corta_segmento(self, a, b):
+        # El desplazamiento a->b corta la recta; se comprueba que sea dentro del segmento p1-p2
+        lados = self._lado(np.array([a, b]))
+        d = b - a
+        lado_p1 = np.sign(d[0] * (self.p1[1] - a[1]) - d[1] * (self.p1[0] - a[0]))
+        lado_p2 = np.sign(d[0] * (self.p2[1] - a[1]) - d[1] * (self.p2[0] - a[0]))
+        return lados[0] != lados[1] and lado_p1 != lado_p2
+
+    def a_lista(self):
+        return {'p1': self.p1.round(1).tolist(), 'p2': self.p2.round(1).tolist(), 'sentido': self.sentido}
+
+
+def dibujar_pistas(frame, ids, xyxy, escala=1.0, color=(241, 196, 15), tam_texto=0.5):
+    """Escribe el id de cada pista sobre su caja (coordenadas del frame original * escala)"""
+    for id_pista, (x1, y1, _, _) in zip(ids.tolist(), (xyxy * escala).astype(np.int32).tolist()):
+        cv2.putText(frame, f"#{id_pista}", (x1, max(12, y1 - 4)), cv2.FONT_HERSHEY_SIMPLEX, tam_texto, color, 1)
+
+
+def dibujar_linea(frame, linea, escala=1.0, color=(52, 152, 219)):
+    """Dibuja la línea de conteo y su total de cruces"""
+    p1 = tuple((linea.p1 * escala).astype(int).tolist())
+    p2 = tuple((linea.p2 * escala).astype(int).tolist())
+    cv2.line(frame, p1, p2, color, 2)
+    cv2.putText(frame, str(linea.total), p2, cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+
+def cargar_lineas(interseccion, ruta="lineas.json"):
+    """Devuelve {direccion: ContadorLinea} guardados para la intersección"""
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    return {direccion: ContadorLinea(linea['p1'], linea['p2'], linea.get('sentido', 0))
+            for direccion, linea in datos.get(interseccion, {}).items()}
+
+
+def guardar_linea(interseccion, direccion, linea, ruta="lineas.json"):
+    """Guarda (o borra, si `linea` es None) la línea de conteo de una dirección"""
+    datos = {}
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+    lineas = datos.setdefault(interseccion, {})
+    if linea is None:
+        lineas.pop(direccion, None)
+    else:
+        lineas[direccion] = linea.a_lista()
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from datetime import datetime
+
+from src.almacenamiento import DIRECCIONES
+
+
+class Suscriptor:
+    """
+    Cliente conectado. Los mensajes pendientes se guardan por tipo: si llega
+    uno nuevo del mismo tipo antes de que el cliente lea el anterior, lo
+    sustituye (coalescencia), así un cliente lento recibe siempre el estado
+    más reciente y su cola nunca crece más que el número de tipos.
+    """
+
+    def __init__(self, enviar, tipos=None):
+        self.enviar = enviar
+        self.tipos = tipos
+        self.pendientes = {}
+        self.evento = asyncio.Event()
+        self.coalescidos = 0
+        self.enviados = 0
+
+    def poner(self, tipo, datos):
+        if self.tipos is not None and tipo not in self.tipos:
+            return
+        if tipo in self.pendientes:
+            self.coalescidos += 1
+        self.pendientes[tipo] = datos
+        self.evento.set()
+
+    async def bucle(self, timeout_envio):
+        """Envía lo pendiente; un envío que tarda más de `timeout_envio` desconecta al cliente"""
+        while True:
+            await self.evento.wait()
+            self.evento.clear()
+            pendientes, self.pendientes = self.pendientes, {}
+            for datos in pendientes.values():
+                await asyncio.wait_for(self.enviar(datos), timeout_envio)
+                self.enviados += 1
+
+
+class Difusor:
+    """
+    Reparte mensajes a todos los suscriptores sin esperar a ninguno: cada
+    mensaje se serializa una vez y `publicar` solo lo deja en el hueco de su
+    tipo en cada suscriptor. El último mensaje de cada tipo se envía a los
+    clientes nuevos al conectarse.
+    """
+
+    def __init__(self, timeout_envio=5.0):
+        self.timeout_envio = timeout_envio
+        self.suscriptores = set()
+        self.ultimos = {}
+        self.desconectados_lentos = 0
+
+    def publicar(self, tipo, contenido):
+        datos = (json.dumps(dict(contenido, tipo=tipo), ensure_ascii=False) + "\n").encode()
+        self.ultimos[tipo] = datos
+        for suscriptor in self.suscriptores:
+            suscriptor.poner(tipo, datos)
+
+    async def atender(self, enviar, tipos=None):
+        """Registra un cliente y le envía mensajes hasta que se desconecta o se queda atrás"""
+        suscriptor = Suscriptor(enviar, tipos)
+        for tipo, datos in self.ultimos.items():
+            suscriptor.poner(tipo, datos)
+        self.suscriptores.add(suscriptor)
+        try:
+            await suscriptor.bucle(self.timeout_envio)
+        except asyncio.TimeoutError:
+            self.desconectados_lentos += 1
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.suscriptores.discard(suscriptor)
+
+    def estadisticas(self):
+        return {'clientes': len(self.suscriptores), 'desconectados_lentos': self.desconectados_lentos,
+                'coalescidos': sum(s.coalescidos for s in self.suscriptores)}
+
+
+async def _leer_tipos(reader, timeout=0.5):
+    # Primera línea opcional del cliente: {"tipos": ["conteos", "prediccion"]}
+    try:
+        linea = await asyncio.wait_for(reader.readline(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    try:
+        tipos = json.loads(linea).get('tipos') if linea.strip() else None
+    except (ValueError, AttributeError):
+        return None
+    return set(tipos) if tipos else None
+
+
+class ServicioLocal:
+    """
+    Servicio sin interfaz para los gabinetes de campo: procesa las fuentes
+    configuradas de cada acceso con el mismo pipeline que el dashboard
+    (captura, inferencia por lotes, ROI, línea de detención) y publica a los
+    clientes locales, como líneas JSON por un socket Unix o TCP (y WebSocket
+    si está instalado `websockets`):
+
+    - 'conteos' cada `periodo_conteos` s: vehículos visibles y cruces por acceso;
+    - 'prediccion' cada `intervalo` s: tiempos de verde y secuencia del ciclo.
+
+    La captura y la inferencia viven en los hilos de PipelineVideo; el bucle
+    asyncio solo lee conteos y reparte mensajes, y la predicción se ejecuta
+    en un hilo aparte, así que ningún cliente retrasa el conteo.
+    """
+
+    def __init__(self, config, interseccion=None, fuentes=None):
+        self.config = config
+        config_servicio = config['servicio']
+        self.interseccion = interseccion or config_servicio['interseccion']
+        self.fuentes = fuentes or {d: f for d, f in config_servicio['fuentes'].items() if f}
+        self.intervalo = config_servicio['intervalo']
+        self.periodo_conteos = config_servicio['periodo_conteos']
+        self.difusor = Difusor(config_servicio['timeout_envio'])
+        self.accesos = {}
+        self.pipelines = {}
+        self.cruces_reportados = {}
+        self.servidores = []
+        self.parada = None
+        self.servicio_inferencia = None
+        self.planificador = None
+        self.predictor = None
+        self.almacen = None
+        self.aprendizaje = None
+
+    # --- Pipeline ---
+
+    def _iniciar_accesos(self):
+        from src import metricas
+        from src.almacenamiento import AlmacenConteos
+        from src.aprendizaje import crear_aprendizaje
+        from src.acceso import AccesoConteo
+        from src.cascada import crear_cascada
+        from src.inferencia_lotes import ServicioInferencia
+        from src.pipeline_video import PipelineVideo
+        from src.planificador import crear_planificador
+        from src.prediccion_AI import TrafficPredictor
+        from src.roi import cargar_rois
+        from src.seguimiento import cargar_lineas
+
+        config = self.config
+        metricas.activar(config['metricas'])
+        self.planificador = crear_planificador(config['planificador'])
+        self.servicio_inferencia = ServicioInferencia(
+            cascada=crear_cascada(config['modelo'], config['cascada']), planificador=self.planificador)
+        rois = cargar_rois(self.interseccion, config['roi']['archivo'])
+        lineas = cargar_lineas(self.interseccion, config['seguimiento']['archivo_lineas'])
+        for direccion, fuente in self.fuentes.items():
+            acceso = AccesoConteo(direccion, config, rois.get(direccion), lineas.get(direccion),
+                                  self.servicio_inferencia, self.planificador)
+            pipeline = PipelineVideo(fuente if not str(fuente).isdigit() else int(fuente),
+                                     acceso.inferir, lambda *args: None, debe_renderizar=lambda: False,
+                                     nombre=direccion)
+            try:
+                pipeline.iniciar()
+            except IOError as e:
+                print(f"⚠️ {direccion}: {e}")
+                continue
+            self.servicio_inferencia.registrar(direccion)
+            self.accesos[direccion] = acceso
+            self.pipelines[direccion] = pipeline
+            self.cruces_reportados[direccion] = 0
+
+        config_prediccion = config['prediccion']
+        self.aprendizaje = crear_aprendizaje(config['aprendizaje'])
+        self.predictor = TrafficPredictor(
+            modo=config_prediccion['modo'], aprendizaje=self.aprendizaje,
+            carriles=tuple(config_prediccion['carriles']),
+            saturacion_carril=config_prediccion['saturacion_carril'], paso_optimo=config_prediccion['paso_optimo'])
+        self.almacen = AlmacenConteos(config['almacenamiento']['ruta'])
+
+    def _detener_accesos(self):
+        for direccion, pipeline in self.pipelines.items():
+            self.servicio_inferencia.retirar(direccion)
+            pipeline.detener()
+        self.pipelines.clear()
+        if self.servicio_inferencia is not None:
+            self.servicio_inferencia.detener()
+        if self.aprendizaje is not None:
+            self.aprendizaje.guardar(self.config['aprendizaje']['ruta_modelo'])
+        if self.almacen is not None:
+            self.almacen.cerrar()
+        from src import metricas
+        metricas.cerrar()
+
+    def conteos(self):
+        return {d: self.accesos[d].count if d in self.accesos else 0 for d in DIRECCIONES}
+
+    def _tomar_flujos(self):
+        # Igual que el dashboard: cruces desde la última predicción, o None si ningún acceso tiene línea
+        flujos = {}
+        for direccion, acceso in self.accesos.items():
+            total = acceso.cruces
+            if total is not None:
+                flujos[direccion] = total - self.cruces_reportados[direccion]
+                self.cruces_reportados[direccion] = total
+        if not flujos:
+            return None
+        conteos = self.conteos()
+        return {d: flujos.get(d, conteos[d]) for d in DIRECCIONES}
+
+    def _predecir(self, conteos, flujos):
+        predicciones, ciclo = self.predictor.predict_green_times(conteos, flujos)
+        if self.planificador is not None:
+            self.planificador.actualizar_ciclo(ciclo)
+        self.almacen.registrar(self.interseccion, conteos)
+        return predicciones, ciclo
+
+    # --- Bucles ---
+
+    async def _bucle_conteos(self):
+        while not self.parada.is_set():
+            self.difusor.publicar('conteos', {
+                'interseccion': self.interseccion, 'timestamp': time.time(),
+                'conteos': self.conteos(),
+                'cruces': {d: a.cruces for d, a in self.accesos.items() if a.cruces is not None},
+            })
+            try:
+                await asyncio.wait_for(self.parada.wait(), self.periodo_conteos)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _bucle_prediccion(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Se espera antes de predecir: al arrancar aún no hay conteos ni cruces que valgan
+            try:
+                await asyncio.wait_for(self.parada.wait(), self.intervalo)
+                return
+            except asyncio.TimeoutError:
+                pass
+            conteos = self.conteos()
+            flujos = self._tomar_flujos()
+            predicciones, ciclo = await loop.run_in_executor(None, self._predecir, conteos, flujos)
+            self.difusor.publicar('prediccion', {
+                'interseccion': self.interseccion, 'timestamp': time.time(),
+                'conteos': conteos, 'flujos': flujos, 'predicciones': predicciones, 'ciclo': ciclo,
+                'duracion_ciclo': sum(fase['duration'] for fase in ciclo),
+            })
+
+    async def _bucle_fin_fuentes(self):
+        # Sin fuentes vivas (p. ej. todos los archivos terminaron) el servicio se detiene
+        while not self.parada.is_set():
+            if self.pipelines and not any(h.is_alive() for p in self.pipelines.values() for h in p.hilos):
+                print("ℹ️ Todas las fuentes terminaron")
+                self.parada.set()
+            try:
+                await asyncio.wait_for(self.parada.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Transporte ---
+
+    async def _cliente_stream(self, reader, writer):
+        async def enviar(datos):
+            writer.write(datos)
+            await writer.drain()
+        tipos = await _leer_tipos(reader)
+        try:
+            await self.difusor.atender(enviar, tipos)
+        finally:
+            writer.close()
+
+    async def _cliente_websocket(self, websocket, *args):
+        from websockets.exceptions import ConnectionClosed
+
+        async def enviar(datos):
+            # El Difusor trata la desconexión como ConnectionError, igual que en los sockets
+            try:
+                await websocket.send(datos.decode())
+            except ConnectionClosed as e:
+                raise ConnectionError(str(e)) from e
+        await self.difusor.atender(enviar)
+
+    async def _abrir_servidores(self):
+        config_servicio = self.config['servicio']
+        if config_servicio['socket']:
+            ruta = config_servicio['socket']
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            self.servidores.append(await asyncio.start_unix_server(self._cliente_stream, ruta))
+            print(f"📡 Socket Unix: {ruta}")
+        if config_servicio['puerto']:
+            self.servidores.append(await asyncio.start_server(
+                self._cliente_stream, config_servicio['host'], config_servicio['puerto']))
+            print(f"📡 TCP: {config_servicio['host']}:{config_servicio['puerto']}")
+        if config_servicio['puerto_websocket']:
+            try:
+                import websockets
+            except ImportError:
+                print("⚠️ WebSocket desactivado: instala el paquete 'websockets'")
+            else:
+                self.servidores.append(await websockets.serve(
+                    self._cliente_websocket, config_servicio['host'], config_servicio['puerto_websocket']))
+                print(f"📡 WebSocket: ws://{config_servicio['host']}:{config_servicio['puerto_websocket']}")
+
+    async def ejecutar(self):
+        self.parada = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(senal, self.parada.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await loop.run_in_executor(None, self._iniciar_accesos)
+        if not self.accesos:
+            print("❌ Ninguna fuente disponible")
+            # Servicio de inferencia, almacén y métricas ya se crearon: se cierran igual
+            await loop.run_in_executor(None, self._detener_accesos)
+            return 1
+        print(f"✅ {self.interseccion}: {', '.join(self.accesos)} ({datetime.now():%H:%M:%S})")
+        await self._abrir_servidores()
+        tareas = [asyncio.create_task(c) for c in
+                  (self._bucle_conteos(), self._bucle_prediccion(), self._bucle_fin_fuentes())]
+        try:
+            await self.parada.wait()
+        finally:
+            for servidor in self.servidores:
+                servidor.close()
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            await loop.run_in_executor(None, self._detener_accesos)
+            ruta = self.config['servicio']['socket']
+            if ruta and os.path.exists(ruta):
+                os.remove(ruta)
+        return 0
+
+
+def main(argv=None):
+    from src.configuracion import cargar_configuracion
+    parser = argparse.ArgumentParser(description="Servicio VISOTRAF sin interfaz con API local de streaming")
+    parser.add_argument("--interseccion", default=None)
+    for direccion in DIRECCIONES:
+        parser.add_argument("--" + direccion.lower(), default=None, metavar="FUENTE",
+                            help=f"Video, URL o cámara del acceso {direccion}")
+    parser.add_argument("--socket", default=None, help="Ruta del socket Unix")
+    parser.add_argument("--puerto", type=int, default=None, help="Puerto TCP (líneas JSON)")
+    args = parser.parse_args(argv)
+
+    config = cargar_configuracion()
+    if args.socket is not None:
+        config['servicio']['socket'] = args.socket
+    if args.puerto is not None:
+        config['servicio']['puerto'] = args.puerto
+    fuentes = {d: getattr(args, d.lower()) for d in DIRECCIONES if getattr(args, d.lower())}
+    return asyncio.run(ServicioLocal(config, args.interseccion, fuentes or None).ejecutar())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+import numpy as np
+
+from src.prediccion_AI import ALL_RED, DIRECCIONES, YELLOW_TIME
+
+SATURACION_CARRIL = 1800.0  # veh/h de verde por carril
+CARRILES = (2, 2, 2, 2)  # en el orden de DIRECCIONES
+# Tiempo perdido por ciclo: ámbar y todo rojo de las dos fases (calculate_cycle_sequence)
+PERDIDO_CICLO = 2 * (YELLOW_TIME + ALL_RED)
+# Eje de cada dirección: columna 0 (N-S) o 1 (E-O) de los verdes
+EJE = np.array([0, 0, 1, 1])
+
+
+def simular(flujos, verdes, carriles=CARRILES, saturacion_carril=SATURACION_CARRIL, ciclos=4, cola_inicial=None):
+    """
+    Simulador macroscópico de colas (modelo de cola puntual determinista).
+
+    Cada acceso recibe llegadas uniformes a su flujo; en rojo la cola crece
+    y en verde se descarga a la tasa de saturación. La cola que no se
+    descarga pasa al ciclo siguiente. Todo se calcula con arreglos, así que
+    se pueden evaluar miles de repartos a la vez.
+
+    Parameters:
+    -----------
+    flujos : array (..., 4)
+        Llegadas en veh/h por dirección (orden de DIRECCIONES).
+    verdes : array (..., 2)
+        Verde de cada eje [ns, eo] en segundos; se difunde con `flujos`,
+        p. ej. flujos (N, 1, 4) con verdes (1, K, 2).
+    ciclos : int
+        Ciclos simulados; con sobresaturación la cola crece de uno a otro.
+
+    Returns:
+    --------
+    dict con 'demora' (demora media por vehículo, s), 'demora_acceso'
+    (..., 4), 'cola_final' (..., 4) en vehículos y 'ciclo' (...,) en s.
+    """
+    flujos = np.asarray(flujos, dtype=np.float64)
+    verdes = np.asarray(verdes, dtype=np.float64)
+    llegada = flujos / 3600.0
+    descarga = np.asarray(carriles, dtype=np.float64) * saturacion_carril / 3600.0
+    ciclo = verdes.sum(axis=-1) + PERDIDO_CICLO
+    verde = verdes[..., EJE]
+    rojo = ciclo[..., None] - verde
+    llegada, verde, rojo = np.broadcast_arrays(llegada, verde, rojo)
+
+    cola = np.zeros(llegada.shape) if cola_inicial is None else np.broadcast_to(cola_inicial, llegada.shape).copy()
+    area = np.zeros(llegada.shape)
+    neto = descarga - llegada  # ritmo al que baja la cola en verde
+    for _ in range(ciclos):
+        # Rojo: la cola crece linealmente
+        area += cola * rojo + llegada * rojo ** 2 / 2
+        cola = cola + llegada * rojo
+        # Verde: se descarga hasta vaciar (o hasta que acabe el verde)
+        t_vaciado = np.divide(cola, neto, out=np.full(cola.shape, np.inf), where=neto > 0)
+        vacia = t_vaciado <= verde
+        t_vaciado = np.minimum(t_vaciado, verde)
+        final = np.where(vacia, 0.0, cola - neto * verde)
+        area += np.where(vacia, cola * t_vaciado / 2, (cola + final) * verde / 2)
+        cola = final
+
+    vehiculos = llegada * ciclo[..., None] * ciclos
+    demora_acceso = np.divide(area, vehiculos, out=np.zeros(area.shape), where=vehiculos > 0)
+    total = vehiculos.sum(axis=-1)
+    demora = np.divide(area.sum(axis=-1), total, out=np.zeros(total.shape), where=total > 0)
+    return {'demora': demora, 'demora_acceso': demora_acceso, 'cola_final': cola, 'ciclo': ciclo}
+
+
+def optimizar_verdes(flujos, min_verde=20, max_verde=90, paso=2.0, carriles=CARRILES,
+                     saturacion_carril=SATURACION_CARRIL, ciclos=4, max_elementos=2_000_000):
+    """
+    Reparto de verde [ns, eo] que minimiza la demora media simulada, por fila.
+
+    Se evalúan todos los pares de verdes en [min_verde, max_verde] con
+    resolución `paso` (s). Los límites pueden ser escalares o arreglos (N,);
+    las filas se procesan en bloques para acotar la memoria.
+
+    Returns:
+    --------
+    (verdes (N, 2), demora (N,))
+    """
+    flujos = np.atleast_2d(np.asarray(flujos, dtype=np.float64))
+    n = len(flujos)
+    min_verde = np.broadcast_to(np.asarray(min_verde, dtype=np.float64), (n,))
+    max_verde = np.broadcast_to(np.asarray(max_verde, dtype=np.float64), (n,))
+    valores = np.arange(min_verde.min(), max_verde.max() + paso / 2, paso)
+    ns, eo = np.meshgrid(valores, valores, indexing='ij')
+    candidatos = np.stack([ns.ravel(), eo.ravel()], axis=1)  # (K, 2)
+
+    verdes = np.empty((n, 2))
+    demoras = np.empty(n)
+    bloque = max(1, max_elementos // (len(candidatos) * len(DIRECCIONES)))
+    for inicio in range(0, n, bloque):
+        fin = min(n, inicio + bloque)
+        demora = simular(flujos[inicio:fin, None, :], candidatos[None], carriles, saturacion_carril, ciclos)['demora']
+        # Candidatos fuera de los límites de cada fila
+        fuera = ((candidatos[None] < min_verde[inicio:fin, None, None]) |
+                 (candidatos[None] > max_verde[inicio:fin, None, None])).any(axis=-1)
+        demora = np.where(fuera, np.inf, demora)
+        mejor = demora.argmin(axis=1)
+        verdes[inicio:fin] = candidatos[mejor]
+        demoras[inicio:fin] = demora[np.arange(fin - inicio), mejor]
+    # Sin llegadas cualquier plan da demora 0: se usan los mínimos
+    sin_flujo = flujos.sum(axis=1) <= 0
+    verdes[sin_flujo] = min_verde[sin_flujo, None]
+    return verdes, demoras
@@ -1,59 +1,247 @@
-from ultralytics import YOLO
 import cv2
-import pandas as pd
 import os
 import datetime
+import threading
+
+from src import metricas
+from src.lectura_video import iterar_frames
+from src.detecciones import Detecciones, dibujar_detecciones, ids_de_clases
+from src.salida_conteo import COLUMNAS, COLUMNA_CRUCES, EscritorConteo, leer_conteo
 
-model = YOLO("yolov8m.pt")  # Modelo más preciso
 vehicle_classes = ['car', 'bus', 'truck', 'motorcycle', 'bicycle']  # Más clases
 
-def procesar_video(video_path, output_csv=None, salto_frames=3, visualizar=False):
+_modelos = {}
+_lock_modelos = threading.Lock()
+# Pesos del backend configurado, resueltos una vez por proceso (leer la configuración
+# y comprobar la caché de exportación es E/S que no debe repetirse en cada frame)
+_pesos_configurados = None
+
+
+def obtener_modelo(pesos=None):
+    """
+    Devuelve el modelo YOLO para `pesos`, construyéndolo la primera vez.
+    torch/ultralytics solo se importan aquí, así importar el paquete es barato.
+
+    Sin `pesos` se usa el backend configurado en visotraf_config.json
+    (PyTorch, ONNX u OpenVINO), exportándolo a la caché si hace falta.
+    """
+    global _pesos_configurados
+    with _lock_modelos:
+        if pesos is None:
+            if _pesos_configurados is None:
+                from src.backends import preparar_backend
+                _pesos_configurados = preparar_backend()
+            pesos = _pesos_configurados
+        if pesos not in _modelos:
+            from ultralytics import YOLO
+            _modelos[pesos] = YOLO(pesos, task='detect')
+        return _modelos[pesos]
+
+
+def precalentar_modelo(pesos=None, en_segundo_plano=True, al_terminar=None):
+    """
+    Carga el modelo y ejecuta una inferencia sobre un frame vacío para que la
+    primera detección real no pague la inicialización de torch.
+
+    Con `en_segundo_plano=True` se ejecuta en un hilo daemon y se devuelve el hilo.
+    `al_terminar` se llama (desde ese hilo) cuando el modelo está listo.
+    """
+    def _precalentar():
+        import numpy as np
+        modelo = obtener_modelo(pesos)
+        modelo(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+        if al_terminar is not None:
+            al_terminar()
+
+    if not en_segundo_plano:
+        _precalentar()
+        return None
+    hilo = threading.Thread(target=_precalentar, daemon=True)
+    hilo.start()
+    return hilo
+
+
+def ids_vehiculo(modelo):
+    """Ids de `vehicle_classes` en el modelo, para pasarlos como `classes=` a YOLO"""
+    return ids_de_clases(modelo.names, vehicle_classes)
+
+
+def __getattr__(nombre):
+    # Compatibilidad: `from src.vision_vehicular import model` sigue funcionando
+    if nombre == 'model':
+        return obtener_modelo()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+def procesar_video(video_path, output_csv=None, salto_frames=3, visualizar=False,
+                   modo_salto='grab', intervalo_ms=None, filtro_movimiento=None,
+                   formato='csv', tam_bloque=1000, reanudar=True, devolver_df=True,
+                   conf=0.4, clases=None, cache=None, linea=None, max_edad_pista=1.5, cascada=None,
+                   modelo=None):
+    """
+    Cuenta vehículos en un video y guarda el conteo por frame.
+
+    `modo_salto` e `intervalo_ms` controlan cómo se descartan frames sin
+    decodificarlos (ver `iterar_frames`). Con un `filtro_movimiento`
+    (FiltroMovimiento) los frames sin cambios reutilizan el conteo anterior
+    en lugar de pasar por YOLO.
+
+    El conteo se escribe en streaming por bloques de `tam_bloque` filas con
+    un checkpoint tras cada bloque (ver `EscritorConteo`); con `reanudar=True`
+    una ejecución interrumpida continúa desde el último checkpoint. `formato`
+    puede ser 'csv', 'parquet' o 'bin'.
+
+    Con una `linea` (ContadorLinea) los vehículos se siguen entre frames
+    (ver src.seguimiento) y se añade la columna 'cruces_acumulados' con los
+    vehículos únicos que cruzaron la línea. Las pistas se extrapolan hasta
+    `max_edad_pista` segundos sin detección, así el conteo de cruces admite
+    valores de `salto_frames` mucho mayores que el conteo por frame.
+
+    Con una `cascada` (DetectorCascada) cada frame pasa primero por el modelo
+    pequeño y solo los dudosos por el principal (ver src.cascada).
+
+    `modelo` sustituye al YOLO configurado por cualquier detector con su misma
+    interfaz (`names` y `modelo(frame, conf=, classes=, verbose=)` devolviendo
+    resultados con `boxes.data`), p. ej. el detector determinista de
+    src.benchmark. No se combina con `cache`, cuya clave son los pesos.
+
+    `conf` y `clases` (por defecto vehicle_classes) solo afectan al conteo.
+    Con una `cache` (CacheResultados) se reutilizan las detecciones de una
+    ejecución previa del mismo video, modelo y muestreo: si solo cambian
+    `conf` o `clases`, el conteo se recalcula sin volver a pasar por YOLO.
+
+    Returns:
+    --------
+    DataFrame con el conteo (leído de la salida) si `devolver_df`; si no,
+    un dict resumen, de modo que la memoria no crece con la duración del video.
+    """
+    if modelo is not None and cache is not None:
+        raise ValueError("La caché de detecciones solo admite el modelo configurado")
+    model = obtener_modelo() if modelo is None else modelo
+    ids_clase = ids_vehiculo(model) if clases is None else ids_de_clases(model.names, clases)
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"No se encontró el video: {video_path}")
 
     if output_csv is None:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_csv = f"outputs/conteo_vehicular_yolo_{timestamp}.csv"
+        extension = {'csv': '.csv', 'parquet': '', 'bin': '.bin'}.get(formato, '')
+        output_csv = f"outputs/conteo_vehicular_yolo_{timestamp}{extension}"
+
+    parametros = {
+        'video': os.path.abspath(video_path), 'tamano': os.path.getsize(video_path),
+        'salto_frames': salto_frames, 'modo_salto': modo_salto, 'intervalo_ms': intervalo_ms,
+    }
+    if cascada is not None:
+        parametros['cascada'] = cascada.parametros()
+    columnas = COLUMNAS
+    seguidor = None
+    if linea is not None:
+        from src.seguimiento import Seguidor
+        columnas = COLUMNAS + (COLUMNA_CRUCES,)
+        parametros['linea'] = linea.a_lista()
+        seguidor = Seguidor(umbral_alto=max(conf, 0.5), umbral_bajo=conf, max_edad=max_edad_pista)
+    escritor = EscritorConteo(output_csv, formato, parametros, tam_bloque, reanudar, columnas)
+    if escritor.ultimo_frame:
+        print(f"↩️ Reanudando desde el frame {escritor.ultimo_frame}")
+        if linea is not None:
+            linea.total = escritor.ultimos_extra[0]
 
-    conteo = []
     cap = cv2.VideoCapture(video_path)
-    frame_num = 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    def escribir(frame_num, detecciones):
+        if seguidor is None:
+            escritor.escribir(frame_num, len(detecciones))
+            return
+        linea.actualizar(*seguidor.actualizar(detecciones, frame_num / fps))
+        escritor.escribir(frame_num, len(detecciones), linea.total)
 
-        frame_num += 1
-        if frame_num % salto_frames != 0:
-            continue
+    grabador = None
+    if cache is not None and not escritor.ultimo_frame:
+        from src.backends import preparar_backend
+        pesos = preparar_backend()
+        muestreo = {'salto_frames': salto_frames, 'modo_salto': modo_salto, 'intervalo_ms': intervalo_ms,
+                    'movimiento': None if filtro_movimiento is None else [
+                        filtro_movimiento.sensibilidad, filtro_movimiento.umbral_pixel,
+                        filtro_movimiento.ancho, filtro_movimiento.refresco_max]}
+        if cascada is not None:
+            muestreo['cascada'] = cascada.parametros()
+        entrada = cache.buscar(video_path, pesos, muestreo, conf)
+        if entrada is not None:
+            # Acierto: conteo recalculado desde las detecciones guardadas, sin decodificar ni inferir
+            if seguidor is None:
+                for frame_num, n in zip(entrada.frames.tolist(), entrada.contar(conf, ids_clase).tolist()):
+                    escritor.escribir(frame_num, n)
+            else:
+                for frame_num in entrada.frames.tolist():
+                    escribir(frame_num, entrada.detecciones(frame_num).filtrar_clases(ids_clase, conf))
+            escritor.cerrar()
+            print(f"♻️ Conteo recalculado desde la caché: {output_csv}")
+            return leer_conteo(output_csv, formato, columnas) if devolver_df else escritor.resumen()
+        grabador = cache.nuevo_registro(video_path, pesos, muestreo, model.names)
 
-        results = model(frame, conf=0.4, verbose=False)[0]  # Ajuste de umbral
-        num_vehiculos = 0
+    # Con caché se infieren todas las clases a la confianza base y se filtra después
+    conf_inferencia = min(conf, cache.conf_base) if grabador is not None else conf
+    clases_modelo = None if grabador is not None else ids_clase
+    todas = Detecciones.vacias(model.names)
+    num_vehiculos = escritor.ultimo_conteo
+    completo = True
+    fuente = os.path.basename(video_path)
+    frames = metricas.medir_iterador(
+        iterar_frames(video_path, salto_frames, intervalo_ms, modo_salto, frame_inicial=escritor.ultimo_frame),
+        'decodificacion', fuente)
+    for frame_num, frame in frames:
+        metricas.contar('frames', fuente)
+        if filtro_movimiento is not None and not filtro_movimiento.hay_cambio(frame, frame_num / fps):
+            # Escena estática: se reutiliza el conteo anterior sin inferir
+            metricas.contar('omitidos', fuente)
+            if grabador is not None:
+                grabador.agregar(frame_num, todas)
+            with metricas.etapa('escritura', fuente):
+                escritor.escribir(frame_num, num_vehiculos, *escritor.ultimos_extra)
+            continue
 
-        for box in results.boxes:
-            class_id = int(box.cls[0])
-            class_name = results.names[class_id]
-            conf = float(box.conf[0])
-            if class_name in vehicle_classes:
-                num_vehiculos += 1
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                label = f"{class_name} {conf:.2f}"
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(frame, label, (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+        # Sin caché, el filtro de clases se hace dentro del NMS de YOLO
+        with metricas.etapa('inferencia', fuente):
+            if cascada is not None:
+                results = cascada.inferir_lote([frame], [video_path], conf_inferencia, clases_modelo)[0]
+            else:
+                results = model(frame, conf=conf_inferencia, classes=clases_modelo, verbose=False)[0]
+        with metricas.etapa('postproceso', fuente):
+            todas = Detecciones.desde_resultado(results)
+            if grabador is not None:
+                grabador.agregar(frame_num, todas)
+            detecciones = todas.filtrar_clases(ids_clase, conf)
+            num_vehiculos = len(detecciones)
 
-        conteo.append({'frame': frame_num, 'vehiculos_detectados': num_vehiculos})
+        with metricas.etapa('escritura', fuente):
+            escribir(frame_num, detecciones)
 
         if visualizar:
-            cv2.imshow('Detección de Vehículos', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # Solo se dibuja si el frame se va a mostrar
+            with metricas.etapa('dibujo', fuente):
+                dibujar_detecciones(frame, detecciones)
+                cv2.imshow('Detección de Vehículos', frame)
+                tecla = cv2.waitKey(1) & 0xFF
+            if tecla == ord('q'):
+                completo = False
                 break
 
-    cap.release()
-    cv2.destroyAllWindows()
-    df = pd.DataFrame(conteo)
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    df.to_csv(output_csv, index=False)
+    if visualizar:
+        cv2.destroyAllWindows()
+    if filtro_movimiento is not None:
+        print(f"🟰 Frames sin inferencia por escena estática: {filtro_movimiento.fraccion_omitida():.1%}")
+    escritor.cerrar(completo)
+    if grabador is not None:
+        grabador.confirmar() if completo else grabador.descartar()
+    if cascada is not None:
+        stats = cascada.estadisticas()
+        print(f"🪜 Cascada: {stats['tasa_escalado']:.1%} de frames escalados {stats['motivos']}, "
+              f"desacuerdo medio {stats['desacuerdo_medio']:.3f}")
+    if linea is not None:
+        print(f"🚗 Cruces de la línea de conteo: {linea.total}")
     print(f"✅ Conteo guardado en: {output_csv}")
-    return df
+    if devolver_df:
+        return leer_conteo(output_csv, formato, columnas)
+    return escritor.resumen()
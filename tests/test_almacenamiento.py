@@ -0,0 +1,38 @@
+import time
+
+from src import almacenamiento
+from src.almacenamiento import AlmacenConteos
+
+
+def _esperar(condicion, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+
+
+def test_error_de_escritura_no_mata_al_escritor(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacenamiento, 'REINTENTOS_ESCRITURA', 1)
+    almacen = AlmacenConteos(str(tmp_path / "conteos.sqlite"), intervalo_flush=0.01)
+    # interseccion NOT NULL: el lote falla en SQLite
+    almacen.registrar(None, {'Norte': 1}, timestamp=1000)
+    _esperar(lambda: almacen.descartadas)
+    assert almacen.descartadas == 1
+    almacen.registrar("A", {'Norte': 2}, timestamp=2000)
+    almacen.cerrar(timeout=5)
+    assert not almacen.hilo.is_alive()
+    assert [fila[0] for fila in almacen.consultar()] == ["A"]
+
+
+def test_importacion_se_anota_al_terminar(tmp_path):
+    origen = tmp_path / "legado.csv"
+    origen.write_text("timestamp,Norte,Sur,Este,Oeste\n2024-01-01 10:00:00,1,2,3,4\n", encoding='utf-8')
+    almacen = AlmacenConteos(str(tmp_path / "conteos.sqlite"))
+    try:
+        assert not almacen.importado(str(origen))
+        assert almacen.importar_csv(str(origen), "legado") == 1
+        assert almacen.importado(str(origen))
+        # Repetirla no duplica filas
+        almacen.importar_csv(str(origen), "legado")
+        assert len(list(almacen.consultar("legado"))) == 1
+    finally:
+        almacen.cerrar()
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from src.aprendizaje import PredictorIncremental, entrenar_historico
+from src.almacenamiento import DIRECCIONES, FORMATO_TIMESTAMP
+
+INICIO = datetime(2024, 5, 6, 7, 0, 0)
+
+
+def test_entrenamiento_por_lotes_igual_que_en_vivo(tmp_path):
+    rng = np.random.default_rng(0)
+    momentos = [INICIO + timedelta(seconds=10 * i) for i in range(40)]
+    conteos = rng.integers(0, 12, (len(momentos), len(DIRECCIONES)))
+    ruta = tmp_path / "historico.csv"
+    lineas = ["timestamp," + ",".join(DIRECCIONES)]
+    lineas += [m.strftime(FORMATO_TIMESTAMP) + "," + ",".join(map(str, fila)) for m, fila in zip(momentos, conteos)]
+    ruta.write_text("\n".join(lineas) + "\n", encoding='utf-8')
+
+    lote = entrenar_historico(str(ruta), PredictorIncremental(min_muestras=5))
+    vivo = PredictorIncremental(min_muestras=5)
+    for momento, fila in zip(momentos, conteos):
+        vivo.actualizar(fila, momento)
+
+    # Misma convención de tiempo (hora local): seguir aprendiendo en vivo tras la instantánea no ve hueco
+    assert lote.t_ultimo == vivo.t_ultimo == momentos[-1].timestamp()
+    np.testing.assert_allclose(lote.x_ultimo, vivo.x_ultimo)
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.cache_resultados import CacheResultados
+from src.detecciones import Detecciones
+
+NOMBRES = {0: 'person', 2: 'car', 7: 'truck'}
+MUESTREO = {'salto_frames': 5}
+# frame -> detecciones [x1, y1, x2, y2, conf, clase]
+DETECCIONES = {
+    0: [[0, 0, 10, 10, 0.9, 2], [5, 5, 20, 20, 0.3, 2], [1, 1, 4, 4, 0.8, 0]],
+    5: [],
+    10: [[0, 0, 10, 10, 0.45, 7], [3, 3, 9, 9, 0.6, 2]],
+}
+
+
+@pytest.fixture
+def archivos(tmp_path):
+    rutas = {}
+    for nombre, contenido in (('video', b"video"), ('otro', b"otro video"), ('pesos', b"pesos")):
+        rutas[nombre] = tmp_path / nombre
+        rutas[nombre].write_bytes(contenido)
+    return {k: str(v) for k, v in rutas.items()}
+
+
+def _grabar(cache, video, pesos, muestreo=MUESTREO):
+    grabador = cache.nuevo_registro(video, pesos, muestreo, NOMBRES)
+    for frame, filas in DETECCIONES.items():
+        grabador.agregar(frame, Detecciones.desde_arreglo(np.array(filas, np.float32).reshape(-1, 6), NOMBRES))
+    grabador.confirmar()
+
+
+def test_fallo_y_acierto(tmp_path, archivos):
+    cache = CacheResultados(str(tmp_path / "cache"), conf_base=0.25)
+    assert cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.4) is None
+    _grabar(cache, archivos['video'], archivos['pesos'])
+    entrada = cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.4)
+    assert entrada is not None
+    assert (cache.aciertos, cache.fallos) == (1, 1)
+    assert entrada.frames.tolist() == [0, 5, 10]
+    assert len(entrada.detecciones(10)) == 2
+    # Otro video, otro muestreo o un umbral bajo conf_base no aciertan
+    assert cache.buscar(archivos['otro'], archivos['pesos'], MUESTREO, 0.4) is None
+    assert cache.buscar(archivos['video'], archivos['pesos'], {'salto_frames': 10}, 0.4) is None
+    assert cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.1) is None
+
+
+def test_recuento_con_otro_umbral_y_clases(tmp_path, archivos):
+    cache = CacheResultados(str(tmp_path / "cache"), conf_base=0.25)
+    _grabar(cache, archivos['video'], archivos['pesos'])
+    entrada = cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.25)
+    assert entrada.contar(0.25, [2, 7]).tolist() == [2, 0, 2]
+    assert entrada.contar(0.5, [2, 7]).tolist() == [1, 0, 1]
+    assert entrada.contar(0.5, [2]).tolist() == [1, 0, 1]
+    assert entrada.contar(0.4, [7]).tolist() == [0, 0, 1]
+    # Mismo resultado que filtrar las detecciones originales
+    for conf in (0.3, 0.5, 0.7):
+        esperado = [sum(1 for fila in filas if fila[4] >= conf and fila[5] in (2, 7)) for filas in DETECCIONES.values()]
+        assert entrada.contar(conf, [2, 7]).tolist() == esperado
+
+
+def test_desaloja_la_menos_usada(tmp_path, archivos):
+    cache = CacheResultados(str(tmp_path / "cache"), conf_base=0.25)
+    _grabar(cache, archivos['video'], archivos['pesos'])
+    time.sleep(0.01)
+    _grabar(cache, archivos['otro'], archivos['pesos'])
+    time.sleep(0.01)
+    # Usar la primera la hace la más reciente: al llenarse se va la segunda
+    assert cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.4) is not None
+    # Caben justo las dos entradas que hay
+    conexion = cache._conectar()
+    cache.max_bytes = conexion.execute("SELECT SUM(bytes) FROM entradas").fetchone()[0]
+    conexion.close()
+    time.sleep(0.01)
+    _grabar(cache, archivos['video'], archivos['pesos'], {'salto_frames': 10})
+    assert cache.buscar(archivos['otro'], archivos['pesos'], MUESTREO, 0.4) is None
+    assert cache.buscar(archivos['video'], archivos['pesos'], MUESTREO, 0.4) is not None
+    assert cache.buscar(archivos['video'], archivos['pesos'], {'salto_frames': 10}, 0.4) is not None
+    assert cache.informe()['entradas'] == 2
@@ -0,0 +1,41 @@
+import threading
+
+import numpy as np
+
+from src.inferencia_lotes import ServicioInferencia
+
+
+class _ModeloBloqueante:
+    """Modelo falso: el primer lote espera a `soltar`; devuelve el tamaño del lote por frame"""
+
+    def __init__(self):
+        self.dentro = threading.Event()
+        self.soltar = threading.Event()
+        self.lotes = 0
+
+    def __call__(self, frames, **opciones):
+        self.lotes += 1
+        if self.lotes == 1:
+            self.dentro.set()
+            self.soltar.wait(5)
+        return [len(frames)] * len(frames)
+
+
+def test_reinicio_no_deja_dos_bucles():
+    modelo = _ModeloBloqueante()
+    servicio = ServicioInferencia(modelo=modelo, clases=[2], max_espera=0.0)
+    servicio.registrar('Norte')
+    frame = np.zeros((8, 8, 3), np.uint8)
+    primero = threading.Thread(target=servicio.inferir, args=('Norte', frame), daemon=True)
+    primero.start()
+    assert modelo.dentro.wait(5)
+
+    anterior = servicio.hilo
+    servicio.detener()  # el bucle anterior sigue dentro del modelo tras el join(timeout)
+    servicio.iniciar()
+    modelo.soltar.set()
+    primero.join(5)
+    anterior.join(5)
+    assert not anterior.is_alive()
+    assert servicio.inferir('Norte', frame) == 1
+    servicio.detener()
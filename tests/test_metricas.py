@@ -0,0 +1,37 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.metricas import Contador, Histograma
+
+
+@pytest.mark.parametrize('q', [0.5, 0.95])
+@pytest.mark.parametrize('distribucion', ['lognormal', 'uniforme'])
+def test_cuantiles_cerca_de_numpy(q, distribucion):
+    rng = np.random.default_rng(0)
+    if distribucion == 'lognormal':
+        muestras = rng.lognormal(np.log(0.02), 0.8, 20000)
+    else:
+        muestras = rng.uniform(0.001, 0.2, 20000)
+    histograma = Histograma()
+    for segundos in muestras:
+        histograma.observar(float(segundos))
+    assert histograma.cuantil(q) == pytest.approx(np.percentile(muestras, q * 100), rel=0.1)
+
+
+def test_cuantil_no_supera_el_maximo():
+    histograma = Histograma()
+    for _ in range(10):
+        histograma.observar(0.0123)
+    assert histograma.cuantil(0.99) <= 0.0123
+
+
+def test_contador_concurrente_no_pierde_sumas():
+    contador = Contador()
+    hilos = [threading.Thread(target=lambda: [contador.sumar() for _ in range(20000)]) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert contador.total == 8 * 20000
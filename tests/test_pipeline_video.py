@@ -0,0 +1,49 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from src.pipeline_video import PipelineVideo
+
+
+@pytest.fixture
+def video(tmp_path):
+    ruta = str(tmp_path / "corto.avi")
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*'MJPG'), 200, (32, 24))
+    for i in range(20):
+        escritor.write(np.full((24, 32, 3), i * 10, np.uint8))
+    escritor.release()
+    return ruta
+
+
+def _esperar(pipeline, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while any(h.is_alive() for h in pipeline.hilos) and time.monotonic() < limite:
+        time.sleep(0.01)
+
+
+def test_error_de_inferencia_no_detiene_la_etapa(video):
+    llamadas = []
+
+    def inferir(frame):
+        llamadas.append(1)
+        if len(llamadas) % 2:
+            raise ValueError("ROI fuera del frame")
+        return len(llamadas)
+
+    pipeline = PipelineVideo(video, inferir, lambda *args: None)
+    pipeline.iniciar()
+    _esperar(pipeline)
+    pipeline.detener()
+    estadisticas = pipeline.estadisticas()
+    assert estadisticas['errores_inferencia'] >= 1
+    assert estadisticas['inferidos'] >= 1
+
+
+def test_detener_con_la_captura_terminada(video):
+    pipeline = PipelineVideo(video, lambda frame: None, lambda *args: None)
+    pipeline.iniciar()
+    _esperar(pipeline)
+    pipeline.detener()
+    assert pipeline.cap is None and not pipeline.hilos
@@ -0,0 +1,72 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from src.prediccion_AI import DIRECCIONES, PredictorIntersecciones, TrafficPredictor
+
+INICIO = datetime(2024, 5, 6, 8, 0, 0)
+CONTEOS = {'Norte': 5, 'Sur': 3, 'Este': 2, 'Oeste': 1}
+
+
+def _flujos(n):
+    return {'Norte': n, 'Sur': 0, 'Este': 0, 'Oeste': 0}
+
+
+def test_tic_algo_corto_no_pierde_la_muestra():
+    predictor = TrafficPredictor()
+    predictor.predict_green_times(CONTEOS, _flujos(4), timestamp=INICIO)
+    predictor.predict_green_times(CONTEOS, _flujos(6), timestamp=INICIO + timedelta(seconds=9.99))
+    assert predictor.historical_counts['Norte'][-2:] == (4, 6)
+
+
+def test_cruces_de_una_muestra_rechazada_pasan_a_la_siguiente():
+    predictor = TrafficPredictor()
+    predictor.predict_green_times(CONTEOS, _flujos(4), timestamp=INICIO)
+    predictor.predict_green_times(CONTEOS, _flujos(3), timestamp=INICIO + timedelta(seconds=5))
+    predictor.predict_green_times(CONTEOS, _flujos(2), timestamp=INICIO + timedelta(seconds=10))
+    historial = predictor.historical_counts['Norte']
+    assert historial[-2:] == (4, 5)
+    # Total de cruces entregados == total guardado en el histórico
+    assert sum(historial) == 4 + 3 + 2
+
+
+class _PrediccionPorDireccion:
+    """Regla original de TrafficPredictor, dirección a dirección (referencia del cálculo vectorizado)"""
+
+    def __init__(self, min_verde=20, max_verde=90, min_giro=15, max_giro=30):
+        self.historial = {d: deque(maxlen=6) for d in DIRECCIONES}
+        self.limites = min_verde, max_verde, min_giro, max_giro
+
+    def predecir(self, conteos):
+        min_verde, max_verde, min_giro, max_giro = self.limites
+        for direccion, conteo in conteos.items():
+            self.historial[direccion].append(conteo)
+        flujo = {d: int(sum(c) / len(c) * 360) if c else 0 for d, c in self.historial.items()}
+        ns, eo = flujo['Norte'] + flujo['Sur'], flujo['Este'] + flujo['Oeste']
+        if ns + eo == 0:
+            return [min_verde, min_verde], [min_giro, min_giro]
+        verde = [float(np.clip(min_verde + (max_verde - min_verde) * eje / (ns + eo), min_verde, max_verde))
+                 for eje in (ns, eo)]
+        giro = [float(np.clip(min_giro + (max_giro - min_giro) * (conteos[a] + conteos[b]) / 30, min_giro, max_giro))
+                for a, b in (('Norte', 'Sur'), ('Este', 'Oeste'))]
+        return verde, giro
+
+
+def test_vectorizado_igual_que_por_direccion():
+    rng = np.random.default_rng(0)
+    limites = [(20, 90, 15, 30), (10, 60, 5, 20), (30, 120, 15, 45)]
+    lote = PredictorIntersecciones(len(limites), min_verde=np.array([l[0] for l in limites]),
+                                   max_verde=np.array([l[1] for l in limites]),
+                                   min_giro=np.array([l[2] for l in limites]),
+                                   max_giro=np.array([l[3] for l in limites]))
+    referencias = [_PrediccionPorDireccion(*l) for l in limites]
+    for tic in range(40):
+        # Algunos tics sin tráfico para pasar por la rama de mínimos
+        conteos = rng.integers(0, 25, (len(limites), len(DIRECCIONES))) * (tic % 9 != 0)
+        verde, giro = lote.paso(conteos, tic * 10.0)
+        for i, referencia in enumerate(referencias):
+            verde_ref, giro_ref = referencia.predecir(dict(zip(DIRECCIONES, conteos[i].tolist())))
+            np.testing.assert_allclose(verde[i], verde_ref)
+            np.testing.assert_allclose(giro[i], giro_ref)
+            assert lote.flujos()[i].tolist() == [int(sum(c) / len(c) * 360) for c in referencia.historial.values()]
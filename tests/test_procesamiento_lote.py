@@ -0,0 +1,28 @@
+import pytest
+
+from src import procesamiento_lote, vision_vehicular
+from src.movimiento import FiltroMovimiento
+
+
+@pytest.fixture
+def opciones_recibidas(monkeypatch, tmp_path):
+    # Sin visotraf_config.json en el directorio: configuración por defecto (movimiento desactivado)
+    monkeypatch.chdir(tmp_path)
+    recibidas = {}
+
+    def procesar_video(video, output_csv, **opciones):
+        recibidas.update(opciones)
+        open(output_csv, 'w').close()
+        return {'frames_procesados': 0}
+    monkeypatch.setattr(vision_vehicular, 'procesar_video', procesar_video)
+    return recibidas
+
+
+def test_opcion_movimiento_crea_filtro(opciones_recibidas, tmp_path):
+    procesamiento_lote._procesar_uno(str(tmp_path / "a.mp4"), str(tmp_path), {'movimiento': True})
+    assert isinstance(opciones_recibidas['filtro_movimiento'], FiltroMovimiento)
+
+
+def test_sin_opcion_movimiento_no_hay_filtro(opciones_recibidas, tmp_path):
+    procesamiento_lote._procesar_uno(str(tmp_path / "a.mp4"), str(tmp_path), {'movimiento': False})
+    assert 'filtro_movimiento' not in opciones_recibidas
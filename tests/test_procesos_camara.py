@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from src.procesos_camara import CONTEO, CRUCES, AnilloFrames
+
+
+@pytest.fixture
+def anillo():
+    anillo = AnilloFrames(ranuras=3, alto=4, ancho=6, max_detecciones=5)
+    yield anillo
+    anillo.cerrar()
+
+
+def _publicar(anillo, valor, forma=(4, 6), detecciones=None, conteo=0, cruces=-1):
+    anillo.trasero(forma)[:] = valor
+    datos = np.zeros((0, 6), np.float32) if detecciones is None else detecciones
+    anillo.escribir_detecciones(datos, conteo, cruces)
+    anillo.publicar(forma)
+
+
+def test_segunda_instancia_se_adjunta_por_nombre(anillo):
+    _publicar(anillo, 7, conteo=3, cruces=2)
+    lector = AnilloFrames(**anillo.parametros())
+    try:
+        assert not lector.creado
+        assert lector.secuencia == 1
+        cabecera = lector.ultima_cabecera()
+        assert (cabecera[CONTEO], cabecera[CRUCES]) == (3, 2)
+        with lector.leer() as (imagen, secuencia):
+            assert secuencia == 1
+            assert imagen.shape == (4, 6, 3) and (imagen == 7).all()
+        # Lo que escribe una instancia lo ve la otra
+        lector.control[0] = 1.5
+        assert anillo.control[0] == 1.5
+    finally:
+        lector.cerrar()
+
+
+def test_vuelta_completa_del_anillo(anillo):
+    for valor in range(1, 3 * anillo.ranuras + 2):
+        _publicar(anillo, valor, forma=(2, 3))
+        with anillo.leer() as (imagen, secuencia):
+            assert secuencia == valor
+            assert imagen.shape == (2, 3, 3) and (imagen == valor).all()
+    assert anillo.rasgadas == 0
+
+
+def test_sin_publicar_o_en_escritura_no_hay_imagen():
+    anillo = AnilloFrames(ranuras=1, alto=4, ancho=6)
+    try:
+        with anillo.leer() as (imagen, secuencia):
+            assert imagen is None and secuencia == 0
+        _publicar(anillo, 1)
+        # Con una sola ranura el escritor vuelve a la última publicada: secuencia impar
+        anillo.trasero((4, 6))
+        with anillo.leer() as (imagen, secuencia):
+            assert imagen is None and secuencia == 1
+    finally:
+        anillo.cerrar()
+
+
+def _pisar_durante_la_copia(anillo, monkeypatch, veces):
+    # El escritor publica otra imagen mientras el lector copia la ranura
+    copiar = anillo._copiar
+    pisadas = []
+
+    def copiar_pisando(ranura, n, destino):
+        copiar(ranura, n, destino)
+        if len(pisadas) < veces:
+            pisadas.append(1)
+            _publicar(anillo, 100 + len(pisadas))
+            destino[:n] = 255  # lo copiado quedó a medias
+    monkeypatch.setattr(anillo, '_copiar', copiar_pisando)
+
+
+def test_lectura_pisada_se_reintenta(monkeypatch):
+    anillo = AnilloFrames(ranuras=1, alto=4, ancho=6)
+    try:
+        _publicar(anillo, 1)
+        _pisar_durante_la_copia(anillo, monkeypatch, veces=1)
+        with anillo.leer() as (imagen, secuencia):
+            assert secuencia == 2 and (imagen == 101).all()
+        assert anillo.rasgadas == 1
+    finally:
+        anillo.cerrar()
+
+
+def test_lectura_siempre_pisada_entrega_la_ultima_buena(monkeypatch):
+    anillo = AnilloFrames(ranuras=1, alto=4, ancho=6)
+    try:
+        _publicar(anillo, 1)
+        with anillo.leer() as (imagen, secuencia):
+            assert secuencia == 1
+        _publicar(anillo, 2)
+        _pisar_durante_la_copia(anillo, monkeypatch, veces=10)
+        with anillo.leer(reintentos=2) as (imagen, secuencia):
+            assert secuencia == 1 and (imagen == 1).all()
+        assert anillo.rasgadas == 3
+    finally:
+        anillo.cerrar()
+
+
+def test_detecciones_truncadas_a_max_detecciones(anillo):
+    datos = np.arange(8 * 6, dtype=np.float32).reshape(8, 6)
+    _publicar(anillo, 0, detecciones=datos, conteo=8)
+    ultimas = anillo.ultimas_detecciones()
+    assert ultimas.shape == (anillo.max_detecciones, 6)
+    np.testing.assert_array_equal(ultimas, datos[:anillo.max_detecciones])
+    assert anillo.ultima_cabecera()[CONTEO] == 8
+
+
+def test_imagen_mayor_que_el_anillo(anillo):
+    with pytest.raises(ValueError):
+        anillo.trasero((5, 6))
@@ -0,0 +1,60 @@
+import copy
+import time
+from datetime import datetime
+
+import numpy as np
+
+from src.configuracion import CONFIG_POR_DEFECTO
+from src.prediccion_AI import DIRECCIONES, TrafficPredictor
+from src.repeticion import cargar_historico, guardar_plan, reproducir
+
+INICIO = datetime(2024, 5, 6, 7, 0, 0).timestamp()
+
+
+def _historico(n=30, semilla=0):
+    rng = np.random.default_rng(semilla)
+    # Ticks de ~10 s con algo de jitter, como los del dashboard
+    ts = INICIO + np.cumsum(rng.uniform(9.7, 10.3, n))
+    return ts, rng.integers(0, 15, (n, len(DIRECCIONES))).astype(np.float32)
+
+
+def test_repeticion_igual_que_el_predictor_en_vivo():
+    ts, conteos = _historico()
+    config = copy.deepcopy(CONFIG_POR_DEFECTO)
+    plan = reproducir(ts, conteos, {'MIN_GREEN': 25}, config=config)
+
+    predictor = TrafficPredictor()
+    predictor.MIN_GREEN = 25
+    for i, (t, fila) in enumerate(zip(ts.tolist(), conteos.tolist())):
+        predicciones, ciclo = predictor.predict_green_times(dict(zip(DIRECCIONES, fila)),
+                                                            timestamp=datetime.fromtimestamp(t))
+        assert plan['verde'][i].tolist() == [predicciones['main']['ns'], predicciones['main']['eo']]
+        assert plan['giro'][i].tolist() == [predicciones['turn']['ns'], predicciones['turn']['eo']]
+        assert plan['ciclo'][i] == sum(fase['duration'] for fase in ciclo)
+
+
+def test_modo_optimo_usa_la_configuracion():
+    ts, conteos = _historico()
+    config = copy.deepcopy(CONFIG_POR_DEFECTO)
+    config['prediccion'].update(modo='optimo', paso_optimo=5, carriles=[1, 1, 3, 3])
+    plan = reproducir(ts, conteos, config=config)
+    # Verdes en la rejilla de paso_optimo
+    assert np.allclose(plan['verde'] % 5, 0)
+    config['prediccion']['carriles'] = [3, 3, 1, 1]
+    assert not np.array_equal(plan['verde'], reproducir(ts, conteos, config=config)['verde'])
+
+
+def test_timestamps_en_hora_local_como_en_vivo(tmp_path, monkeypatch):
+    monkeypatch.setenv('TZ', 'America/Bogota')
+    time.tzset()
+    try:
+        ruta = tmp_path / "historico.csv"
+        ruta.write_text("timestamp,Norte,Sur,Este,Oeste\n2024-05-06 07:00:00,1,2,3,4\n", encoding='utf-8')
+        ts, conteos = cargar_historico(str(ruta))
+        assert ts.tolist() == [datetime(2024, 5, 6, 7, 0, 0).timestamp()]
+        plan = reproducir(ts, conteos, config=copy.deepcopy(CONFIG_POR_DEFECTO))
+        guardar_plan(str(tmp_path / "plan.csv"), plan)
+        assert "2024-05-06 07:00:00" in (tmp_path / "plan.csv").read_text(encoding='utf-8')
+    finally:
+        monkeypatch.undo()
+        time.tzset()
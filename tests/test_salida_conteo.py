@@ -0,0 +1,75 @@
+import csv
+import os
+
+import pytest
+
+from src.salida_conteo import COLUMNA_CRUCES, COLUMNAS, EscritorConteo, leer_conteo, ruta_checkpoint
+
+PARAMETROS = {'video': "a.mp4", 'salto_frames': 5}
+
+
+def _filas_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8') as f:
+        return [tuple(int(v) for v in fila) for fila in list(csv.reader(f))[1:]]
+
+
+def _escribir(escritor, frames):
+    for frame in frames:
+        escritor.escribir(frame, frame % 7)
+
+
+def test_reanuda_desde_el_checkpoint_sin_duplicar(tmp_path):
+    ruta = str(tmp_path / "salida.csv")
+    escritor = EscritorConteo(ruta, parametros=PARAMETROS, tam_bloque=10)
+    _escribir(escritor, range(25))
+    # Caída: las 5 filas del bloque a medias no llegaron al checkpoint; además quedó
+    # basura escrita después del último checkpoint
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write("20,6\n21,")
+
+    reanudado = EscritorConteo(ruta, parametros=PARAMETROS, tam_bloque=10)
+    assert (reanudado.ultimo_frame, reanudado.filas) == (19, 20)
+    _escribir(reanudado, range(20, 30))
+    reanudado.cerrar()
+
+    assert _filas_csv(ruta) == [(frame, frame % 7) for frame in range(30)]
+    assert not os.path.exists(ruta_checkpoint(ruta))
+    assert reanudado.resumen()['frames_procesados'] == 30
+    assert reanudado.resumen()['total_vehiculos'] == sum(frame % 7 for frame in range(30))
+
+
+def test_checkpoint_de_otros_parametros_empieza_de_cero(tmp_path):
+    ruta = str(tmp_path / "salida.csv")
+    escritor = EscritorConteo(ruta, parametros=PARAMETROS, tam_bloque=10)
+    _escribir(escritor, range(15))
+
+    otro = EscritorConteo(ruta, parametros=dict(PARAMETROS, salto_frames=10), tam_bloque=10)
+    assert (otro.ultimo_frame, otro.filas) == (0, 0)
+    otro.cerrar()
+    assert _filas_csv(ruta) == []
+
+
+def test_sin_reanudar_empieza_de_cero(tmp_path):
+    ruta = str(tmp_path / "salida.csv")
+    _escribir(EscritorConteo(ruta, parametros=PARAMETROS, tam_bloque=10), range(15))
+    escritor = EscritorConteo(ruta, parametros=PARAMETROS, tam_bloque=10, reanudar=False)
+    assert escritor.filas == 0
+
+
+def test_binario_con_cruces_reanuda(tmp_path):
+    pytest.importorskip("pandas")
+    ruta = str(tmp_path / "salida.bin")
+    columnas = COLUMNAS + (COLUMNA_CRUCES,)
+    escritor = EscritorConteo(ruta, 'bin', PARAMETROS, tam_bloque=4, columnas=columnas)
+    for frame in range(10):
+        escritor.escribir(frame, 1, frame // 3)
+
+    reanudado = EscritorConteo(ruta, 'bin', PARAMETROS, tam_bloque=4, columnas=columnas)
+    assert reanudado.ultimos_extra == [7 // 3]
+    for frame in range(8, 12):
+        reanudado.escribir(frame, 1, frame // 3)
+    reanudado.cerrar()
+
+    df = leer_conteo(ruta, 'bin', columnas)
+    assert df['frame'].tolist() == list(range(12))
+    assert reanudado.resumen()[COLUMNA_CRUCES] == 11 // 3
@@ -0,0 +1,64 @@
+import numpy as np
+
+from src.detecciones import Detecciones
+from src.seguimiento import ContadorLinea, Seguidor
+
+NOMBRES = {2: 'car'}
+
+
+def _detecciones(*cajas, conf=0.9):
+    datos = [[x1, y1, x2, y2, conf, 2] for x1, y1, x2, y2 in cajas]
+    return Detecciones.desde_arreglo(np.array(datos, dtype=np.float32).reshape(-1, 6), NOMBRES)
+
+
+def _recorrido(y_inicio, y_fin, paso=10, x=100, lado=40):
+    # Caja que avanza en vertical: su punto de apoyo (centro inferior) va de y_inicio a y_fin
+    return [(x - lado / 2, y - lado, x + lado / 2, y) for y in range(y_inicio, y_fin + paso, paso)]
+
+
+def _contar(recorrido, linea, ocultos=(), seguidor=None):
+    seguidor = seguidor or Seguidor()
+    ids_vistos = set()
+    for t, caja in enumerate(recorrido):
+        detecciones = _detecciones() if t in ocultos else _detecciones(caja)
+        ids, xyxy = seguidor.actualizar(detecciones, t)
+        ids_vistos.update(ids.tolist())
+        linea.actualizar(ids, xyxy)
+    return linea.total, ids_vistos
+
+
+def test_un_cruce_cuenta_una_vez():
+    linea = ContadorLinea((0, 100), (200, 100))
+    total, ids = _contar(_recorrido(40, 160), linea)
+    assert total == 1
+    assert len(ids) == 1
+
+
+def test_oclusion_dentro_de_max_edad_no_duplica():
+    # El vehículo desaparece justo al cruzar y reaparece al otro lado con la misma pista
+    linea = ContadorLinea((0, 100), (200, 100))
+    total, ids = _contar(_recorrido(40, 200), linea, ocultos=range(5, 9), seguidor=Seguidor(max_edad=30))
+    assert total == 1
+    assert len(ids) == 1
+
+
+def test_vaiven_sobre_la_linea_no_duplica():
+    linea = ContadorLinea((0, 100), (200, 100))
+    recorrido = _recorrido(60, 100) + [(80, 72, 120, 112), (80, 56, 120, 96), (80, 72, 120, 112)] + _recorrido(120, 160)
+    total, _ = _contar(recorrido, linea)
+    assert total == 1
+
+
+def test_sentido_respetado():
+    # Hacia abajo el punto pasa del lado negativo al positivo de p1-p2
+    bajando = _recorrido(40, 160)
+    subiendo = bajando[::-1]
+    assert _contar(bajando, ContadorLinea((0, 100), (200, 100), sentido=1))[0] == 1
+    assert _contar(bajando, ContadorLinea((0, 100), (200, 100), sentido=-1))[0] == 0
+    assert _contar(subiendo, ContadorLinea((0, 100), (200, 100), sentido=-1))[0] == 1
+    assert _contar(subiendo, ContadorLinea((0, 100), (200, 100), sentido=1))[0] == 0
+
+
+def test_cruce_fuera_del_segmento_no_cuenta():
+    linea = ContadorLinea((300, 100), (500, 100))
+    assert _contar(_recorrido(40, 160), linea)[0] == 0